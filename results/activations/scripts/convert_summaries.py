@@ -0,0 +1,55 @@
+import argparse
+import sys
+from pathlib import Path
+
+from animacy.activations import SummaryStore, convert_json_summaries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Convert a directory of JSON activation summaries into a SummaryStore."
+        )
+    )
+    parser.add_argument(
+        "--summaries_dir",
+        type=str,
+        required=True,
+        help="Directory of {role}_{task}_{sample_idx}_layer{layer}.json files.",
+    )
+    parser.add_argument(
+        "--store_dir",
+        type=str,
+        required=True,
+        help="Directory of the SummaryStore to create or extend.",
+    )
+    parser.add_argument(
+        "--condition",
+        type=str,
+        default="with_sys",
+        help="Condition label for the converted summaries. Default: with_sys.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=1024,
+        help="Number of files appended per commit. Default: 1024.",
+    )
+
+    args = parser.parse_args()
+
+    summaries_dir = Path(args.summaries_dir)
+    if not summaries_dir.exists():
+        print(f"Error: Summaries directory {summaries_dir} does not exist.")
+        sys.exit(1)
+
+    store = SummaryStore(args.store_dir)
+    print(f"Converting {summaries_dir} into {args.store_dir}...")
+    converted = convert_json_summaries(
+        summaries_dir, store, condition=args.condition, chunk_size=args.chunk_size
+    )
+    print(f"Converted {converted} summaries ({len(store)} in store).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import argparse
 import json
-import pickle
 import sys
 from pathlib import Path
 from typing import Any
@@ -13,8 +12,14 @@ except ImportError:
 import torch
 from tqdm import tqdm
 
-from animacy.activations import ActivationExtractor, extract_activation_summaries
+from animacy.activations import (
+    ActivationArchive,
+    ActivationExtractor,
+    SummaryStore,
+    extract_activation_summaries_batch,
+)
 from animacy.prompts import construct_chat_history
+from animacy.storage import CompletionManifest
 
 
 def load_config(config_path: Path) -> dict[str, Any]:
@@ -27,10 +32,14 @@ def process_file(
     file_path: Path,
     config: dict[str, Any],
     extractor: ActivationExtractor,
-    output_dir: Path,
-    existing_trials: set[str],
+    store: SummaryStore,
+    manifest: CompletionManifest,
     layers: list[int] | None = None,
     use_system_prompt: bool = True,
+    batch_size: int = 8,
+    max_batch_tokens: int | None = None,
+    chunk_size: int = 64,
+    archive: ActivationArchive | None = None,
 ) -> None:
     """
     Process a single JSON file containing responses.
@@ -39,93 +48,126 @@ def process_file(
         file_path: Path to the JSON file.
         config: Configuration dictionary.
         extractor: Initialized ActivationExtractor.
-        output_dir: Directory to save outputs.
-        existing_trials: Set of existing filename stems (role_task_sample_layer).
+        store: SummaryStore the summaries are appended to.
+        manifest: Completion manifest of (role, task, sample_idx, condition, layer) keys.
         layers: List of layers to extract.
+        use_system_prompt: Whether to include the role-assigning system prompt.
+        batch_size: Maximum number of texts per forward pass.
+        max_batch_tokens: Optional padded-token budget per forward pass.
+        chunk_size: Number of items handed to the extractor at once. Bounds the
+            size of the CPU activation buffers.
+        archive: Optional archive for full per-token activations of its layers.
+            Items missing from the archive are re-run even if their summaries
+            are complete.
     """
     with open(file_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    # Create subdirectories for summaries
-    summaries_dir = output_dir / "summaries"
-    summaries_dir.mkdir(parents=True, exist_ok=True)
-
-    # Create subdirectories for raw activations if desired, or keep flat
-    # activations_dir = output_dir / "activations"
-    # activations_dir.mkdir(parents=True, exist_ok=True)
-
-    for item in tqdm(data, desc=f"Processing {file_path.name}"):
-        role_name = item["role_name"]
-        task_name = item["task_name"]
-        sample_idx = item["sample_idx"]
-
-        # Determine which layers need to be processed
-        target_layers = layers if layers is not None else range(len(extractor._layers))
-
-        # Check against existing filename stems
-        # Format: {role_name}_{task_name}_{sample_idx}_layer{layer_idx}
-        needed_layers = []
-        for l in target_layers:
-            stem = f"{role_name}_{task_name}_{sample_idx}_layer{l}"
-            if stem not in existing_trials:
-                needed_layers.append(l)
-
-        if not needed_layers:
-            continue
-
-        chat_history = construct_chat_history(
-            item, config, use_system_prompt=use_system_prompt
-        )
+    condition = "with_sys" if use_system_prompt else "no_sys"
+
+    # Determine which layers need to be processed
+    target_layers = layers if layers is not None else range(len(extractor._layers))
+
+    # Group pending items by the set of layers they still need, so each group
+    # can be extracted in batched forward passes
+    pending = manifest.remaining(
+        data,
+        target_layers,
+        key_fn=lambda item, l: (
+            item["role_name"],
+            item["task_name"],
+            item["sample_idx"],
+            condition,
+            l,
+        ),
+    )
 
-        # Extract activations
-        # We process one item at a time here to manage memory for large models/activations
-        # In a more optimized version, we could batch these.
+    if archive is not None:
+        archived = archive.completed()
+        planned = {id(item) for items in pending.values() for item in items}
+        unarchived = [
+            item
+            for item in data
+            if id(item) not in planned
+            and (item["role_name"], item["task_name"], item["sample_idx"], condition)
+            not in archived
+        ]
+        if unarchived:
+            pending.setdefault((), []).extend(unarchived)
+
+    chunks = [
+        (needed_layers, items[i : i + chunk_size])
+        for needed_layers, items in pending.items()
+        for i in range(0, len(items), chunk_size)
+    ]
+
+    for needed_layers, chunk in tqdm(chunks, desc=f"Processing {file_path.name}"):
+        chat_histories = [
+            construct_chat_history(item, config, use_system_prompt=use_system_prompt)
+            for item in chunk
+        ]
+
+        # Extract pooled summaries
+        # The extractor length-sorts the chunk, runs it in micro-batches and
+        # averages each summary span on the device inside the layer hooks
         try:
-            # Only extract for needed layers
-            result = extractor.extract([chat_history], layers=needed_layers)
-        except Exception as e:
-            print(f"Error extracting for {role_name} - {task_name} - {sample_idx}: {e}")
-            continue
-
-        # Iterate through layers and save results
-        # The result object will only contain the requested layers
-        extracted_layers = result.activations.keys()
-
-        for layer_idx in extracted_layers:
-            # 1. Save raw activations and token IDs
-            # Shape: (seq_len, hidden_size)
-            # We take index 0 because we processed a batch of size 1
-            # activations_tensor = result.activations[layer_idx][0]
-            # input_ids = result.input_ids[0]
-
-            # Save as pickle
-            # raw_filename = f"{role_name}_{task_name}_{sample_idx}_layer{layer_idx}.pkl"
-            # raw_path = activations_dir / raw_filename
-
-            # with open(raw_path, "wb") as f:
-            #     pickle.dump(
-            #         {"activations": activations_tensor, "input_ids": input_ids}, f
-            #     )
-
-            # 2. Extract and save summaries
-            try:
-                summary = extract_activation_summaries(
-                    result, role_name=role_name, layer=layer_idx, text_index=0
+            if archive is None:
+                # Only extract for needed layers
+                summaries = extractor.extract_summaries(
+                    chat_histories,
+                    role_names=[item["role_name"] for item in chunk],
+                    layers=list(needed_layers),
+                    batch_size=batch_size,
+                    max_batch_tokens=max_batch_tokens,
                 )
-
-                summary_filename = (
-                    f"{role_name}_{task_name}_{sample_idx}_layer{layer_idx}.json"
+            else:
+                # Keep full activations so the archive layers can be written out
+                result = extractor.extract(
+                    chat_histories,
+                    layers=sorted(set(needed_layers) | set(archive.layers)),
+                    batch_size=batch_size,
+                    max_batch_tokens=max_batch_tokens,
                 )
-                summary_path = summaries_dir / summary_filename
+                to_archive = [
+                    i
+                    for i, item in enumerate(chunk)
+                    if (
+                        item["role_name"],
+                        item["task_name"],
+                        item["sample_idx"],
+                        condition,
+                    )
+                    not in archived
+                ]
+                archive.append(
+                    result,
+                    [chunk[i] for i in to_archive],
+                    condition=condition,
+                    text_indices=to_archive,
+                )
+                if needed_layers:
+                    summaries = extract_activation_summaries_batch(
+                        result,
+                        role_names=[item["role_name"] for item in chunk],
+                        layers=list(needed_layers),
+                    )
+        except Exception as e:
+            print(f"Error extracting batch of {len(chunk)} from {file_path.name}: {e}")
+            continue
 
-                # Save as JSON (using Pydantic's json() or model_dump_json())
-                with open(summary_path, "w", encoding="utf-8") as f:
-                    f.write(summary.model_dump_json(indent=2))
+        if not needed_layers:
+            continue
 
-            except Exception as e:
-                print(
-                    f"Error creating summary for {role_name} - {task_name} - {sample_idx} layer {layer_idx}: {e}"
-                )
+        # Append the whole chunk to the store, then mark it complete. A crash
+        # between the two leaves rows the manifest does not list; they are
+        # recomputed and appended again on resume, and SummaryStore.index keeps
+        # only the last entry per (key, layer), so the duplicates are harmless.
+        store.append(summaries, chunk, condition=condition)
+        manifest.commit(
+            (item["role_name"], item["task_name"], item["sample_idx"], condition, l)
+            for item in chunk
+            for l in summaries.layers
+        )
 
 
 def main() -> None:
@@ -142,7 +184,7 @@ def main() -> None:
         "--output_dir",
         type=str,
         required=True,
-        help="Path to save the output activations and summaries.",
+        help="Path to save the output summary store.",
     )
     parser.add_argument(
         "--model_name",
@@ -174,6 +216,39 @@ def main() -> None:
         action="store_true",
         help="Do not use the system prompt when extracting activations.",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=8,
+        help="Maximum number of texts per forward pass. Default: 8.",
+    )
+    parser.add_argument(
+        "--max_batch_tokens",
+        type=int,
+        default=None,
+        help="Optional budget on padded tokens per forward pass.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=64,
+        help="Number of responses extracted per call (bounds CPU memory). Default: 64.",
+    )
+
+    parser.add_argument(
+        "--archive_layers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Also archive full per-token activations for these layers.",
+    )
+    parser.add_argument(
+        "--archive_dtype",
+        type=str,
+        choices=["bfloat16", "float16"],
+        default="bfloat16",
+        help="Storage dtype of the activation archive. Default: bfloat16.",
+    )
 
     args = parser.parse_args()
 
@@ -193,15 +268,24 @@ def main() -> None:
     print(f"Loading config from {config_path}...")
     config = load_config(config_path)
 
-    # Pre-compute existing trials
-    print("Scanning for existing summaries...")
-    summaries_dir = output_dir / "summaries"
-    existing_trials = set()
-    if summaries_dir.exists():
-        # Store filename stems to avoid ambiguous parsing of role/task names
-        existing_trials = {p.stem for p in summaries_dir.glob("*.json")}
-
-    print(f"Found {len(existing_trials)} existing summary files.")
+    # Load the completion manifest
+    print("Loading completion manifest...")
+    store = SummaryStore(output_dir / "summary_store")
+    manifest = CompletionManifest(output_dir / "completed.jsonl")
+    if len(manifest) == 0 and len(store) > 0:
+        # Stores written before the manifest existed
+        manifest.commit(sorted(store.completed(), key=str))
+
+    print(f"Found {len(manifest)} completed summaries.")
+
+    archive = None
+    if args.archive_layers is not None:
+        archive = ActivationArchive(
+            output_dir / "activation_archive",
+            layers=args.archive_layers,
+            dtype=args.archive_dtype,
+        )
+        print(f"Archiving layers {archive.layers} ({len(archive)} texts archived).")
 
     # Initialize model
     print(f"Loading model: {args.model_name}...")
@@ -242,10 +326,14 @@ def main() -> None:
             file_path,
             config,
             extractor,
-            output_dir,
-            existing_trials=existing_trials,
+            store,
+            manifest,
             layers=args.layers,
             use_system_prompt=not args.no_system_prompt,
+            batch_size=args.batch_size,
+            max_batch_tokens=args.max_batch_tokens,
+            chunk_size=args.chunk_size,
+            archive=archive,
         )
 
     print("Done.")
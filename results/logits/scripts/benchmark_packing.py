@@ -0,0 +1,182 @@
+"""
+Benchmark sequence packing in LogitExtractor.
+
+Scores the same mixed-length responses with extract_logits_batch padded and
+packed (pack_length), and reports wall time, the share of padding tokens and
+the largest difference in the results.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from animacy.analysis.logits import LogitExtractor, ResponseLogits
+
+
+def load_samples(data_dir: Path, num_files: int) -> list[dict]:
+    """Load responses from the first num_files JSON files, in file order."""
+    samples = []
+    for file_path in sorted(data_dir.glob("*.json"))[:num_files]:
+        with open(file_path, encoding="utf-8") as f:
+            samples.extend(json.load(f))
+    return samples
+
+
+def run(
+    extractor: LogitExtractor,
+    samples: list[dict],
+    batch_size: int,
+    pack_length: int | None,
+) -> tuple[float, list[ResponseLogits]]:
+    """Score all samples in batches and return (seconds, results)."""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+
+    results = []
+    for i in range(0, len(samples), batch_size):
+        results.extend(
+            extractor.extract_logits_batch(
+                samples[i : i + batch_size], pack_length=pack_length
+            )
+        )
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, results
+
+
+def max_difference(a: list[ResponseLogits], b: list[ResponseLogits]) -> float:
+    """Largest absolute difference between the scored log-probs of two runs."""
+    diff = 0.0
+    for x, y in zip(a, b, strict=True):
+        diff = max(diff, abs(x.average_log_probs - y.average_log_probs))
+        if x.first_100_response_log_probs:
+            diff = max(
+                diff,
+                float(
+                    np.max(
+                        np.abs(
+                            np.array(x.first_100_response_log_probs)
+                            - np.array(y.first_100_response_log_probs)
+                        )
+                    )
+                ),
+            )
+        if x.role_log_probs is not None:
+            diff = max(diff, abs(x.role_log_probs - y.role_log_probs))
+    return diff
+
+
+def padding_fraction(
+    extractor: LogitExtractor, samples: list[dict], batch_size: int
+) -> tuple[float, float]:
+    """Share of padding tokens when batches are padded, and when they are packed."""
+    padded = packed = real = 0
+    for i in range(0, len(samples), batch_size):
+        lengths = extractor.sample_lengths(samples[i : i + batch_size])
+        real += sum(lengths)
+        padded += max(lengths) * len(lengths)
+        packs = extractor._plan_packs(lengths, max(lengths))
+        packed += max(sum(lengths[j] for j in pack) for pack in packs) * len(packs)
+    return 1 - real / padded, 1 - real / packed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark packed scoring against padded scoring."
+    )
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default="results/q_responses/data/Qwen3-30B-A3B-Instruct-2507",
+        help="Folder of response JSON files.",
+    )
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        required=True,
+        help="Name or path of the model to use.",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="Device to run the model on.",
+    )
+    parser.add_argument(
+        "--num_files",
+        type=int,
+        default=2,
+        help="Number of response files to score. Default: 2.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=10,
+        help="Samples per extract_logits_batch call. Default: 10.",
+    )
+    parser.add_argument(
+        "--pack_length",
+        type=int,
+        default=0,
+        help="Minimum packed row length; 0 packs to the longest sample of each "
+        "batch. Default: 0.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for shuffling the samples into mixed-length batches. Default: 0.",
+    )
+
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.exists():
+        print(f"Error: Data directory {data_dir} does not exist.")
+        sys.exit(1)
+
+    samples = load_samples(data_dir, args.num_files)
+    # Mix tasks so that batches hold both short and long responses
+    np.random.default_rng(args.seed).shuffle(samples)
+    print(f"Loaded {len(samples)} samples from {data_dir}.")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model_name,
+        device_map=args.device,
+        torch_dtype="auto",
+        trust_remote_code=True,
+    )
+    extractor = LogitExtractor(model, tokenizer)
+
+    # Warm up kernels and the prompt boundary cache
+    run(extractor, samples[: args.batch_size], args.batch_size, pack_length=None)
+
+    padded_share, packed_share = padding_fraction(extractor, samples, args.batch_size)
+    padded_time, padded_results = run(extractor, samples, args.batch_size, None)
+    packed_time, packed_results = run(
+        extractor, samples, args.batch_size, args.pack_length
+    )
+
+    print(
+        f"Padded: {padded_time:.2f}s ({len(samples) / padded_time:.1f} samples/s, "
+        f"{padded_share:.0%} padding)"
+    )
+    print(
+        f"Packed: {packed_time:.2f}s ({len(samples) / packed_time:.1f} samples/s, "
+        f"{packed_share:.0%} padding)"
+    )
+    print(f"Speedup: {padded_time / packed_time:.2f}x")
+    print(f"Max abs difference: {max_difference(padded_results, packed_results):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark shared-prefix KV reuse in LogitExtractor.
+
+Scores the same responses with extract_logits_batch with and without
+share_prefix, and reports wall time and the largest difference in the results.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from animacy.analysis.logits import LogitExtractor, ResponseLogits
+
+
+def load_samples(data_dir: Path, num_files: int) -> list[dict]:
+    """Load responses from the first num_files JSON files, in file order."""
+    samples = []
+    for file_path in sorted(data_dir.glob("*.json"))[:num_files]:
+        with open(file_path, encoding="utf-8") as f:
+            samples.extend(json.load(f))
+    return samples
+
+
+def run(
+    extractor: LogitExtractor, samples: list[dict], batch_size: int, share_prefix: bool
+) -> tuple[float, list[ResponseLogits]]:
+    """Score all samples in batches and return (seconds, results)."""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+
+    results = []
+    for i in range(0, len(samples), batch_size):
+        results.extend(
+            extractor.extract_logits_batch(
+                samples[i : i + batch_size], share_prefix=share_prefix
+            )
+        )
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, results
+
+
+def max_difference(a: list[ResponseLogits], b: list[ResponseLogits]) -> float:
+    """Largest absolute difference between the scored log-probs of two runs."""
+    diff = 0.0
+    for x, y in zip(a, b, strict=True):
+        diff = max(diff, abs(x.average_log_probs - y.average_log_probs))
+        if x.first_100_response_log_probs:
+            diff = max(
+                diff,
+                float(
+                    np.max(
+                        np.abs(
+                            np.array(x.first_100_response_log_probs)
+                            - np.array(y.first_100_response_log_probs)
+                        )
+                    )
+                ),
+            )
+        if x.role_log_probs is not None:
+            diff = max(diff, abs(x.role_log_probs - y.role_log_probs))
+    return diff
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark shared-prefix scoring against full-batch scoring."
+    )
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default="results/q_responses/data/Qwen3-30B-A3B-Instruct-2507",
+        help="Folder of response JSON files.",
+    )
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        required=True,
+        help="Name or path of the model to use.",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="Device to run the model on.",
+    )
+    parser.add_argument(
+        "--num_files",
+        type=int,
+        default=2,
+        help="Number of response files to score. Default: 2.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=10,
+        help="Samples per extract_logits_batch call. Default: 10.",
+    )
+
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.exists():
+        print(f"Error: Data directory {data_dir} does not exist.")
+        sys.exit(1)
+
+    samples = load_samples(data_dir, args.num_files)
+    print(f"Loaded {len(samples)} samples from {data_dir}.")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model_name,
+        device_map=args.device,
+        torch_dtype="auto",
+        trust_remote_code=True,
+    )
+    extractor = LogitExtractor(model, tokenizer)
+
+    # Warm up kernels and the prompt boundary cache
+    run(extractor, samples[: args.batch_size], args.batch_size, share_prefix=False)
+
+    full_time, full_results = run(extractor, samples, args.batch_size, False)
+    shared_time, shared_results = run(extractor, samples, args.batch_size, True)
+
+    full_rate = len(samples) / full_time
+    shared_rate = len(samples) / shared_time
+    print(f"Full batch:    {full_time:.2f}s ({full_rate:.1f} samples/s)")
+    print(f"Shared prefix: {shared_time:.2f}s ({shared_rate:.1f} samples/s)")
+    print(f"Speedup: {full_time / shared_time:.2f}x")
+    print(f"Max abs difference: {max_difference(full_results, shared_results):.2e}")
+
+
+if __name__ == "__main__":
+    main()
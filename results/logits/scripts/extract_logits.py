@@ -1,16 +1,28 @@
 import argparse
+import datetime
 import json
+import os
+import socket
 import sys
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 from typing import Any
 
-import pandas as pd
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 from tqdm import tqdm
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
-from animacy.analysis.logits import LogitExtractor, ResponseLogits
+from animacy.analysis.logits import LogitExtractor
+from animacy.analysis.trajectories import (
+    KEY_COLUMNS,
+    PAIRED_TRAJECTORY_COLUMNS,
+    paired_rows,
+    response_rows,
+)
+from animacy.storage import FragmentSink
+from animacy.storage.sharding import completed_keys, merge_shards, shard_of, shard_root
 
 # Add src to path to ensure imports work
 project_root = Path(__file__).resolve().parents[3]
@@ -18,98 +30,141 @@ if str(project_root / "src") not in sys.path:
     sys.path.append(str(project_root / "src"))
 
 
-def process_item(
-    item: dict[str, Any], extractor: LogitExtractor, use_system_prompt: bool = True
-) -> ResponseLogits:
+def iter_samples(files: Iterable[Path]) -> Iterator[dict[str, Any]]:
     """
-    Process a single item (dict) and return a ResponseLogits object.
+    Lazily yield the response items of a sequence of JSON files.
 
-    Args:
-        item: A dictionary containing the following keys:
-            - role_name: The name of the role (e.g., "angel").
-            - task_name: The name of the task (e.g., "meaning_of_life").
-            - sample_idx: The index of the sample.
-            - response: The generated response text.
-            - system_prompt (optional): Custom system prompt.
-            - task_prompt (optional): Custom task/user prompt.
-        extractor: A LogitExtractor object.
-
-    Returns:
-        ResponseLogits object populated with calculated log-probabilities.
-    """
-    role_name = item["role_name"]
-    if role_name is None:
-        use_system_prompt = False
-
-    # Extract optional custom prompts
-    custom_system_prompt = item.get("system_prompt")
-    custom_task_prompt = item.get("task_prompt")
-
-    return extractor.extract_logits(
-        role_name=role_name,
-        task_name=item["task_name"],
-        sample_idx=item["sample_idx"],
-        response_text=item["response"],
-        use_system_prompt=use_system_prompt,
-        custom_system_prompt=custom_system_prompt,
-        custom_task_prompt=custom_task_prompt,
-    )
-
-
-def process_file(
-    file_path: Path, extractor: LogitExtractor, use_system_prompt: bool = True
-) -> Iterable[ResponseLogits]:
-    """
-    Process a file and return an iterable of ResponseLogits.
+    Only one file is held in memory at a time. Files that cannot be read are
+    reported and skipped.
 
     Args:
-        file_path: Path to the JSON file containing the items.
-        extractor: A LogitExtractor object.
+        files: Paths to JSON files, each holding a list of items with keys
+            role_name, task_name, sample_idx, response and optionally
+            system_prompt and task_prompt.
 
-    Returns:
-        Iterable of ResponseLogits objects.
+    Yields:
+        Item dicts, in file order.
     """
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    for item in data:
-        yield process_item(item, extractor, use_system_prompt=use_system_prompt)
-
-
-def process_folder(
-    folder_path: Path, extractor: LogitExtractor, use_system_prompt: bool = True
-) -> pd.DataFrame:
+    for file_path in tqdm(files, desc="Processing files"):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading file {file_path}: {e}")
+            continue
+        yield from data
+
+
+def process_stream(
+    samples: Iterable[dict[str, Any]],
+    extractor: LogitExtractor,
+    sink: FragmentSink,
+    condition: str,
+    use_system_prompt: bool = True,
+    batch_size: int = 8,
+    max_batch_tokens: int | None = None,
+    pool_size: int = 1024,
+    flush_rows: int = 1024,
+    trajectories: bool = False,
+    paired: bool = False,
+    stats: bool = False,
+    pack_length: int | None = None,
+    completed: set[tuple] | None = None,
+) -> int:
     """
-    Process a folder and return the data frame.
+    Score a stream of samples and append the results to a fragment sink.
+
+    Samples whose key is already completed are skipped, so an interrupted run
+    resumes where its last flushed fragment ended.
 
     Args:
-        folder_path: Path to the folder containing the JSON files.
+        samples: Response items (see iter_samples).
         extractor: A LogitExtractor object.
+        sink: Output fragments; also the record of completed samples.
+        condition: Condition label stored with every row ("with_sys"/"no_sys").
+        use_system_prompt: Whether to include the role-assigning system prompt.
+        batch_size: Maximum number of samples per forward pass.
+        max_batch_tokens: Optional budget on padded tokens per forward pass.
+        pool_size: Number of samples length-sorted together.
+        flush_rows: Number of result rows buffered before a fragment is written.
+        trajectories: Also store every response token's ID and log-prob as
+            list columns (see animacy.analysis.trajectories).
+        paired: Score every sample with and without the system prompt in the
+            same batch and write one wide row per sample (condition "paired").
+            use_system_prompt is ignored, and batch_size and max_batch_tokens
+            count both rows of a sample.
+        stats: Also store the entropy, target rank and top-k log mass of the
+            first 100 response positions.
+        pack_length: If set, pack each batch into rows of at least this many
+            tokens instead of padding it.
+        completed: Keys (KEY_COLUMNS) to skip. Defaults to the keys in sink.
 
     Returns:
-        DataFrame containing the log-probabilities for all items.
+        Number of rows written.
     """
-    all_logits = []
-    files = list(folder_path.glob("*.json"))
-
-    # Sort files for reproducibility
-    files.sort()
+    if completed is None:
+        completed = sink.keys(KEY_COLUMNS)
+    print(f"Found {len(completed)} completed samples.")
+
+    def key(item: dict[str, Any]) -> tuple:
+        return (item["role_name"], item["task_name"], item["sample_idx"], condition)
+
+    pending = (item for item in samples if key(item) not in completed)
+    if paired:
+        # Each sample runs twice, and the with-system-prompt row is the longer
+        use_system_prompt = True
+        batch_size = max(batch_size // 2, 1)
+        if max_batch_tokens is not None:
+            max_batch_tokens //= 2
+    batches = extractor.iter_batches(
+        pending,
+        use_system_prompt=use_system_prompt,
+        batch_size=batch_size,
+        max_batch_tokens=max_batch_tokens,
+        pool_size=pool_size,
+    )
 
-    for file_path in tqdm(files, desc="Processing files"):
+    buffer: list[dict[str, Any]] = []
+    written = 0
+    for batch in batches:
         try:
-            file_logits = process_file(
-                file_path, extractor, use_system_prompt=use_system_prompt
-            )
-            # Use model_dump() for Pydantic v2, fallback to dict() if needed
-            if hasattr(ResponseLogits, "model_dump"):
-                all_logits.extend([l.model_dump() for l in file_logits])
+            if paired:
+                rows = paired_rows(
+                    extractor.extract_paired_logits_batch(
+                        batch,
+                        return_trajectories=trajectories,
+                        return_stats=stats,
+                        pack_length=pack_length,
+                    ),
+                    trajectories=trajectories,
+                )
             else:
-                all_logits.extend([l.dict() for l in file_logits])
+                rows = response_rows(
+                    extractor.extract_logits_batch(
+                        batch,
+                        use_system_prompt=use_system_prompt,
+                        return_trajectories=trajectories,
+                        return_stats=stats,
+                        pack_length=pack_length,
+                    ),
+                    condition,
+                    trajectories=trajectories,
+                )
         except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+            print(f"Error extracting batch of {len(batch)}: {e}")
             continue
 
-    return pd.DataFrame(all_logits)
+        buffer.extend(rows)
+        if len(buffer) >= flush_rows:
+            sink.append(buffer)
+            written += len(buffer)
+            buffer = []
+
+    if buffer:
+        sink.append(buffer)
+        written += len(buffer)
+
+    return written
 
 
 def main() -> None:
@@ -123,10 +178,17 @@ def main() -> None:
         help="Path to the folder containing response JSON files.",
     )
     parser.add_argument(
-        "--output_file",
+        "--output_dir",
         type=str,
         required=True,
-        help="Path to save the output DataFrame (e.g., .csv or .pkl).",
+        help="Directory of Parquet fragments; results are appended as they finish.",
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        default=None,
+        help="Optional single file (.csv, .pkl or .parquet) to consolidate "
+        "the fragments into at the end.",
     )
     parser.add_argument(
         "--model_name",
@@ -151,18 +213,152 @@ def main() -> None:
         action="store_true",
         help="Do not use the system prompt when extracting log-probabilities.",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=8,
+        help="Maximum number of samples per forward pass. Default: 8.",
+    )
+    parser.add_argument(
+        "--max_batch_tokens",
+        type=int,
+        default=None,
+        help="Optional budget on padded tokens per forward pass.",
+    )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=1024,
+        help="Number of samples length-sorted together. Default: 1024.",
+    )
+    parser.add_argument(
+        "--flush_rows",
+        type=int,
+        default=1024,
+        help="Number of result rows per Parquet fragment. Default: 1024.",
+    )
+    parser.add_argument(
+        "--trajectories",
+        action="store_true",
+        help="Also store the token IDs and log-probs of every response token "
+        "(load with animacy.analysis.load_trajectories).",
+    )
+    parser.add_argument(
+        "--pack_length",
+        type=int,
+        default=None,
+        help="Pack the samples of each batch end to end into rows of at least "
+        "this many tokens instead of padding them. Use with a larger "
+        "--batch_size and --max_batch_tokens.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Also store the entropy, target rank and top-k log-prob mass of the "
+        "first 100 response positions.",
+    )
+    parser.add_argument(
+        "--stats_top_k",
+        type=int,
+        default=10,
+        help="Number of most likely tokens in the top-k log-prob mass. Default: 10.",
+    )
+    parser.add_argument(
+        "--paired",
+        action="store_true",
+        help="Score every response with and without the system prompt in one "
+        "pass and write one row per response with both conditions and their "
+        "per-token deltas.",
+    )
+
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of data-parallel workers (one per GPU, or CPU workers "
+        "sharing the cores). Each scores its own hashed shard of the responses "
+        "into output_dir/shard-XXX-of-YYY; a single worker writes to output_dir "
+        "itself. Resuming skips every response found in output_dir or any shard "
+        "directory, so a run can resume with a different number of workers, "
+        "and the merged output keeps one row per response. Default: 1.",
+    )
 
     args = parser.parse_args()
 
-    input_dir = Path(args.input_dir)
-    output_file = Path(args.output_file)
+    if not Path(args.input_dir).exists():
+        print(f"Error: Input directory {args.input_dir} does not exist.")
+        sys.exit(1)
 
-    if not input_dir.exists():
-        print(f"Error: Input directory {input_dir} does not exist.")
+    if args.paired and args.no_system_prompt:
+        print("Error: --paired already includes the no-system-prompt condition.")
         sys.exit(1)
 
-    # Create output directory if it doesn't exist
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if "WORLD_SIZE" in os.environ:
+        # Launched by torchrun, one process per worker
+        run_worker(int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), args)
+    elif args.num_workers > 1:
+        os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+        os.environ.setdefault("MASTER_PORT", str(_free_port()))
+        mp.spawn(run_worker, args=(args.num_workers, args), nprocs=args.num_workers)
+    else:
+        run_worker(0, 1, args)
+
+    print("Done.")
+
+
+def _free_port() -> int:
+    """Find an unused local TCP port for the process group rendezvous."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _worker_device(device: str, rank: int) -> str:
+    """Device of one worker: its own GPU if there is one, otherwise the CPU."""
+    if device.startswith("cuda") and torch.cuda.is_available():
+        return f"cuda:{rank % torch.cuda.device_count()}"
+    return device
+
+
+def run_worker(rank: int, world_size: int, args: argparse.Namespace) -> None:
+    """
+    Score one shard of the responses.
+
+    With world_size > 1 the workers form a gloo process group (which also works
+    on CPU-only machines). Each worker keeps the responses whose hashed
+    (role_name, task_name, sample_idx) falls in its shard and checkpoints them
+    to its own fragment directory. Responses already written under output_dir
+    by a run with any number of workers are skipped. Once every worker is done,
+    rank 0 merges all fragments under output_dir in key order, de-duplicated by
+    key, so the merged table does not depend on scheduling or worker count.
+
+    Args:
+        rank: Index of this worker (and of its shard)
+        world_size: Number of workers
+        args: Parsed command line arguments
+    """
+    input_dir = Path(args.input_dir)
+    output_dir = Path(args.output_dir)
+    output_file = Path(args.output_file) if args.output_file else None
+    device = args.device
+
+    if world_size > 1:
+        # Shards can take very different times; wait for the slowest one
+        dist.init_process_group(
+            "gloo", rank=rank, world_size=world_size, timeout=datetime.timedelta(days=1)
+        )
+        device = _worker_device(args.device, rank)
+        if device == "cpu":
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+        sink = FragmentSink(shard_root(output_dir, rank, world_size))
+        print(f"Worker {rank}/{world_size} on {device}, writing to {sink.root}")
+    else:
+        sink = FragmentSink(output_dir)
+
+    if args.paired:
+        condition = "paired"
+    else:
+        condition = "no_sys" if args.no_system_prompt else "with_sys"
 
     print(f"Loading model: {args.model_name}...")
 
@@ -173,7 +369,7 @@ def main() -> None:
     tokenizer = AutoTokenizer.from_pretrained(args.model_name, trust_remote_code=True)
 
     model_kwargs = {
-        "device_map": args.device,
+        "device_map": device,
         "torch_dtype": "auto",
         "trust_remote_code": True,
     }
@@ -185,26 +381,63 @@ def main() -> None:
 
     model = AutoModelForCausalLM.from_pretrained(args.model_name, **model_kwargs)
 
-    extractor = LogitExtractor(model, tokenizer)
+    extractor = LogitExtractor(model, tokenizer, stats_top_k=args.stats_top_k)
 
     print(f"Processing responses from {input_dir}...")
-    df = process_folder(
-        input_dir, extractor, use_system_prompt=not args.no_system_prompt
+    # Sort files for reproducibility
+    files = sorted(input_dir.glob("*.json"))
+    samples = iter_samples(files)
+    if world_size > 1:
+        samples = (
+            item
+            for item in samples
+            if shard_of(
+                (item["role_name"], item["task_name"], item["sample_idx"]), world_size
+            )
+            == rank
+        )
+    # Read every layout, so a run resumes with any number of workers
+    completed = completed_keys(output_dir, KEY_COLUMNS)
+    written = process_stream(
+        samples,
+        extractor,
+        sink,
+        condition,
+        use_system_prompt=not args.no_system_prompt,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        pool_size=args.pool_size,
+        flush_rows=args.flush_rows,
+        trajectories=args.trajectories,
+        paired=args.paired,
+        stats=args.stats,
+        pack_length=args.pack_length,
+        completed=completed,
     )
-
-    print(f"Saving results to {output_file}...")
-    if output_file.suffix == ".csv":
-        df.to_csv(output_file, index=False)
-    elif output_file.suffix == ".pkl":
-        df.to_pickle(output_file)
-    elif output_file.suffix == ".parquet":
-        df.to_parquet(output_file)
-    else:
-        # Default to CSV if unknown extension
-        print("Unknown extension, saving as CSV.")
-        df.to_csv(output_file, index=False)
-
-    print("Done.")
+    print(f"Wrote {written} rows to {sink.root}.")
+
+    if world_size > 1:
+        dist.barrier()
+        dist.destroy_process_group()
+        if rank != 0:
+            return
+
+    if output_file is not None:
+        print(f"Saving results to {output_file}...")
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        df = merge_shards(output_dir, KEY_COLUMNS)
+        # Trajectories stay in the fragments; as CSV cells they would be strings
+        df = df.drop(columns=[c for c in PAIRED_TRAJECTORY_COLUMNS if c in df.columns])
+        if output_file.suffix == ".csv":
+            df.to_csv(output_file, index=False)
+        elif output_file.suffix == ".pkl":
+            df.to_pickle(output_file)
+        elif output_file.suffix == ".parquet":
+            df.to_parquet(output_file)
+        else:
+            # Default to CSV if unknown extension
+            print("Unknown extension, saving as CSV.")
+            df.to_csv(output_file, index=False)
 
 
 if __name__ == "__main__":
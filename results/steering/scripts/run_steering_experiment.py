@@ -49,12 +49,20 @@ import sys
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 import torch
 from tqdm import tqdm
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
-from animacy.steering.evaluation import evaluate_steered_logits
+from animacy.analysis.trajectories import KEY_COLUMNS as RESPONSE_KEY_COLUMNS
+from animacy.steering.evaluation import evaluate_steered_logits_sweep
+from animacy.steering.session import SteeringSession
+from animacy.storage import CompletionManifest, FragmentSink
+
+# Columns that identify an output row; a unit of work is one
+# (role, magnitude, layer set) and holds every sample of the role
+KEY_COLUMNS = (*RESPONSE_KEY_COLUMNS, "steering_magnitude", "steered_layers")
 
 
 def load_role_vectors(file_path: Path) -> dict[str, dict[int, torch.Tensor]]:
@@ -95,6 +103,26 @@ def load_samples(input_dir: Path) -> list[dict[str, Any]]:
     return samples
 
 
+def assemble_results(sink: FragmentSink) -> pd.DataFrame:
+    """
+    Build the final table from the fragments written so far.
+
+    Rows of units that were written again after an interrupted run are
+    de-duplicated (the last write wins), and list columns read back from
+    Parquet are turned into lists again.
+    """
+    df = sink.read()
+    if df.empty:
+        return df
+    df = df.drop_duplicates(subset=list(KEY_COLUMNS), keep="last")
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(
+                lambda v: v.tolist() if isinstance(v, np.ndarray) else v
+            )
+    return df.reset_index(drop=True)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Run steering experiments and extract log-probabilities."
@@ -111,6 +139,15 @@ def main() -> None:
         required=True,
         help="Path to save the output DataFrame (e.g., .csv or .pkl).",
     )
+    parser.add_argument(
+        "--fragments_dir",
+        type=str,
+        help=(
+            "Directory for the incremental results and completion index. Units "
+            "recorded there are skipped on restart. Default: <output_file "
+            "stem>_fragments next to the output file."
+        ),
+    )
     parser.add_argument(
         "--model_name",
         type=str,
@@ -157,7 +194,20 @@ def main() -> None:
         "--batch_size",
         type=int,
         default=8,
-        help="Batch size for evaluation. Default: 8.",
+        help=(
+            "Rows per forward pass. If the model cannot replay its upper layers, "
+            "each sample takes one row per magnitude, so a batch holds "
+            "batch_size // len(magnitudes) samples. Default: 8."
+        ),
+    )
+
+    parser.add_argument(
+        "--offload_lower_layers",
+        action="store_true",
+        help=(
+            "Keep the cached activations of the unsteered lower layers on the "
+            "host between magnitudes to save device memory."
+        ),
     )
 
     args = parser.parse_args()
@@ -177,6 +227,17 @@ def main() -> None:
     # Create output directory if it doesn't exist
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
+    # Results are written per (role, magnitude, layer set) as each completes
+    fragments_dir = (
+        Path(args.fragments_dir)
+        if args.fragments_dir
+        else output_file.parent / f"{output_file.stem}_fragments"
+    )
+    sink = FragmentSink(fragments_dir)
+    manifest = CompletionManifest(fragments_dir / "completed.jsonl")
+    if len(manifest):
+        print(f"Resuming: {len(manifest)} completed units in {fragments_dir}.")
+
     print(f"Loading role vectors from {role_vectors_path}...")
     role_vectors = load_role_vectors(role_vectors_path)
     available_roles = set(role_vectors.keys())
@@ -211,14 +272,21 @@ def main() -> None:
         trust_remote_code=True,
     )
 
-    all_results = []
-
-    # Iterate over magnitudes
-    for magnitude in tqdm(args.magnitudes, desc="Magnitudes"):
-        # Iterate over roles
-        for role in tqdm(
-            roles_to_process, desc=f"Roles (mag={magnitude})", leave=False
-        ):
+    # Same condition labels as the unsteered logit extraction
+    condition = "no_sys" if args.no_system_prompt else "with_sys"
+
+    # Hook every layer any role steers once, for the whole run
+    session_layers = set()
+    for role in roles_to_process:
+        available_layers = set(role_vectors[role].keys())
+        if args.layers:
+            available_layers &= set(args.layers)
+        session_layers |= available_layers
+
+    with SteeringSession(model, tokenizer, session_layers) as session:
+        # Iterate over roles; each role's samples are tokenized and run through
+        # the unsteered lower layers once, then scored at every magnitude
+        for role in tqdm(sorted(roles_to_process), desc="Roles"):
             # Filter samples for this role
             role_samples = [s for s in all_samples if s.get("role_name") == role]
 
@@ -235,51 +303,76 @@ def main() -> None:
                 layers_to_steer = list(target_layers.intersection(available_layers))
                 if not layers_to_steer:
                     print(
-                        f"Warning: No valid layers to steer for role {role} (requested "
-                        f"{args.layers}, available {list(available_layers)})"
+                        f"Warning: No valid layers to steer for role {role} "
+                        f"(requested {args.layers}, available "
+                        f"{list(available_layers)})"
                     )
                     continue
             else:
                 layers_to_steer = list(available_layers)
 
+            # Skip the magnitudes completed by a previous run
+            steered_layers = str(sorted(layers_to_steer))
+            magnitudes = [
+                m for m in args.magnitudes if (role, m, steered_layers) not in manifest
+            ]
+            if not magnitudes:
+                continue
+
             # Prepare steering vectors dict for this specific run
             # We only include the layers we want to steer
             current_steering_vectors = {l: vectors[l] for l in layers_to_steer}
 
             # Run evaluation
             try:
-                results = evaluate_steered_logits(
+                results_by_magnitude = evaluate_steered_logits_sweep(
                     model=model,
                     tokenizer=tokenizer,
                     steering_vectors=current_steering_vectors,
                     layers=layers_to_steer,
-                    magnitude=magnitude,
+                    magnitudes=magnitudes,
                     samples=role_samples,
                     use_system_prompt=not args.no_system_prompt,
                     batch_size=args.batch_size,
+                    offload_lower_layers=args.offload_lower_layers,
+                    session=session,
                 )
-
-                # Add metadata and convert to dict
-                for res in results:
-                    res_dict = (
-                        res.model_dump() if hasattr(res, "model_dump") else res.dict()
-                    )
-                    res_dict["steering_magnitude"] = magnitude
-                    res_dict["steered_layers"] = str(sorted(layers_to_steer))
-                    all_results.append(res_dict)
-
             except Exception as e:
-                print(f"Error processing role {role} at magnitude {magnitude}: {e}")
+                print(f"Error processing role {role}: {e}")
                 import traceback
 
                 traceback.print_exc()
+                continue
+
+            # Write each unit and record it as complete on its own, so a failure
+            # only loses the units that were not written yet
+            for magnitude, results in results_by_magnitude.items():
+                try:
+                    # Add metadata and convert to dict
+                    rows = []
+                    for res in results:
+                        res_dict = res.model_dump()
+                        res_dict["condition"] = condition
+                        res_dict["steering_magnitude"] = magnitude
+                        res_dict["steered_layers"] = steered_layers
+                        rows.append(res_dict)
+
+                    # Write the unit before recording it as complete
+                    sink.append(rows)
+                    manifest.commit([(role, magnitude, steered_layers)])
+
+                except Exception as e:
+                    print(f"Error writing role {role} at magnitude {magnitude}: {e}")
+                    import traceback
+
+                    traceback.print_exc()
 
     # Save results
-    if not all_results:
+    df = assemble_results(sink)
+    if df.empty:
         print("No results generated.")
         return
 
-    df = pd.DataFrame(all_results)
     print(f"Saving {len(df)} results to {output_file}...")
 
     if output_file.suffix == ".csv":
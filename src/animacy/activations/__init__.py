@@ -2,13 +2,27 @@
 Activations module for extracting and analyzing model activations.
 """
 
-from .data import ActivationSummaries, extract_activation_summaries
+from .archive import ActivationArchive
+from .data import (
+    SUMMARY_LOCATIONS,
+    ActivationSummaries,
+    ActivationSummaryBatch,
+    extract_activation_summaries,
+    extract_activation_summaries_batch,
+)
 from .extractor import ActivationExtractor
+from .store import SummaryStore, convert_json_summaries
 from .token_mapper import ActivationResult
 
 __all__ = [
+    "ActivationArchive",
     "ActivationExtractor",
     "ActivationResult",
     "ActivationSummaries",
+    "ActivationSummaryBatch",
+    "SUMMARY_LOCATIONS",
+    "SummaryStore",
+    "convert_json_summaries",
     "extract_activation_summaries",
+    "extract_activation_summaries_batch",
 ]
@@ -0,0 +1,448 @@
+"""
+ActivationArchive - Sharded storage of raw per-token activations.
+
+Layout of an archive directory::
+
+    meta.json                          hidden size, dtype, layers, shard size
+    layer{L}/shard-00000.bin, ...      flat (tokens, hidden) 16-bit activations
+    index/part-00000.parquet, ...      ragged index, one row per text
+
+Texts are packed back to back into fixed-capacity shards. Every layer uses the
+same packing, so one index row (shard, start, length) locates a text in all
+layers. The index also keeps the input_ids, token offsets, message ranges and
+text needed to rebuild an ActivationResult. As in SummaryStore, the index
+fragment is the commit point and uncommitted activations are overwritten by
+the next append.
+"""
+
+import json
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from transformers import PreTrainedTokenizer
+
+from .store import KEY_COLUMNS
+from .token_mapper import ActivationResult
+
+_DTYPES = {"bfloat16": torch.bfloat16, "float16": torch.float16}
+
+
+class ActivationArchive:
+    """
+    Append-only archive of full per-token activations with zero-copy reads.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        layers: list[int] | None = None,
+        dtype: str = "bfloat16",
+        shard_bytes: int = 1 << 30,
+    ):
+        """
+        Open (or create) an archive.
+
+        Args:
+            root: Directory of the archive.
+            layers: Layers to archive, required when creating a new archive.
+            dtype: Storage dtype, "bfloat16" or "float16".
+            shard_bytes: Target size of each shard file per layer.
+        """
+        self.root = Path(root)
+        self._index_dir = self.root / "index"
+        self._meta_path = self.root / "meta.json"
+
+        if self._meta_path.exists():
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if layers is not None and sorted(layers) != meta["layers"]:
+                raise ValueError(
+                    f"Archive {self.root} stores layers {meta['layers']}, got {layers}"
+                )
+            self.layers: list[int] = meta["layers"]
+            self.dtype_name: str = meta["dtype"]
+            self.hidden_size: int | None = meta["hidden_size"]
+            self.shard_tokens: int | None = meta["shard_tokens"]
+            self.shard_bytes = shard_bytes
+        else:
+            if layers is None:
+                raise ValueError("layers must be given when creating an archive")
+            if dtype not in _DTYPES:
+                raise ValueError(f"dtype must be one of {list(_DTYPES)}, got '{dtype}'")
+            self.layers = sorted(layers)
+            self.dtype_name = dtype
+            self.hidden_size = None
+            self.shard_tokens = None
+            self.shard_bytes = shard_bytes
+
+        self.dtype = _DTYPES[self.dtype_name]
+        self._index: pd.DataFrame | None = None
+        self._positions: dict[tuple, int] | None = None
+        # Write position, read from the index once and then kept up to date
+        self._end: tuple[int, int] | None = None
+        self._next_fragment_id: int | None = None
+        self._maps: dict[tuple[int, int], np.memmap] = {}
+
+    # ------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------
+
+    def _fragments(self) -> list[Path]:
+        if not self._index_dir.exists():
+            return []
+        return sorted(self._index_dir.glob("part-*.parquet"))
+
+    @property
+    def index(self) -> pd.DataFrame:
+        """Committed index rows, later entries for a key replacing earlier ones."""
+        if self._index is None:
+            fragments = [pd.read_parquet(path) for path in self._fragments()]
+            if fragments:
+                index = pd.concat(fragments, ignore_index=True)
+                index = index.drop_duplicates(
+                    subset=list(KEY_COLUMNS), keep="last"
+                ).reset_index(drop=True)
+                # The no-role condition is stored as a null role name
+                role_names = index["role_name"].astype(object)
+                index["role_name"] = role_names.where(role_names.notna(), None)
+            else:
+                index = pd.DataFrame(columns=[*KEY_COLUMNS, "shard", "start", "length"])
+            self._index = index
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _keys(self) -> list[tuple]:
+        columns = [self.index[c] for c in KEY_COLUMNS]
+        return [
+            (role, task, int(sample_idx), condition)
+            for role, task, sample_idx, condition in zip(*columns, strict=True)
+        ]
+
+    def completed(self) -> set[tuple]:
+        """
+        Keys already archived.
+
+        Returns:
+            Set of (role_name, task_name, sample_idx, condition) tuples
+        """
+        return set(self._keys())
+
+    def record(
+        self, role_name: str | None, task_name: str, sample_idx: int, condition: str
+    ) -> pd.Series:
+        """
+        Index row of one text.
+
+        Raises:
+            KeyError: If the text is not archived
+        """
+        if self._positions is None:
+            self._positions = {
+                key: position for position, key in enumerate(self._keys())
+            }
+        key = (role_name, task_name, int(sample_idx), condition)
+        position = self._positions.get(key)
+        if position is None:
+            raise KeyError(f"{key} is not archived")
+        return self.index.iloc[position]
+
+    def _write_position(self) -> tuple[int, int]:
+        """
+        Shard and token offset after the last committed text.
+
+        The index is scanned on first use only; append keeps the position current.
+        """
+        if self._end is None:
+            shard, fill = 0, 0
+            for fragment in self._fragments():
+                part = pd.read_parquet(fragment, columns=["shard", "start", "length"])
+                if part.empty:
+                    continue
+                last_shard = int(part["shard"].max())
+                in_shard = part[part["shard"] == last_shard]
+                end = int((in_shard["start"] + in_shard["length"]).max())
+                if (last_shard, end) > (shard, fill):
+                    shard, fill = last_shard, end
+            self._end = (shard, fill)
+        return self._end
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _shard_path(self, layer: int, shard: int) -> Path:
+        return self.root / f"layer{layer}" / f"shard-{shard:05d}.bin"
+
+    def _write_meta(self, hidden_size: int) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.hidden_size = hidden_size
+        self.shard_tokens = max(1, self.shard_bytes // (hidden_size * 2))
+        meta = {
+            "hidden_size": self.hidden_size,
+            "dtype": self.dtype_name,
+            "layers": self.layers,
+            "shard_tokens": self.shard_tokens,
+        }
+        tmp_path = self._meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self._meta_path)
+
+    def append(
+        self,
+        result: ActivationResult,
+        keys: list[Mapping],
+        condition: str,
+        text_indices: list[int] | None = None,
+    ) -> None:
+        """
+        Archive texts from an ActivationResult and commit them to the index.
+
+        Padding positions (attention_mask == 0) are dropped.
+
+        Args:
+            result: Extraction result holding at least the archive's layers.
+            keys: One mapping per archived text with role_name, task_name and
+                  sample_idx, aligned with text_indices.
+            condition: Condition label shared by the texts (e.g. "with_sys").
+            text_indices: Texts of the result to archive. Defaults to all texts.
+        """
+        if text_indices is None:
+            text_indices = list(range(len(result.texts)))
+        if len(keys) != len(text_indices):
+            raise ValueError(f"Got {len(keys)} keys for {len(text_indices)} texts")
+        missing = [layer for layer in self.layers if layer not in result.activations]
+        if missing:
+            raise ValueError(f"Result is missing archive layers {missing}")
+        if not text_indices:
+            return
+
+        hidden_size = result.activations[self.layers[0]].shape[-1]
+        if self.hidden_size is None:
+            self._write_meta(hidden_size)
+        elif hidden_size != self.hidden_size:
+            raise ValueError(
+                f"Hidden size {hidden_size} does not match archive hidden size "
+                f"{self.hidden_size}"
+            )
+
+        # Token span of each text within the padded sequence
+        spans = []
+        for text_index in text_indices:
+            if result.attention_mask is None:
+                positions = torch.arange(result.input_ids.shape[1])
+            else:
+                positions = torch.nonzero(result.attention_mask[text_index]).squeeze(1)
+            spans.append((int(positions[0]), int(positions[-1]) + 1))
+
+        # Pack texts into shards, starting a new shard when one is full
+        shard, fill = self._write_position()
+        placements = []
+        for first, last in spans:
+            length = last - first
+            if fill > 0 and fill + length > self.shard_tokens:
+                shard, fill = shard + 1, 0
+            placements.append((shard, fill, length))
+            fill += length
+
+        row_bytes = self.hidden_size * 2
+        for layer in self.layers:
+            (self.root / f"layer{layer}").mkdir(parents=True, exist_ok=True)
+            activations = result.activations[layer]
+            handles: dict[int, object] = {}
+            try:
+                for text_index, (first, last), (shard, start, _) in zip(
+                    text_indices, spans, placements, strict=True
+                ):
+                    if shard not in handles:
+                        path = self._shard_path(layer, shard)
+                        f = open(path, "r+b" if path.exists() else "wb")
+                        # Drop activations left behind by an append that never committed
+                        f.truncate(start * row_bytes)
+                        f.seek(start * row_bytes)
+                        handles[shard] = f
+                    values = activations[text_index, first:last].to(self.dtype)
+                    handles[shard].write(
+                        values.contiguous().view(torch.int16).numpy().tobytes()
+                    )
+            finally:
+                for f in handles.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+
+        records = []
+        for key, text_index, (first, last), (shard, start, length) in zip(
+            keys, text_indices, spans, placements, strict=True
+        ):
+            offsets = result.offset_mapping[text_index, first:last]
+            records.append(
+                {
+                    "role_name": key["role_name"],
+                    "task_name": key["task_name"],
+                    "sample_idx": int(key["sample_idx"]),
+                    "condition": condition,
+                    "shard": shard,
+                    "start": start,
+                    "length": length,
+                    "input_ids": result.input_ids[text_index, first:last].tolist(),
+                    "offset_starts": offsets[:, 0].tolist(),
+                    "offset_ends": offsets[:, 1].tolist(),
+                    "message_ranges": json.dumps(
+                        result.message_ranges[text_index]
+                        if result.message_ranges is not None
+                        else None
+                    ),
+                    "text": result.texts[text_index],
+                }
+            )
+        self._commit(pd.DataFrame.from_records(records))
+        last_shard, last_start, last_length = placements[-1]
+        self._end = (last_shard, last_start + last_length)
+
+    def _commit(self, fragment: pd.DataFrame) -> None:
+        """Write an index fragment atomically."""
+        self._index_dir.mkdir(parents=True, exist_ok=True)
+        if self._next_fragment_id is None:
+            existing = self._fragments()
+            self._next_fragment_id = (
+                int(existing[-1].stem.split("-")[1]) + 1 if existing else 0
+            )
+        next_id = self._next_fragment_id
+        path = self._index_dir / f"part-{next_id:05d}.parquet"
+        tmp_path = self._index_dir / f".part-{next_id:05d}.parquet.tmp"
+        fragment.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        self._next_fragment_id = next_id + 1
+        self._index = None
+        self._positions = None
+        # Shard files may have grown, so drop stale memory maps
+        self._maps.clear()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _shard(self, layer: int, shard: int) -> np.memmap:
+        shard_map = self._maps.get((layer, shard))
+        if shard_map is None:
+            path = self._shard_path(layer, shard)
+            num_tokens = path.stat().st_size // (self.hidden_size * 2)
+            # Copy-on-write so torch gets a writable buffer without touching the file
+            shard_map = np.memmap(
+                path, dtype=np.int16, mode="c", shape=(num_tokens, self.hidden_size)
+            )
+            self._maps[(layer, shard)] = shard_map
+        return shard_map
+
+    def read(
+        self,
+        layer: int,
+        role_name: str | None,
+        task_name: str,
+        sample_idx: int,
+        condition: str,
+        start: int = 0,
+        end: int | None = None,
+    ) -> torch.Tensor:
+        """
+        Activations of one text, as a zero-copy view of the shard.
+
+        Args:
+            layer: Archived layer index
+            role_name: Role name of the text (None for the no-role condition)
+            task_name: Task name of the text
+            sample_idx: Sample index of the text
+            condition: Condition label
+            start: First token of the span, relative to the unpadded text
+            end: End of the span (exclusive). Defaults to the end of the text.
+
+        Returns:
+            Tensor of shape (span_length, hidden) in the archive dtype
+        """
+        if layer not in self.layers:
+            raise KeyError(f"Layer {layer} is not archived (have {self.layers})")
+        record = self.record(role_name, task_name, sample_idx, condition)
+        length = int(record["length"])
+        end = length if end is None else min(end, length)
+        offset = int(record["start"])
+
+        rows = self._shard(layer, int(record["shard"]))[offset + start : offset + end]
+        return torch.from_numpy(rows).view(self.dtype)
+
+    def to_activation_result(
+        self,
+        keys: list[Mapping],
+        condition: str,
+        tokenizer: PreTrainedTokenizer,
+        layers: list[int] | None = None,
+    ) -> ActivationResult:
+        """
+        Rebuild an ActivationResult for archived texts.
+
+        The result can be passed to extract_activation_summaries and the other
+        token-level helpers. Texts are right-padded to the longest one, so the
+        activations are copied out of the shards.
+
+        Args:
+            keys: Mappings with role_name, task_name and sample_idx
+            condition: Condition label
+            tokenizer: Tokenizer the texts were encoded with
+            layers: Layers to load. Defaults to all archived layers.
+
+        Returns:
+            ActivationResult over the requested texts
+        """
+        layers = self.layers if layers is None else layers
+        records = [
+            self.record(
+                key["role_name"], key["task_name"], key["sample_idx"], condition
+            )
+            for key in keys
+        ]
+        seq_len = max(int(record["length"]) for record in records)
+        num_texts = len(records)
+
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        input_ids = torch.full((num_texts, seq_len), pad_id, dtype=torch.long)
+        offset_mapping = torch.zeros((num_texts, seq_len, 2), dtype=torch.long)
+        attention_mask = torch.zeros((num_texts, seq_len), dtype=torch.long)
+        activations = {
+            layer: torch.zeros((num_texts, seq_len, self.hidden_size), dtype=self.dtype)
+            for layer in layers
+        }
+
+        message_ranges = []
+        for row, (key, record) in enumerate(zip(keys, records, strict=True)):
+            length = int(record["length"])
+            input_ids[row, :length] = torch.tensor(record["input_ids"])
+            offset_mapping[row, :length, 0] = torch.tensor(record["offset_starts"])
+            offset_mapping[row, :length, 1] = torch.tensor(record["offset_ends"])
+            attention_mask[row, :length] = 1
+            message_ranges.append(json.loads(record["message_ranges"]))
+            for layer in layers:
+                activations[layer][row, :length] = self.read(
+                    layer,
+                    key["role_name"],
+                    key["task_name"],
+                    key["sample_idx"],
+                    condition,
+                )
+
+        return ActivationResult(
+            activations=activations,
+            input_ids=input_ids,
+            offset_mapping=offset_mapping,
+            tokenizer=tokenizer,
+            texts=[record["text"] for record in records],
+            message_ranges=(
+                None if any(r is None for r in message_ranges) else message_ranges
+            ),
+            attention_mask=attention_mask,
+        )
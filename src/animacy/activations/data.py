@@ -1,7 +1,9 @@
 import numpy as np
-import re
+import torch
 from pydantic import BaseModel, Field, field_serializer
 
+from animacy.models.tokenizer_cache import get_tokenizer_artifacts
+
 from .token_mapper import ActivationResult
 
 
@@ -58,8 +60,7 @@ def _detect_assistant_role_name(tokenizer) -> str:
     """
     Detect the role name used for assistant/model responses in the chat template.
 
-    This function tests the actual template rendering to find what role name
-    appears in the output, rather than just parsing the template code.
+    The result is cached per tokenizer, see animacy.models.tokenizer_cache.
 
     Args:
         tokenizer: The tokenizer with a chat_template attribute
@@ -67,108 +68,110 @@ def _detect_assistant_role_name(tokenizer) -> str:
     Returns:
         The role name string (e.g., 'assistant', 'model')
     """
-    if not hasattr(tokenizer, "chat_template") or not tokenizer.chat_template:
-        return "assistant"  # Default fallback
-
-    # Test content to verify preservation
-    test_content = "TEST_CONTENT_XYZ"
-
-    # 1. Try 'assistant' first
-    # We check if the content is preserved in the output.
-    # Some templates (like Gemma 3) might silently drop messages with unknown roles.
-    try:
-        rendered_asst = tokenizer.apply_chat_template(
-            [
-                {"role": "user", "content": "test"},
-                {"role": "assistant", "content": test_content},
-            ],
-            tokenize=False,
-            add_generation_prompt=False,
-        )
-
-        if test_content in rendered_asst:
-            # Content preserved. Check for 'model' marker to be precise.
-            if "<start_of_turn>model" in rendered_asst or "role>model" in rendered_asst:
-                return "model"
-            # Or kept as 'assistant'
-            elif (
-                "<start_of_turn>assistant" in rendered_asst
-                or "role>assistant" in rendered_asst
-            ):
-                return "assistant"
-
-            # If content is preserved but no markers found, 'assistant' is likely valid
-            return "assistant"
-
-    except Exception:
-        pass
-
-    # 2. If 'assistant' failed or dropped content, try 'model'
-    try:
-        rendered_model = tokenizer.apply_chat_template(
-            [
-                {"role": "user", "content": "test"},
-                {"role": "model", "content": test_content},
-            ],
-            tokenize=False,
-            add_generation_prompt=False,
-        )
+    return get_tokenizer_artifacts(tokenizer).assistant_role_name
 
-        if test_content in rendered_model:
-            return "model"
-    except Exception:
-        pass
-
-    # Fallback: Parse the template code
-    template = tokenizer.chat_template
-
-    # Look for role comparisons in the Jinja2 template
-    # Common patterns:
-    # - message['role'] == 'assistant'
-    # - message['role'] == 'model'
-    # - message.role == 'assistant'
-
-    # Pattern to match role comparisons
-    patterns = [
-        r"message\[?['\"]role['\"]\]?\s*==\s*['\"](\w+)['\"]",
-        r"['\"](\w+)['\"]\s*==\s*message\[?['\"]role['\"]\]?",
-    ]
 
-    found_roles = set()
-    for pattern in patterns:
-        matches = re.findall(pattern, template)
-        found_roles.update(matches)
+#: Summary locations in the order used along the location axis of stacked summaries.
+SUMMARY_LOCATIONS: tuple[str, ...] = (
+    "avg_system_prompt",
+    "avg_user_prompt",
+    "avg_response",
+    "avg_response_first_10_tokens",
+    "at_role",
+    "at_role_period",
+    "at_end_system_prompt",
+    "at_end_user_prompt",
+    "at_start_agent_response",
+)
 
-    # Filter out 'system' and 'user' to find the assistant role
-    assistant_roles = found_roles - {"system", "user"}
 
-    if assistant_roles:
-        # Prefer 'assistant' if it exists, otherwise take the first one
-        if "assistant" in assistant_roles:
-            return "assistant"
-        return sorted(assistant_roles)[0]
+class ActivationSummaryBatch:
+    """
+    Activation summaries for many texts and layers, stacked into one array.
+
+    Attributes:
+        summaries: Float32 array of shape (texts, layers, locations, hidden).
+                   Entries for locations that were not found are zero.
+        mask: Boolean array of shape (texts, locations), True where the location
+              was found in the text.
+        layers: Layer index for each position along the layer axis.
+        locations: Location name for each position along the location axis.
+    """
 
-    # Fallback
-    return "assistant"
+    def __init__(
+        self,
+        summaries: np.ndarray,
+        mask: np.ndarray,
+        layers: list[int],
+        locations: tuple[str, ...] = SUMMARY_LOCATIONS,
+    ):
+        self.summaries = summaries
+        self.mask = mask
+        self.layers = list(layers)
+        self.locations = tuple(locations)
+        self._layer_pos = {layer: i for i, layer in enumerate(self.layers)}
+
+    def __len__(self) -> int:
+        return self.summaries.shape[0]
+
+    def get(self, text_index: int, layer: int, location: str) -> np.ndarray | None:
+        """
+        Get one summary vector.
+
+        Args:
+            text_index: Index of the text in the batch
+            layer: Layer index
+            location: Location name from SUMMARY_LOCATIONS
+
+        Returns:
+            Vector of shape (hidden,), or None if the location was not found
+        """
+        loc_pos = self.locations.index(location)
+        if not self.mask[text_index, loc_pos]:
+            return None
+        return self.summaries[text_index, self._layer_pos[layer], loc_pos]
+
+    def to_summaries(self, text_index: int, layer: int) -> ActivationSummaries:
+        """
+        Convert one (text, layer) entry into an ActivationSummaries object.
+
+        Args:
+            text_index: Index of the text in the batch
+            layer: Layer index
+
+        Returns:
+            ActivationSummaries for the given text and layer
+        """
+        return ActivationSummaries(
+            **{
+                location: self.get(text_index, layer, location)
+                for location in self.locations
+            }
+        )
 
 
-def extract_activation_summaries(
+def resolve_summary_token_indices(
     activation_result: ActivationResult,
     role_name: str | None,
-    layer: int,
     text_index: int = 0,
-) -> ActivationSummaries:
+    assistant_role_name: str | None = None,
+) -> dict[str, list[int]]:
     """
-    Extract activation summaries for a specific role and task.
+    Find the token positions that make up each summary location of a text.
+
+    Only token ids, offsets and message ranges are used, so this works on an
+    ActivationResult whose activations have not been computed yet.
 
     Args:
-        activation_result: The result containing activations and tokenizer.
-        role_name: The name of the role to extract activations for.
-        layer: The layer to extract activations from.
+        activation_result: Result holding input_ids, offsets and message_ranges.
+        role_name: The name of the role assigned in the system prompt.
         text_index: The index of the text in the batch.
+        assistant_role_name: Role name used for responses by the chat template.
+                             Detected from the tokenizer if None.
 
     Returns:
-        ActivationSummaries object populated with extracted activations.
+        Dict mapping each name in SUMMARY_LOCATIONS to the token indices averaged
+        for that location. An empty list means the location was not found.
     """
     if not activation_result.message_ranges:
         raise ValueError(
@@ -181,6 +184,9 @@ def extract_activation_summaries(
     tokenizer = activation_result.tokenizer
     full_text = activation_result.decoded_texts[text_index]
 
+    if assistant_role_name is None:
+        assistant_role_name = _detect_assistant_role_name(tokenizer)
+
     # Helper to find message by role
     def find_message_range(role):
         for r in ranges:
@@ -188,77 +194,42 @@ def extract_activation_summaries(
                 return r
         return None
 
-    # Debug: print available roles
-    available_roles = [r["role"] for r in ranges]
-    print(f"DEBUG: Available roles in message_ranges: {available_roles}")
-
-    # Detect the assistant role name from the chat template
-    assistant_role_name = _detect_assistant_role_name(tokenizer)
-    print(f"DEBUG: Detected assistant role name from template: '{assistant_role_name}'")
-
     sys_range = find_message_range("system")
     user_range = find_message_range("user")
     asst_range = find_message_range(assistant_role_name)
 
     if not asst_range:
+        available_roles = [r["role"] for r in ranges]
         print(
             f"WARNING: No '{assistant_role_name}' role found in ranges. Available roles: {available_roles}"
         )
 
-    # Helper to calculate mean activation for a char range
-    def get_mean_activation_for_range(start, end):
-        indices = activation_result.get_token_indices_for_char_range(
+    def content_indices(start, end):
+        # Tokens covering the range, excluding special tokens
+        return activation_result.get_content_token_indices_for_char_range(
             text_index, start, end
         )
-        if not indices:
-            return None
-
-        # Filter special tokens
-        valid_indices = [
-            idx for idx in indices if input_ids[idx] not in tokenizer.all_special_ids
-        ]
-
-        if not valid_indices:
-            return None
 
-        acts = activation_result.activations[layer][text_index, valid_indices]
-        return acts.mean(dim=0).float().cpu().numpy()
+    def in_bounds(idx):
+        return [idx] if 0 <= idx < len(input_ids) else []
 
-    # 1. Calculate Averages
-    avg_system_prompt = (
-        get_mean_activation_for_range(sys_range["start"], sys_range["end"])
-        if sys_range
-        else None
-    )
-    avg_user_prompt = (
-        get_mean_activation_for_range(user_range["start"], user_range["end"])
-        if user_range
-        else None
-    )
-    avg_response = (
-        get_mean_activation_for_range(asst_range["start"], asst_range["end"])
-        if asst_range
-        else None
-    )
+    spans: dict[str, list[int]] = {location: [] for location in SUMMARY_LOCATIONS}
 
-    # First 10 tokens of response
-    avg_response_first_10 = None
-    if asst_range:
-        indices = activation_result.get_token_indices_for_char_range(
-            text_index, asst_range["start"], asst_range["end"]
+    # 1. Averages
+    if sys_range:
+        spans["avg_system_prompt"] = content_indices(
+            sys_range["start"], sys_range["end"]
         )
-        valid_indices = [
-            idx for idx in indices if input_ids[idx] not in tokenizer.all_special_ids
-        ]
-        if valid_indices:
-            first_10 = valid_indices[:10]
-            acts = activation_result.activations[layer][text_index, first_10]
-            avg_response_first_10 = acts.mean(dim=0).float().cpu().numpy()
+    if user_range:
+        spans["avg_user_prompt"] = content_indices(
+            user_range["start"], user_range["end"]
+        )
+    if asst_range:
+        spans["avg_response"] = content_indices(asst_range["start"], asst_range["end"])
+        # First 10 tokens of response
+        spans["avg_response_first_10_tokens"] = spans["avg_response"][:10]
 
     # 2. Specific Role Activations
-    at_role = None
-    at_role_period = None
-
     if sys_range and role_name:
         # Find role name within system prompt
         sys_text = full_text[sys_range["start"] : sys_range["end"]]
@@ -267,81 +238,204 @@ def extract_activation_summaries(
         if role_start_local != -1:
             role_start_global = sys_range["start"] + role_start_local
             role_end_global = role_start_global + len(role_name)
-
-            at_role = get_mean_activation_for_range(role_start_global, role_end_global)
+            spans["at_role"] = content_indices(role_start_global, role_end_global)
 
             # Find period after role
             period_idx_local = sys_text.find(".", role_start_local + len(role_name))
             if period_idx_local != -1:
                 period_start_global = sys_range["start"] + period_idx_local
-                period_end_global = period_start_global + 1
-
-                # Get token for period
                 period_indices = activation_result.get_token_indices_for_char_range(
-                    text_index, period_start_global, period_end_global
+                    text_index, period_start_global, period_start_global + 1
                 )
-                if period_indices:
-                    at_role_period = (
-                        activation_result.activations[layer][
-                            text_index, period_indices[0]
-                        ]
-                        .float()
-                        .cpu()
-                        .numpy()
-                    )
+                spans["at_role_period"] = period_indices[:1]
 
     # 3. Special Tokens (Start/End)
-    # We look for tokens immediately adjacent to the content ranges
-    at_end_system = None
-    at_end_user = None
-    at_start_response = None
-
-    def get_token_at_index(idx):
-        if 0 <= idx < len(input_ids):
-            return (
-                activation_result.activations[layer][text_index, idx]
-                .float()
-                .cpu()
-                .numpy()
-            )
-        return None
-
+    # The token *after* the last content token is likely the end delimiter, and
+    # the token *before* the first response token is likely the start delimiter
     if sys_range:
-        # The token *after* the last content token is likely the end delimiter
-        # But we need to be careful. get_token_indices_for_char_range returns indices covering the content.
-        # The token *after* the last one in that list might be the delimiter.
         indices = activation_result.get_token_indices_for_char_range(
             text_index, sys_range["start"], sys_range["end"]
         )
         if indices:
-            last_content_token = indices[-1]
-            at_end_system = get_token_at_index(last_content_token + 1)
+            spans["at_end_system_prompt"] = in_bounds(indices[-1] + 1)
 
     if user_range:
         indices = activation_result.get_token_indices_for_char_range(
             text_index, user_range["start"], user_range["end"]
         )
         if indices:
-            last_content_token = indices[-1]
-            at_end_user = get_token_at_index(last_content_token + 1)
+            spans["at_end_user_prompt"] = in_bounds(indices[-1] + 1)
 
     if asst_range:
-        # The token *before* the first content token is likely the start delimiter
         indices = activation_result.get_token_indices_for_char_range(
             text_index, asst_range["start"], asst_range["end"]
         )
         if indices:
-            first_content_token = indices[0]
-            at_start_response = get_token_at_index(first_content_token - 1)
-
-    return ActivationSummaries(
-        avg_system_prompt=avg_system_prompt,
-        avg_user_prompt=avg_user_prompt,
-        avg_response=avg_response,
-        avg_response_first_10_tokens=avg_response_first_10,
-        at_role=at_role,
-        at_role_period=at_role_period,
-        at_end_system_prompt=at_end_system,
-        at_end_user_prompt=at_end_user,
-        at_start_agent_response=at_start_response,
+            spans["at_start_agent_response"] = in_bounds(indices[0] - 1)
+
+    return spans
+
+
+def summary_pooling_weights(
+    token_indices: list[dict[str, list[int]]], seq_len: int
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Build averaging weights that pool token activations into summary locations.
+
+    Multiplying the weights with activations of shape (texts, seq_len, hidden)
+    yields the summaries of shape (texts, locations, hidden) in one batched matmul.
+
+    Args:
+        token_indices: Per-text output of resolve_summary_token_indices.
+        seq_len: Sequence length of the activations the weights are applied to.
+
+    Returns:
+        Tuple of float32 weights (texts, locations, seq_len) and a boolean mask
+        (texts, locations) marking the locations that were found.
+    """
+    weights = torch.zeros(len(token_indices), len(SUMMARY_LOCATIONS), seq_len)
+    mask = torch.zeros(len(token_indices), len(SUMMARY_LOCATIONS), dtype=torch.bool)
+
+    for text_pos, spans in enumerate(token_indices):
+        for loc_pos, location in enumerate(SUMMARY_LOCATIONS):
+            indices = spans[location]
+            if indices:
+                weights[text_pos, loc_pos, indices] = 1.0 / len(indices)
+                mask[text_pos, loc_pos] = True
+
+    return weights, mask
+
+
+def extract_activation_summaries(
+    activation_result: ActivationResult,
+    role_name: str | None,
+    layer: int,
+    text_index: int = 0,
+) -> ActivationSummaries:
+    """
+    Extract activation summaries for a specific role and task.
+
+    Args:
+        activation_result: The result containing activations and tokenizer.
+        role_name: The name of the role to extract activations for.
+        layer: The layer to extract activations from.
+        text_index: The index of the text in the batch.
+
+    Returns:
+        ActivationSummaries object populated with extracted activations.
+    """
+    if not activation_result.message_ranges:
+        raise ValueError(
+            "ActivationResult must contain message_ranges for extraction. "
+            "Ensure you passed a list of chat messages to "
+            "ActivationExtractor.extract()."
+        )
+
+    # Debug: print available roles
+    ranges = activation_result.message_ranges[text_index]
+    available_roles = [r["role"] for r in ranges]
+    print(f"DEBUG: Available roles in message_ranges: {available_roles}")
+
+    # Detect the assistant role name from the chat template
+    assistant_role_name = _detect_assistant_role_name(activation_result.tokenizer)
+    print(f"DEBUG: Detected assistant role name from template: '{assistant_role_name}'")
+
+    spans = resolve_summary_token_indices(
+        activation_result,
+        role_name,
+        text_index=text_index,
+        assistant_role_name=assistant_role_name,
     )
+
+    acts = activation_result.activations[layer][text_index]
+
+    summaries = {}
+    for location, indices in spans.items():
+        if indices:
+            summaries[location] = acts[indices].mean(dim=0).float().cpu().numpy()
+        else:
+            summaries[location] = None
+
+    return ActivationSummaries(**summaries)
+
+
+def extract_activation_summaries_batch(
+    activation_result: ActivationResult,
+    role_names: list[str | None],
+    layers: list[int] | None = None,
+) -> ActivationSummaryBatch:
+    """
+    Extract activation summaries for every text and layer of a result at once.
+
+    Spans are resolved once per text, and the tokens of every location are
+    gathered for all layers in a single indexed operation and averaged with one
+    index_add, instead of one extract_activation_summaries call per (text, layer).
+
+    Args:
+        activation_result: The result containing activations and tokenizer.
+        role_names: The role assigned in each text's system prompt (or None).
+        layers: Layers to summarize. Defaults to all layers in the result.
+
+    Returns:
+        ActivationSummaryBatch with summaries of shape
+        (texts, layers, locations, hidden).
+    """
+    num_texts = activation_result.input_ids.shape[0]
+    if len(role_names) != num_texts:
+        raise ValueError(f"Got {len(role_names)} role names for {num_texts} texts")
+
+    if layers is None:
+        layers = list(activation_result.activations.keys())
+
+    assistant_role_name = _detect_assistant_role_name(activation_result.tokenizer)
+    token_indices = [
+        resolve_summary_token_indices(
+            activation_result, role_name, text_index, assistant_role_name
+        )
+        for text_index, role_name in enumerate(role_names)
+    ]
+
+    # Flatten every (text, location, token) triple into index and weight vectors
+    num_locations = len(SUMMARY_LOCATIONS)
+    text_idx: list[int] = []
+    token_idx: list[int] = []
+    segment_idx: list[int] = []
+    weights: list[float] = []
+    mask = np.zeros((num_texts, num_locations), dtype=bool)
+
+    for text_pos, spans in enumerate(token_indices):
+        for loc_pos, location in enumerate(SUMMARY_LOCATIONS):
+            indices = spans[location]
+            if not indices:
+                continue
+            mask[text_pos, loc_pos] = True
+            text_idx.extend([text_pos] * len(indices))
+            token_idx.extend(indices)
+            segment_idx.extend([text_pos * num_locations + loc_pos] * len(indices))
+            weights.extend([1.0 / len(indices)] * len(indices))
+
+    layer_acts = [activation_result.activations[layer] for layer in layers]
+    hidden_size = layer_acts[0].shape[-1]
+    device = layer_acts[0].device
+
+    pooled = torch.zeros(
+        (num_texts * num_locations, len(layers), hidden_size), device=device
+    )
+    if text_idx:
+        rows = torch.tensor(text_idx, device=device)
+        cols = torch.tensor(token_idx, device=device)
+        # (tokens, layers, hidden)
+        gathered = torch.stack([acts[rows, cols] for acts in layer_acts], dim=1)
+        gathered = (
+            gathered.float() * torch.tensor(weights, device=device)[:, None, None]
+        )
+        pooled.index_add_(0, torch.tensor(segment_idx, device=device), gathered)
+
+    summaries = (
+        pooled.view(num_texts, num_locations, len(layers), hidden_size)
+        .transpose(1, 2)
+        .cpu()
+        .numpy()
+    )
+
+    return ActivationSummaryBatch(summaries=summaries, mask=mask, layers=layers)
@@ -2,13 +2,28 @@
 ActivationExtractor - Extract hidden state activations from model layers.
 """
 
+from collections.abc import Callable
+
 import torch
 import torch.nn as nn
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
+from animacy.models.batching import plan_batches
+
+from .data import (
+    SUMMARY_LOCATIONS,
+    ActivationSummaryBatch,
+    _detect_assistant_role_name,
+    resolve_summary_token_indices,
+    summary_pooling_weights,
+)
 from .token_mapper import ActivationResult
 
 
+class _StopForward(Exception):
+    """Raised from a hook to end the forward pass once all requested layers ran."""
+
+
 class ActivationExtractor:
     """
     Extract activations from model layers using forward hooks.
@@ -129,57 +144,246 @@ class ActivationExtractor:
         prompts: str | list[str] | list[list[dict]],
         layers: list[int] | None = None,
         batch_size: int = 8,
+        max_batch_tokens: int | None = None,
+        early_exit: bool = True,
     ) -> ActivationResult:
         """
         Extract activations for the given text(s) or chat messages.
 
+        Inputs are sorted by token length and run in micro-batches, so padding is
+        only added up to the longest text of each batch. Activations are written
+        into preallocated per-layer buffers and returned in the original order.
+
         Args:
             prompts: Input text, list of texts, or list of chat histories (list of dicts).
                      If chat histories are provided, precise message alignment is performed.
             layers: List of layer indices to extract from. If None, extracts from all layers.
-            batch_size: Batch size for processing multiple texts
+            batch_size: Maximum number of texts per forward pass
+            max_batch_tokens: Optional budget on padded tokens (rows x longest row)
+                              per forward pass. A single text longer than the budget
+                              still runs on its own.
+            early_exit: Stop each forward pass once the deepest requested layer has
+                        run, skipping the remaining layers and the output head.
 
         Returns:
             ActivationResult containing activations and token mapping info
         """
-        texts = []
-        message_ranges = None
+        texts, message_ranges = self._prepare_texts(prompts)
+        layers = self._validate_layers(layers)
+        encodings = self._tokenize(texts)
+
+        input_ids = encodings["input_ids"]
+        num_texts, seq_len = input_ids.shape
+
+        # Per-layer output buffers, allocated on first use once the hidden size
+        # and dtype are known. Positions past a text's batch width stay zero.
+        activations: dict[int, torch.Tensor] = {}
+
+        def capture(layer_idx, hidden_states, rows, cols):
+            if layer_idx not in activations:
+                activations[layer_idx] = torch.zeros(
+                    (num_texts, seq_len, hidden_states.shape[-1]),
+                    dtype=hidden_states.dtype,
+                )
+
+            # Detach and move to CPU to save GPU memory
+            # Shape: (batch_size, batch_seq_len, hidden_size)
+            activations[layer_idx][rows, cols] = hidden_states.detach().cpu()
+
+        self._forward_batches(
+            encodings, layers, capture, batch_size, max_batch_tokens, early_exit
+        )
+
+        for layer_idx in layers:
+            if layer_idx not in activations:
+                raise RuntimeError(
+                    f"No activations captured for layer {layer_idx}. "
+                    f"Hook may not have fired. Model: {self.model_name}"
+                )
+
+        return ActivationResult(
+            activations={layer_idx: activations[layer_idx] for layer_idx in layers},
+            input_ids=input_ids,
+            offset_mapping=encodings["offset_mapping"],
+            tokenizer=self.tokenizer,
+            texts=texts,
+            message_ranges=message_ranges,
+            attention_mask=encodings["attention_mask"],
+        )
+
+    def extract_summaries(
+        self,
+        chat_histories: list[list[dict]],
+        role_names: list[str | None],
+        layers: list[int] | None = None,
+        batch_size: int = 8,
+        max_batch_tokens: int | None = None,
+        early_exit: bool = True,
+    ) -> ActivationSummaryBatch:
+        """
+        Extract pooled activation summaries without keeping per-token activations.
 
+        Summary spans (see SUMMARY_LOCATIONS) are resolved from the tokenization
+        before the forward pass. Each hook then averages its layer's hidden states
+        over those spans on the model's device, and only the pooled
+        (batch, locations, hidden) tensor is copied to the host.
+
+        Args:
+            chat_histories: List of chat histories (list of message dicts).
+            role_names: Role assigned in each history's system prompt (or None).
+            layers: List of layer indices to extract from. If None, extracts from
+                    all layers.
+            batch_size: Maximum number of texts per forward pass
+            max_batch_tokens: Optional budget on padded tokens per forward pass
+            early_exit: Stop each forward pass once the deepest requested layer has run
+
+        Returns:
+            ActivationSummaryBatch with summaries of shape
+            (texts, layers, locations, hidden)
+        """
+        if len(role_names) != len(chat_histories):
+            raise ValueError(
+                f"Got {len(role_names)} role names for {len(chat_histories)} "
+                "chat histories"
+            )
+
+        texts, message_ranges = self._prepare_texts(chat_histories)
+        if message_ranges is None:
+            raise ValueError("extract_summaries requires chat histories as input")
+        layers = self._validate_layers(layers)
+        encodings = self._tokenize(texts)
+
+        # Resolve span positions from the tokenization alone
+        token_map = ActivationResult(
+            activations={},
+            input_ids=encodings["input_ids"],
+            offset_mapping=encodings["offset_mapping"],
+            tokenizer=self.tokenizer,
+            texts=texts,
+            message_ranges=message_ranges,
+            attention_mask=encodings["attention_mask"],
+        )
+        assistant_role_name = _detect_assistant_role_name(self.tokenizer)
+        token_indices = [
+            resolve_summary_token_indices(
+                token_map, role_name, text_index, assistant_role_name
+            )
+            for text_index, role_name in enumerate(role_names)
+        ]
+        weights, mask = summary_pooling_weights(
+            token_indices, encodings["input_ids"].shape[1]
+        )
+
+        layer_pos = {layer_idx: i for i, layer_idx in enumerate(layers)}
+        summaries: torch.Tensor | None = None
+        # Weights for the batch currently in flight, moved to the device once
+        batch_weights: dict = {}
+
+        def capture(layer_idx, hidden_states, rows, cols):
+            nonlocal summaries
+            if (
+                batch_weights.get("rows") is not rows
+                or batch_weights["weights"].dtype != hidden_states.dtype
+            ):
+                batch_weights["rows"] = rows
+                batch_weights["weights"] = weights[rows][:, :, cols].to(
+                    hidden_states.device, hidden_states.dtype
+                )
+
+            # Pool in the activations' own dtype so no float32 copy of the full
+            # (batch, seq, hidden) states is made; only the small pooled result
+            # is upcast.
+            # (batch, locations, seq) @ (batch, seq, hidden)
+            # -> (batch, locations, hidden)
+            pooled = torch.bmm(batch_weights["weights"], hidden_states.detach())
+
+            if summaries is None:
+                summaries = torch.zeros(
+                    (len(texts), len(layers), len(SUMMARY_LOCATIONS), pooled.shape[-1])
+                )
+            summaries[rows, layer_pos[layer_idx]] = pooled.cpu().to(torch.float32)
+
+        self._forward_batches(
+            encodings, layers, capture, batch_size, max_batch_tokens, early_exit
+        )
+
+        if summaries is None:
+            raise RuntimeError(
+                f"No activations captured for layers {layers}. "
+                f"Hooks may not have fired. Model: {self.model_name}"
+            )
+
+        return ActivationSummaryBatch(
+            summaries=summaries.numpy(), mask=mask.numpy(), layers=layers
+        )
+
+    def _prepare_texts(
+        self, prompts: str | list[str] | list[list[dict]]
+    ) -> tuple[list[str], list[list[dict]] | None]:
+        """
+        Normalize the supported prompt formats into texts.
+
+        Args:
+            prompts: Input text, list of texts, or list of chat histories.
+
+        Returns:
+            Tuple of (texts, message ranges or None if input was not chat messages)
+        """
         # Handle different input types
         if isinstance(prompts, str):
-            texts = [prompts]
+            return [prompts], None
         elif isinstance(prompts, list):
             if not prompts:
                 raise ValueError("Prompts list cannot be empty")
 
             if isinstance(prompts[0], str):
-                texts = prompts  # type: ignore
+                return prompts, None  # type: ignore
             elif isinstance(prompts[0], list) and isinstance(prompts[0][0], dict):
                 # List of chat histories
-                texts, message_ranges = self._process_chat_inputs(prompts)  # type: ignore
-            else:
-                raise ValueError(
-                    "Invalid prompt format. Must be str, list[str], or list[list[dict]]"
-                )
-        else:
+                return self._process_chat_inputs(prompts)  # type: ignore
+
+        raise ValueError(
+            "Invalid prompt format. Must be str, list[str], or list[list[dict]]"
+        )
+
+    def _validate_layers(self, layers: list[int] | None) -> list[int]:
+        """
+        Resolve the requested layer indices, defaulting to all layers.
+
+        Args:
+            layers: Requested layer indices or None
+
+        Returns:
+            List of valid layer indices
+        """
+        num_layers = len(self._layers)
+        if layers is None:
+            return list(range(num_layers))
+
+        # Validate layer indices
+        invalid_layers = [l for l in layers if l < 0 or l >= num_layers]
+        if invalid_layers:
             raise ValueError(
-                "Invalid prompt format. Must be str, list[str], or list[list[dict]]"
+                f"Invalid layer indices {invalid_layers}. "
+                f"Model {self.model_name} has {num_layers} layers "
+                f"(valid indices: 0-{num_layers - 1})"
             )
+        return list(layers)
 
-        if layers is None:
-            layers = list(range(len(self._layers)))
-        else:
-            # Validate layer indices
-            num_layers = len(self._layers)
-            invalid_layers = [l for l in layers if l < 0 or l >= num_layers]
-            if invalid_layers:
-                raise ValueError(
-                    f"Invalid layer indices {invalid_layers}. "
-                    f"Model {self.model_name} has {num_layers} layers (valid indices: 0-{num_layers - 1})"
-                )
+    def _tokenize(self, texts: list[str]):
+        """
+        Tokenize all texts at once, padded to the longest text overall.
+
+        Each micro-batch later takes a slice that is only as wide as its own
+        longest text.
+
+        Args:
+            texts: Texts to tokenize
 
-        # Tokenize
-        encodings = self.tokenizer(
+        Returns:
+            BatchEncoding with input_ids, attention_mask and offset_mapping on CPU
+        """
+        return self.tokenizer(
             texts,
             return_tensors="pt",
             padding=True,
@@ -188,16 +392,45 @@ class ActivationExtractor:
             add_special_tokens=False,  # We assume chat template handles this or user provided raw text
         )
 
-        input_ids = encodings["input_ids"].to(self.model.device)
-        attention_mask = encodings["attention_mask"].to(self.model.device)
-        offset_mapping = encodings["offset_mapping"]  # Keep on CPU
+    def _forward_batches(
+        self,
+        encodings,
+        layers: list[int],
+        capture: Callable[[int, torch.Tensor, torch.Tensor, slice], None],
+        batch_size: int,
+        max_batch_tokens: int | None,
+        early_exit: bool = True,
+    ) -> None:
+        """
+        Run the model over length-sorted micro-batches with hooks on the given layers.
+
+        Args:
+            encodings: Output of _tokenize
+            layers: Layer indices to hook
+            capture: Called from each hook as
+                     capture(layer_idx, hidden_states, rows, cols), where rows
+                     indexes the batch's texts and cols is the slice of the
+                     padded sequence the batch covers.
+            batch_size: Maximum number of texts per forward pass
+            max_batch_tokens: Optional budget on padded tokens per forward pass
+            early_exit: If True, the hook on the deepest requested layer aborts the
+                        forward pass after capturing, so later layers and the
+                        vocab projection are never computed.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+        input_ids = encodings["input_ids"]
+        attention_mask = encodings["attention_mask"]
+        num_texts, seq_len = input_ids.shape
+        lengths = attention_mask.sum(dim=1).tolist()
+        batches = plan_batches(lengths, batch_size, max_batch_tokens)
+        left_padded = self.tokenizer.padding_side == "left"
 
-        # Prepare hooks
-        activations: dict[int, list[torch.Tensor]] = {
-            layer_idx: [] for layer_idx in layers
-        }
         handles = []
         hook_fired = {layer_idx: False for layer_idx in layers}
+        current: dict = {}
+        last_layer = max(layers)
 
         def create_hook(layer_idx):
             def hook(module, input, output):
@@ -208,9 +441,10 @@ class ActivationExtractor:
                 else:
                     hidden_states = output
 
-                # Detach and move to CPU to save GPU memory
-                # Shape: (batch_size, seq_len, hidden_size)
-                activations[layer_idx].append(hidden_states.detach().cpu())
+                capture(layer_idx, hidden_states, current["rows"], current["cols"])
+
+                if early_exit and layer_idx == last_layer:
+                    raise _StopForward
 
             return hook
 
@@ -225,11 +459,31 @@ class ActivationExtractor:
             handles.append(handle)
 
         try:
-            # Process in batches if needed (though here we just did one big batch for simplicity
-            # based on the tokenizer call above. For very large inputs, we'd loop.)
-            print(f"DEBUG: Running forward pass with input_ids shape {input_ids.shape}")
-            with torch.no_grad():
-                self.model(input_ids=input_ids, attention_mask=attention_mask)
+            print(
+                f"DEBUG: Running {len(batches)} forward passes for {num_texts} texts "
+                f"(max length {seq_len})"
+            )
+            for batch_rows in batches:
+                batch_len = max(lengths[i] for i in batch_rows)
+                if left_padded:
+                    cols = slice(seq_len - batch_len, seq_len)
+                else:
+                    cols = slice(0, batch_len)
+                rows = torch.tensor(batch_rows)
+                current["rows"] = rows
+                current["cols"] = cols
+
+                with torch.no_grad():
+                    try:
+                        self.model(
+                            input_ids=input_ids[rows, cols].to(self.model.device),
+                            attention_mask=attention_mask[rows, cols].to(
+                                self.model.device
+                            ),
+                            use_cache=False,
+                        )
+                    except _StopForward:
+                        pass
             print(f"DEBUG: Forward pass complete")
 
         finally:
@@ -241,25 +495,6 @@ class ActivationExtractor:
         if unfired_hooks:
             print(f"WARNING: Hooks did not fire for layers: {unfired_hooks}")
 
-        # Collate activations
-        final_activations = {}
-        for layer_idx, act_list in activations.items():
-            if not act_list:
-                raise RuntimeError(
-                    f"No activations captured for layer {layer_idx}. "
-                    f"Hook may not have fired. Model: {self.model_name}"
-                )
-            final_activations[layer_idx] = torch.cat(act_list, dim=0)
-
-        return ActivationResult(
-            activations=final_activations,
-            input_ids=input_ids.cpu(),
-            offset_mapping=offset_mapping,
-            tokenizer=self.tokenizer,
-            texts=texts,
-            message_ranges=message_ranges,
-        )
-
     def _process_chat_inputs(
         self, chat_histories: list[list[dict]]
     ) -> tuple[list[str], list[list[dict]]]:
@@ -272,8 +507,6 @@ class ActivationExtractor:
         Returns:
             Tuple of (list of full texts, list of message ranges)
         """
-        from ..activations.data import _detect_assistant_role_name
-
         # Detect the expected assistant role name for this tokenizer
         expected_assistant_role = _detect_assistant_role_name(self.tokenizer)
 
@@ -0,0 +1,462 @@
+"""
+SummaryStore - Columnar, memory-mapped storage for activation summaries.
+
+Layout of a store directory::
+
+    meta.json                       hidden size, dtype and location names
+    layer{L}/{location}.bin         raw (rows, hidden) float32 vectors
+    index/part-00000.parquet, ...   key index fragments
+
+Each index row maps a key (role_name, task_name, sample_idx, condition) and a
+layer to a row of that layer's vector files, with one boolean column per
+location marking whether the location was found. Vectors are appended to the
+binary files first, and the index fragment written afterwards (atomically) is
+the commit point, so an interrupted append is simply overwritten by the next one.
+"""
+
+import json
+import os
+import re
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .data import SUMMARY_LOCATIONS, ActivationSummaryBatch
+
+#: Columns identifying one summarized response.
+KEY_COLUMNS: tuple[str, ...] = ("role_name", "task_name", "sample_idx", "condition")
+
+
+class SummaryStore:
+    """
+    Append-only store of activation summaries with zero-copy reads.
+
+    Vectors for each (layer, location) live in one flat float32 file that is
+    read through np.memmap, and a Parquet index maps keys to rows.
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(
+        self, root: str | Path, locations: tuple[str, ...] = SUMMARY_LOCATIONS
+    ):
+        """
+        Open (or create) a store.
+
+        Args:
+            root: Directory of the store.
+            locations: Location names, used when creating a new store.
+        """
+        self.root = Path(root)
+        self._index_dir = self.root / "index"
+        self._meta_path = self.root / "meta.json"
+
+        if self._meta_path.exists():
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.hidden_size: int | None = meta["hidden_size"]
+            self.locations = tuple(meta["locations"])
+        else:
+            self.hidden_size = None
+            self.locations = tuple(locations)
+
+        self._index: pd.DataFrame | None = None
+        # Write position, read from the index once and then kept up to date
+        self._row_counts: dict[int, int] | None = None
+        self._next_fragment_id: int | None = None
+
+    # ------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------
+
+    def _fragments(self) -> list[Path]:
+        if not self._index_dir.exists():
+            return []
+        return sorted(self._index_dir.glob("part-*.parquet"))
+
+    @property
+    def index(self) -> pd.DataFrame:
+        """
+        Committed index rows, with later entries for the same key and layer
+        replacing earlier ones.
+        """
+        if self._index is None:
+            fragments = [pd.read_parquet(path) for path in self._fragments()]
+            if fragments:
+                index = pd.concat(fragments, ignore_index=True)
+                index = index.drop_duplicates(
+                    subset=[*KEY_COLUMNS, "layer"], keep="last"
+                ).reset_index(drop=True)
+                # The no-role condition is stored as a null role name
+                role_names = index["role_name"].astype(object)
+                index["role_name"] = role_names.where(role_names.notna(), None)
+            else:
+                index = pd.DataFrame(
+                    columns=[*KEY_COLUMNS, "layer", "row", *self.locations]
+                )
+            self._index = index
+        return self._index
+
+    @property
+    def layers(self) -> list[int]:
+        """Layers present in the store."""
+        return sorted(int(layer) for layer in self.index["layer"].unique())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def completed(self) -> set[tuple]:
+        """
+        Keys already stored.
+
+        Returns:
+            Set of (role_name, task_name, sample_idx, condition, layer) tuples
+        """
+        columns = [self.index[c] for c in (*KEY_COLUMNS, "layer")]
+        return {
+            (role, task, int(sample_idx), condition, int(layer))
+            for role, task, sample_idx, condition, layer in zip(*columns, strict=True)
+        }
+
+    def _committed_rows(self) -> dict[int, int]:
+        """
+        Number of committed vector rows per layer.
+
+        The index is scanned on first use only; append keeps the counts current.
+        """
+        if self._row_counts is None:
+            rows: dict[int, int] = {}
+            for fragment in self._fragments():
+                part = pd.read_parquet(fragment, columns=["layer", "row"])
+                for layer, max_row in part.groupby("layer")["row"].max().items():
+                    rows[int(layer)] = max(rows.get(int(layer), 0), int(max_row) + 1)
+            self._row_counts = rows
+        return self._row_counts
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _vector_path(self, layer: int, location: str) -> Path:
+        return self.root / f"layer{layer}" / f"{location}.bin"
+
+    def _write_meta(self, hidden_size: int) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "hidden_size": hidden_size,
+            "dtype": self.dtype.name,
+            "locations": list(self.locations),
+        }
+        tmp_path = self._meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self._meta_path)
+        self.hidden_size = hidden_size
+
+    def append(
+        self, batch: ActivationSummaryBatch, keys: list[Mapping], condition: str
+    ) -> None:
+        """
+        Append a batch of summaries and commit it to the index.
+
+        Args:
+            batch: Summaries of shape (texts, layers, locations, hidden).
+            keys: One mapping per text with role_name, task_name and sample_idx.
+            condition: Condition label shared by the batch (e.g. "with_sys").
+        """
+        if len(keys) != len(batch):
+            raise ValueError(f"Got {len(keys)} keys for {len(batch)} summaries")
+        if tuple(batch.locations) != self.locations:
+            raise ValueError(
+                f"Batch locations {batch.locations} do not match store locations "
+                f"{self.locations}"
+            )
+        if len(batch) == 0:
+            return
+
+        hidden_size = batch.summaries.shape[-1]
+        if self.hidden_size is None:
+            self._write_meta(hidden_size)
+        elif hidden_size != self.hidden_size:
+            raise ValueError(
+                f"Hidden size {hidden_size} does not match store hidden size "
+                f"{self.hidden_size}"
+            )
+
+        committed = self._committed_rows()
+        row_bytes = hidden_size * self.dtype.itemsize
+        records = []
+
+        for layer_pos, layer in enumerate(batch.layers):
+            start_row = committed.get(layer, 0)
+            (self.root / f"layer{layer}").mkdir(parents=True, exist_ok=True)
+
+            for loc_pos, location in enumerate(self.locations):
+                vectors = np.ascontiguousarray(
+                    batch.summaries[:, layer_pos, loc_pos], dtype=self.dtype
+                )
+                path = self._vector_path(layer, location)
+                with open(path, "r+b" if path.exists() else "wb") as f:
+                    # Drop rows left behind by an append that never committed
+                    f.truncate(start_row * row_bytes)
+                    f.seek(start_row * row_bytes)
+                    f.write(vectors.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            for text_pos, key in enumerate(keys):
+                record = {
+                    "role_name": key["role_name"],
+                    "task_name": key["task_name"],
+                    "sample_idx": int(key["sample_idx"]),
+                    "condition": condition,
+                    "layer": int(layer),
+                    "row": start_row + text_pos,
+                }
+                for loc_pos, location in enumerate(self.locations):
+                    record[location] = bool(batch.mask[text_pos, loc_pos])
+                records.append(record)
+
+        self._commit(pd.DataFrame.from_records(records))
+        for layer in batch.layers:
+            committed[layer] = committed.get(layer, 0) + len(keys)
+
+    def _commit(self, fragment: pd.DataFrame) -> None:
+        """Write an index fragment atomically."""
+        self._index_dir.mkdir(parents=True, exist_ok=True)
+        if self._next_fragment_id is None:
+            existing = self._fragments()
+            self._next_fragment_id = (
+                int(existing[-1].stem.split("-")[1]) + 1 if existing else 0
+            )
+        next_id = self._next_fragment_id
+        path = self._index_dir / f"part-{next_id:05d}.parquet"
+        tmp_path = self._index_dir / f".part-{next_id:05d}.parquet.tmp"
+        fragment.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        self._next_fragment_id = next_id + 1
+        self._index = None
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def vectors(self, layer: int, location: str) -> np.ndarray:
+        """
+        Memory-mapped vectors for one (layer, location).
+
+        Args:
+            layer: Layer index
+            location: Location name
+
+        Returns:
+            Read-only array of shape (rows, hidden), indexed by the index "row" column.
+        """
+        if self.hidden_size is None:
+            raise KeyError(f"Store {self.root} is empty")
+        path = self._vector_path(layer, location)
+        if not path.exists():
+            raise KeyError(f"No vectors for layer {layer}, location '{location}'")
+
+        num_rows = path.stat().st_size // (self.hidden_size * self.dtype.itemsize)
+        if num_rows == 0:
+            return np.empty((0, self.hidden_size), dtype=self.dtype)
+        return np.memmap(
+            path, dtype=self.dtype, mode="r", shape=(num_rows, self.hidden_size)
+        )
+
+    def load(
+        self, layer: int, location: str, **filters
+    ) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Load the vectors of one (layer, location) for the matching keys.
+
+        Rows where the location was not found are dropped.
+
+        Args:
+            layer: Layer index
+            location: Location name
+            **filters: Equality filters on key columns (e.g. condition="with_sys")
+
+        Returns:
+            Tuple of (key DataFrame, array of shape (rows, hidden)). When no
+            filters apply and rows are stored in order, the array is a view of
+            the memory map rather than a copy.
+        """
+        index = self.index[self.index["layer"] == layer]
+        for column, value in filters.items():
+            if column not in KEY_COLUMNS:
+                raise ValueError(f"Unknown key column '{column}'")
+            index = index[index[column] == value]
+        index = index[index[location].astype(bool)].sort_values("row")
+
+        vectors = self.vectors(layer, location)
+        rows = index["row"].to_numpy(dtype=np.int64)
+        if len(rows) and np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+            selected = vectors[rows[0] : rows[0] + len(rows)]
+        else:
+            selected = vectors[rows]
+
+        return index[list(KEY_COLUMNS)].reset_index(drop=True), selected
+
+    def get(
+        self,
+        layer: int,
+        location: str,
+        role_name: str | None,
+        task_name: str,
+        sample_idx: int,
+        condition: str,
+    ) -> np.ndarray | None:
+        """
+        Get a single summary vector.
+
+        Returns:
+            Zero-copy view of shape (hidden,), or None if missing or not found.
+        """
+        index = self.index
+        match = index[
+            (index["layer"] == layer)
+            & (index["task_name"] == task_name)
+            & (index["sample_idx"] == sample_idx)
+            & (index["condition"] == condition)
+            & (
+                index["role_name"].isna()
+                if role_name is None
+                else index["role_name"] == role_name
+            )
+        ]
+        if match.empty or not bool(match.iloc[-1][location]):
+            return None
+        return self.vectors(layer, location)[int(match.iloc[-1]["row"])]
+
+
+_SUMMARY_STEM = re.compile(r"^(?P<prefix>.+)_(?P<sample_idx>\d+)_layer(?P<layer>\d+)$")
+
+
+def parse_summary_stem(
+    stem: str, task_names: Iterable[str]
+) -> tuple[str | None, str, int, int]:
+    """
+    Parse a legacy summary filename stem.
+
+    Stems have the form {role_name}_{task_name}_{sample_idx}_layer{layer}. Role and
+    task names may both contain underscores, so the task is matched against the
+    known task names (longest first).
+
+    Args:
+        stem: Filename stem
+        task_names: Known task names
+
+    Returns:
+        Tuple of (role_name, task_name, sample_idx, layer). role_name is None for
+        the no-role condition, which was written as "None".
+    """
+    match = _SUMMARY_STEM.match(stem)
+    if match is None:
+        raise ValueError(f"Unrecognized summary filename '{stem}'")
+
+    prefix = match["prefix"]
+    for task_name in sorted(task_names, key=len, reverse=True):
+        if prefix.endswith(f"_{task_name}"):
+            role_name: str | None = prefix[: -len(task_name) - 1]
+            if role_name == "None":
+                role_name = None
+            return role_name, task_name, int(match["sample_idx"]), int(match["layer"])
+
+    raise ValueError(f"No known task name in summary filename '{stem}'")
+
+
+def convert_json_summaries(
+    summaries_dir: str | Path,
+    store: SummaryStore,
+    condition: str,
+    task_names: Iterable[str] | None = None,
+    chunk_size: int = 1024,
+) -> int:
+    """
+    Convert a directory of per-file JSON summaries into a SummaryStore.
+
+    Records in which every location is None (e.g. empty responses) are stored
+    as fully masked rows. They are left for a later run if no record sizes an
+    empty store.
+
+    Args:
+        summaries_dir: Directory of {role}_{task}_{sample_idx}_layer{layer}.json files.
+        store: Destination store.
+        condition: Condition label for all converted summaries.
+        task_names: Known task names for filename parsing. Defaults to TASK_PROMPTS.
+        chunk_size: Number of files appended per commit.
+
+    Returns:
+        Number of summaries converted.
+    """
+    if task_names is None:
+        from animacy.prompts.tasks import TASK_PROMPTS
+
+        task_names = TASK_PROMPTS.keys()
+    task_names = list(task_names)
+
+    completed = store.completed()
+    by_layer: dict[int, list[tuple[dict, Path]]] = {}
+    for path in sorted(Path(summaries_dir).glob("*.json")):
+        role_name, task_name, sample_idx, layer = parse_summary_stem(
+            path.stem, task_names
+        )
+        if (role_name, task_name, sample_idx, condition, layer) in completed:
+            continue
+        key = {"role_name": role_name, "task_name": task_name, "sample_idx": sample_idx}
+        by_layer.setdefault(layer, []).append((key, path))
+
+    def append_chunk(layer, chunk, records, hidden_size):
+        summaries = np.zeros(
+            (len(chunk), 1, len(store.locations), hidden_size), dtype=np.float32
+        )
+        mask = np.zeros((len(chunk), len(store.locations)), dtype=bool)
+        for text_pos, record in enumerate(records):
+            for loc_pos, location in enumerate(store.locations):
+                value = record.get(location)
+                if value is not None:
+                    summaries[text_pos, 0, loc_pos] = value
+                    mask[text_pos, loc_pos] = True
+
+        batch = ActivationSummaryBatch(
+            summaries=summaries, mask=mask, layers=[layer], locations=store.locations
+        )
+        store.append(batch, [key for key, _ in chunk], condition=condition)
+        return len(chunk)
+
+    converted = 0
+    # Chunks in which every location is None (e.g. empty responses) carry no
+    # hidden size; they wait until the store knows it
+    deferred = []
+    for layer, entries in sorted(by_layer.items()):
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start : start + chunk_size]
+            records = []
+            for _, path in chunk:
+                with open(path, encoding="utf-8") as f:
+                    records.append(json.load(f))
+
+            hidden_size = next(
+                (
+                    len(value)
+                    for record in records
+                    for value in record.values()
+                    if value is not None
+                ),
+                store.hidden_size,
+            )
+            if hidden_size is None:
+                deferred.append((layer, chunk, records))
+                continue
+            converted += append_chunk(layer, chunk, records, hidden_size)
+
+    # Without any vector to size the store, deferred chunks are left for a later run
+    if store.hidden_size is not None:
+        for layer, chunk, records in deferred:
+            converted += append_chunk(layer, chunk, records, store.hidden_size)
+
+    return converted
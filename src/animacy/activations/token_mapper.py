@@ -5,6 +5,8 @@ TokenMapper - Helper classes for mapping text to tokens and activations.
 import torch
 from transformers import PreTrainedTokenizer
 
+from animacy.models.tokenizer_cache import get_tokenizer_artifacts
+
 
 class ActivationResult:
     """
@@ -16,8 +18,9 @@ class ActivationResult:
         offset_mapping: Token character offsets (batch, seq, 2).
         tokenizer: Tokenizer used.
         texts: Original input texts.
-        message_ranges: List of list of tuples (start_char, end_char, role) for each text.
-                        Only present if input was a list of messages.
+        message_ranges: List of list of tuples (start_char, end_char, role) for
+                        each text. Only present if input was a list of messages.
+        attention_mask: Attention mask (batch, seq), 0 at padding positions. May be None.
     """
 
     def __init__(
@@ -28,6 +31,7 @@ class ActivationResult:
         tokenizer: PreTrainedTokenizer,
         texts: list[str],
         message_ranges: list[list[dict]] | None = None,
+        attention_mask: torch.Tensor | None = None,
     ):
         """
         Initialize ActivationResult.
@@ -40,6 +44,7 @@ class ActivationResult:
             texts: Original input texts
             message_ranges: Optional metadata about message boundaries if input was chat messages.
                             Structure: [[{"start": int, "end": int, "role": str}, ...], ...]
+            attention_mask: Optional attention mask (batch, seq) marking real tokens
         """
         self.activations = activations
         self.input_ids = input_ids
@@ -47,10 +52,18 @@ class ActivationResult:
         self.tokenizer = tokenizer
         self.texts = texts
         self.message_ranges = message_ranges
+        self.attention_mask = attention_mask
         self.decoded_texts = tokenizer.batch_decode(
             input_ids, skip_special_tokens=False
         )
 
+        # Lazily built lookup structures, see _char_index and special_token_mask
+        self._char_index_cache: dict[
+            int, tuple[torch.Tensor, torch.Tensor, torch.Tensor, bool]
+        ] = {}
+        self._special_token_mask: torch.Tensor | None = None
+        self._special_positions_cache: dict[int, frozenset[int]] = {}
+
     def get_activations_for_text(self, text_index: int = 0) -> dict[int, torch.Tensor]:
         """
         Get all activations for a specific text in the batch.
@@ -82,13 +95,105 @@ class ActivationResult:
         """
         return self.activations[layer][text_index, token_index]
 
+    @property
+    def special_token_mask(self) -> torch.Tensor:
+        """
+        Boolean mask (batch, seq) marking positions that hold special tokens.
+
+        Computed once for the whole batch on first access.
+        """
+        if self._special_token_mask is None:
+            special_ids = get_tokenizer_artifacts(self.tokenizer).special_token_ids.to(
+                self.input_ids.dtype
+            )
+            self._special_token_mask = torch.isin(self.input_ids, special_ids)
+        return self._special_token_mask
+
+    def get_special_token_positions(self, text_index: int = 0) -> frozenset[int]:
+        """
+        Get the positions of special tokens in a text.
+
+        Args:
+            text_index: Index of the text in the batch
+
+        Returns:
+            Frozen set of token indices holding special tokens (cached per text)
+        """
+        positions = self._special_positions_cache.get(text_index)
+        if positions is None:
+            positions = frozenset(
+                torch.nonzero(self.special_token_mask[text_index]).squeeze(1).tolist()
+            )
+            self._special_positions_cache[text_index] = positions
+        return positions
+
+    def _char_index(
+        self, text_index: int
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, bool]:
+        """
+        Build (and cache) the char -> token lookup for a text.
+
+        Tokens with empty offsets (special tokens and padding usually map to (0, 0))
+        are dropped, leaving the start and end offsets of the remaining tokens.
+
+        Args:
+            text_index: Index of the text in the batch
+
+        Returns:
+            Tuple of (token positions, start offsets, end offsets, monotonic), where
+            monotonic is True when both offset columns are non-decreasing so that
+            ranges can be found with binary search.
+        """
+        cached = self._char_index_cache.get(text_index)
+        if cached is None:
+            offsets = torch.as_tensor(self.offset_mapping[text_index])  # (seq_len, 2)
+            positions = torch.nonzero(offsets[:, 0] != offsets[:, 1]).squeeze(1)
+            starts = offsets[positions, 0].contiguous()
+            ends = offsets[positions, 1].contiguous()
+            monotonic = bool(
+                (starts[1:] >= starts[:-1]).all() and (ends[1:] >= ends[:-1]).all()
+            )
+            cached = (positions, starts, ends, monotonic)
+            self._char_index_cache[text_index] = cached
+        return cached
+
+    def _token_positions_for_char_range(
+        self, text_index: int, start_char: int, end_char: int
+    ) -> torch.Tensor:
+        """
+        Token positions overlapping a character range, as a tensor.
+
+        Args:
+            text_index: Index of the text in the batch
+            start_char: Start character index (inclusive)
+            end_char: End character index (exclusive)
+
+        Returns:
+            1-D tensor of token indices in ascending order
+        """
+        positions, starts, ends, monotonic = self._char_index(text_index)
+
+        if not monotonic:
+            # Offsets out of order: fall back to a vectorized scan
+            overlap = (starts < end_char) & (ends > start_char)
+            return positions[overlap]
+
+        # Tokens where (token_start < end_char) and (token_end > start_char).
+        # With sorted offsets these form one contiguous run: from the first token
+        # ending after start_char up to the last token starting before end_char.
+        bounds = torch.tensor([start_char, end_char], dtype=starts.dtype)
+        lo = int(torch.searchsorted(ends, bounds[:1], right=True))
+        hi = int(torch.searchsorted(starts, bounds[1:], right=False))
+        return positions[lo:hi]
+
     def get_token_indices_for_char_range(
         self, text_index: int, start_char: int, end_char: int
     ) -> list[int]:
         """
         Get token indices that overlap with a specific character range.
 
-        Uses offset_mapping for efficient lookup.
+        Uses a cached binary-search index over offset_mapping, so each lookup is
+        O(log n) in the sequence length.
 
         Args:
             text_index: Index of the text in the batch
@@ -98,24 +203,26 @@ class ActivationResult:
         Returns:
             List of token indices
         """
-        offsets = self.offset_mapping[text_index]  # (seq_len, 2)
-
-        # Find tokens where (token_start < end_char) and (token_end > start_char)
-        # Note: offset_mapping usually contains (start, end) for each token
+        return self._token_positions_for_char_range(
+            text_index, start_char, end_char
+        ).tolist()
 
-        # We can do this with tensor operations for speed, but a loop is fine for now
-        # given sequence lengths aren't massive.
-
-        indices = []
-        for i, (tok_start, tok_end) in enumerate(offsets):
-            # Skip special tokens which often have (0, 0) offsets
-            if tok_start == tok_end:
-                continue
+    def get_content_token_indices_for_char_range(
+        self, text_index: int, start_char: int, end_char: int
+    ) -> list[int]:
+        """
+        Get token indices overlapping a character range, excluding special tokens.
 
-            if tok_start < end_char and tok_end > start_char:
-                indices.append(i)
+        Args:
+            text_index: Index of the text in the batch
+            start_char: Start character index (inclusive)
+            end_char: End character index (exclusive)
 
-        return indices
+        Returns:
+            List of token indices
+        """
+        indices = self._token_positions_for_char_range(text_index, start_char, end_char)
+        return indices[~self.special_token_mask[text_index, indices]].tolist()
 
     def get_token_indices_for_span(
         self, text_index: int, span: str, start_search_index: int = 0
@@ -1,3 +1,16 @@
-from .logits import LogitExtractor, ResponseLogits
+from .logits import (
+    LogitExtractor,
+    LowerStackCache,
+    PairedResponseLogits,
+    ResponseLogits,
+)
+from .trajectories import Trajectories, load_trajectories
 
-__all__ = ["LogitExtractor", "ResponseLogits"]
+__all__ = [
+    "LogitExtractor",
+    "LowerStackCache",
+    "PairedResponseLogits",
+    "ResponseLogits",
+    "Trajectories",
+    "load_trajectories",
+]
@@ -1,7 +1,14 @@
+from collections.abc import Iterable, Iterator, Mapping
+from itertools import islice
+from typing import NamedTuple
+
+import numpy as np
 import torch
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from transformers import PreTrainedModel, PreTrainedTokenizer, PreTrainedTokenizerFast
 
+from animacy.models.batching import plan_batches
+from animacy.models.tokenizer_cache import get_tokenizer_artifacts
 from animacy.prompts.roles import BASE_STEM, get_article
 from animacy.prompts.tasks import TASK_PROMPTS
 
@@ -19,6 +26,189 @@ class ResponseLogits(BaseModel):
     role_period_log_prob: float | None = None
     first_100_response_log_probs: list[float]
     first_100_response_text_len: int
+    # Distribution statistics of the first 100 response positions, only filled
+    # when requested (see LogitExtractor.extract_logits_batch)
+    first_100_response_entropies: list[float] | None = None
+    first_100_response_target_ranks: list[int] | None = None
+    first_100_response_top_k_log_mass: list[float] | None = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # Full response trajectory (int32 token IDs and float16 log-probs), only
+    # filled when requested and left out of model_dump()
+    response_token_ids: np.ndarray | None = Field(default=None, exclude=True)
+    response_log_probs: np.ndarray | None = Field(default=None, exclude=True)
+
+
+class PairedResponseLogits(BaseModel):
+    """
+    Log-probabilities of one response scored with and without the system prompt.
+
+    Deltas are with-system-prompt minus without, per response token.
+    """
+
+    role_name: str | None
+    task_name: str
+    sample_idx: int
+    with_system: ResponseLogits
+    without_system: ResponseLogits
+    average_log_prob_delta: float
+    first_100_log_prob_deltas: list[float]
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # Float16 deltas of every response token, only filled when trajectories are
+    # requested and left out of model_dump()
+    response_log_prob_deltas: np.ndarray | None = Field(default=None, exclude=True)
+
+
+class PromptBoundaries(NamedTuple):
+    """
+    Token boundaries of a (system prompt, task prompt, role) combination.
+
+    Indices refer to the rendered chat template, which every sample built from
+    the same prompts starts with.
+    """
+
+    prefix_ids: tuple[int, ...]  # Template tokens of the system prefix (or empty)
+    prompt_ids: tuple[
+        int, ...
+    ]  # Template tokens up to and including the generation prompt
+    system_end_idx: int  # Last token of the system turn, -1 without system prompt
+    user_end_idx: int  # Last token before the response
+    sys_text_ids: tuple[int, ...]  # System prompt tokenized on its own
+    sys_start_idx: int  # Start of sys_text_ids within prefix_ids, -1 if not found
+    role_offset: int  # Start of the role within sys_text_ids, -1 if not found
+    role_len: int
+
+
+class LowerStackCache(NamedTuple):
+    """
+    A tokenized batch run through the decoder layers below a split layer.
+
+    Holds the hidden states entering the split layer together with the other
+    arguments the model passed to it (attention mask, position embeddings,
+    ...), so the upper layers can be replayed without recomputing the lower
+    ones. Built by LogitExtractor.encode_lower_stack.
+    """
+
+    batch_metadata: list[dict]
+    input_ids: torch.Tensor  # Padded token IDs on CPU
+    attention_mask: torch.Tensor  # On CPU
+    locations: list[dict]  # Scored locations per sample
+    scored: torch.Tensor  # (batch, seq - 1) bool mask of scored positions
+    split_layer: int  # First layer that is replayed
+    hidden_states: torch.Tensor  # Input of split_layer, on device or host
+    layer_args: tuple  # Remaining positional arguments of the layer call
+    layer_kwargs: dict  # Keyword arguments of the layer call
+
+
+class _LowerStackDone(Exception):
+    """Stops a forward pass once the inputs of the split layer are captured."""
+
+
+def _template_ids(
+    tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast,
+    messages: list[dict],
+    add_generation_prompt: bool,
+) -> list[int]:
+    """Token IDs of a rendered chat template."""
+    ids = tokenizer.apply_chat_template(
+        messages, add_generation_prompt=add_generation_prompt
+    )
+    # Newer tokenizers return a BatchEncoding instead of a list of IDs
+    if isinstance(ids, Mapping):
+        ids = ids["input_ids"]
+    return list(ids)
+
+
+def _prompt_boundaries(
+    tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast,
+    use_sys: bool,
+    system_prompt: str,
+    task_prompt: str,
+    role_name: str | None,
+) -> PromptBoundaries:
+    """
+    Render and tokenize the prompt templates once per prompt combination.
+
+    Samples repeat across sample indices, steering magnitudes and layer sets,
+    so boundaries are cached with the tokenizer's shared artifacts instead of
+    re-rendered for every sample. The cache is dropped with the tokenizer.
+    """
+    return get_tokenizer_artifacts(tokenizer).prompt_boundaries(
+        (use_sys, system_prompt, task_prompt, role_name),
+        lambda: _render_prompt_boundaries(
+            tokenizer, use_sys, system_prompt, task_prompt, role_name
+        ),
+    )
+
+
+def _render_prompt_boundaries(
+    tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast,
+    use_sys: bool,
+    system_prompt: str,
+    task_prompt: str,
+    role_name: str | None,
+) -> PromptBoundaries:
+    """Compute the boundaries of a prompt combination (uncached)."""
+    prefix_ids: list[int] = []
+    system_end_idx = -1
+    sys_text_ids: list[int] = []
+    sys_start_idx = -1
+    role_offset = -1
+    role_len = 0
+
+    if use_sys:
+        prefix_ids = _template_ids(
+            tokenizer,
+            [{"role": "system", "content": system_prompt}],
+            add_generation_prompt=False,
+        )
+        system_end_idx = len(prefix_ids) - 1
+        ids_sys_user = _template_ids(
+            tokenizer,
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": task_prompt},
+            ],
+            add_generation_prompt=True,
+        )
+        prompt_ids = ids_sys_user
+    else:
+        prompt_ids = _template_ids(
+            tokenizer,
+            [{"role": "user", "content": task_prompt}],
+            add_generation_prompt=True,
+        )
+    user_end_idx = len(prompt_ids) - 1
+
+    if use_sys and role_name:
+        sys_text_ids = tokenizer(system_prompt, add_special_tokens=False)["input_ids"]
+        role_ids = tokenizer(role_name, add_special_tokens=False)["input_ids"]
+        sys_start_idx = LogitExtractor._find_subsequence(prefix_ids, sys_text_ids)
+        role_offset = LogitExtractor._find_subsequence(sys_text_ids, role_ids)
+        role_len = len(role_ids)
+
+    return PromptBoundaries(
+        prefix_ids=tuple(prefix_ids),
+        prompt_ids=tuple(prompt_ids),
+        system_end_idx=system_end_idx,
+        user_end_idx=user_end_idx,
+        sys_text_ids=tuple(sys_text_ids),
+        sys_start_idx=sys_start_idx,
+        role_offset=role_offset,
+        role_len=role_len,
+    )
+
+
+#: Values computed per scored position when distribution statistics are
+#: requested: target log-prob, entropy, target rank and top-k log mass.
+NUM_SCORE_CHANNELS = 4
+
+#: Attention implementations that apply a custom additive 4D mask, as needed
+#: to score packed samples.
+PACKED_ATTN_IMPLEMENTATIONS = ("eager", "sdpa")
 
 
 class LogitExtractor:
@@ -30,22 +220,41 @@ class LogitExtractor:
         self,
         model: PreTrainedModel,
         tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast,
+        score_chunk_size: int = 256,
+        stats_top_k: int = 10,
     ):
+        """
+        Args:
+            model: Causal language model to score with.
+            tokenizer: Tokenizer matching the model.
+            score_chunk_size: Number of scored positions projected and normalized
+                              at a time when computing log-probabilities.
+            stats_top_k: Number of most likely tokens whose probability mass is
+                         reported when distribution statistics are requested.
+        """
+        if score_chunk_size < 1:
+            raise ValueError(
+                f"score_chunk_size must be positive, got {score_chunk_size}"
+            )
+        if stats_top_k < 1:
+            raise ValueError(f"stats_top_k must be positive, got {stats_top_k}")
         self.model = model
         self.tokenizer = tokenizer
-        self.period_token_ids = self._find_period_tokens()
+        self.score_chunk_size = score_chunk_size
+        self.stats_top_k = stats_top_k
+        self.period_token_mask = self._find_period_tokens()
 
-    def _find_period_tokens(self) -> set[int]:
+    def _find_period_tokens(self) -> torch.Tensor:
         """
         Find all token IDs in the vocabulary that contain a period.
         This allows direct token ID matching without decoding.
+
+        The mask is shared by every extractor using the same tokenizer.
+
+        Returns:
+            Boolean mask over token IDs, True for tokens containing a period
         """
-        period_tokens = set()
-        vocab = self.tokenizer.get_vocab()
-        for token_str, token_id in vocab.items():
-            if "." in token_str:
-                period_tokens.add(token_id)
-        return period_tokens
+        return get_tokenizer_artifacts(self.tokenizer).period_token_mask
 
     @staticmethod
     def _find_subsequence(sequence: list[int], subsequence: list[int]) -> int:
@@ -53,17 +262,152 @@ class LogitExtractor:
         Find the starting index of a subsequence within a sequence.
         Returns -1 if not found.
         """
-        n = len(subsequence)
-        for i in range(len(sequence) - n + 1):
-            if sequence[i : i + n] == subsequence:
-                return i
-        return -1
+        if not subsequence:
+            return 0
+        found = LogitExtractor._find_subsequence_batch(
+            torch.tensor([sequence], dtype=torch.long),
+            torch.tensor(subsequence, dtype=torch.long),
+            torch.tensor([len(sequence)]),
+        )
+        return int(found[0])
+
+    @staticmethod
+    def _find_subsequence_batch(
+        sequences: torch.Tensor, subsequence: torch.Tensor, limits: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Find the first occurrence of a subsequence in each row, all rows at once.
+
+        Every window of the rows is compared with the subsequence through an
+        unfolded (rows, windows, len) view, without Python loops.
+
+        Args:
+            sequences: Token IDs (rows, seq)
+            subsequence: Non-empty token IDs to find (len,)
+            limits: Per-row end of the searched range (exclusive)
+
+        Returns:
+            Tensor (rows,) with the start index of the first match, or -1
+        """
+        n = subsequence.shape[0]
+        num_rows, seq_len = sequences.shape
+        if n > seq_len:
+            return torch.full(
+                (num_rows,), -1, dtype=torch.long, device=sequences.device
+            )
+
+        windows = sequences.unfold(1, n, 1)  # (rows, seq_len - n + 1, n)
+        matches = (windows == subsequence.to(sequences.device)).all(dim=2)
+        starts = torch.arange(windows.shape[1], device=sequences.device)
+        matches &= starts.unsqueeze(0) + n <= limits.to(sequences.device).unsqueeze(1)
+
+        first = matches.int().argmax(dim=1)
+        return torch.where(matches.any(dim=1), first, -1)
+
+    @property
+    def _split_head(self) -> bool:
+        """
+        Whether the model exposes its body and output head separately, so the
+        head can be applied to selected hidden states only.
+        """
+        return (
+            self.model.base_model is not self.model
+            and self.model.get_output_embeddings() is not None
+        )
+
+    def _project(self, hidden_states: torch.Tensor) -> torch.Tensor:
+        """
+        Apply the output head to final hidden states, as the model's forward does.
+
+        Args:
+            hidden_states: Final hidden states (positions, hidden)
+
+        Returns:
+            Float32 logits (positions, vocab)
+        """
+        logits = self.model.get_output_embeddings()(hidden_states).float()
+        softcap = getattr(self.model.config, "final_logit_softcapping", None)
+        if softcap is not None:
+            logits = torch.tanh(logits / softcap) * softcap
+        return logits
+
+    def _score_positions(
+        self,
+        states: torch.Tensor,
+        input_ids: torch.Tensor,
+        scored: torch.Tensor,
+        with_stats: bool = False,
+    ) -> torch.Tensor:
+        """
+        Log-probability of the next token at the scored positions.
+
+        Positions are processed score_chunk_size at a time. Each chunk is scored
+        as logit[target] - logsumexp(logits), so neither full-sequence logits nor
+        a normalized (batch, seq, vocab) tensor is ever built.
+
+        With with_stats, the entropy of the next-token distribution, the 1-based
+        rank of the target and the log of the probability mass of the
+        stats_top_k most likely tokens are reduced from the same chunk logits, so
+        only NUM_SCORE_CHANNELS floats per position leave the chunk.
+
+        Args:
+            states: Final hidden states (batch, seq, hidden) when the head is
+                    applied here, otherwise the model's logits (batch, seq, vocab)
+            input_ids: Input token IDs (batch, seq)
+            scored: Boolean mask (batch, seq - 1), True where entry k is needed
+            with_stats: Whether to also compute the distribution statistics
+
+        Returns:
+            Float32 tensor (batch, seq - 1) where entry k scores input_ids[:, k + 1],
+            or (batch, seq - 1, NUM_SCORE_CHANNELS) with_stats, channels being
+            (log-prob, entropy, rank, top-k log mass). Positions that were not
+            scored are NaN.
+        """
+        batch_size, seq_len = input_ids.shape
+        shape = (batch_size, max(seq_len - 1, 0))
+        if with_stats:
+            shape = (*shape, NUM_SCORE_CHANNELS)
+        scores = torch.full(
+            shape, float("nan"), dtype=torch.float32, device=states.device
+        )
+        rows, cols = torch.nonzero(scored, as_tuple=True)
+        targets = input_ids[rows, cols + 1]
+
+        for start in range(0, len(rows), self.score_chunk_size):
+            end = start + self.score_chunk_size
+            chunk = states[rows[start:end], cols[start:end]]
+            logits = self._project(chunk) if self._split_head else chunk.float()
+            target_logits = logits.gather(1, targets[start:end].unsqueeze(1))
+            log_normalizer = torch.logsumexp(logits, dim=-1, keepdim=True)
+            target_log_probs = (target_logits - log_normalizer).squeeze(1)
+            if not with_stats:
+                scores[rows[start:end], cols[start:end]] = target_log_probs
+                continue
+
+            # H = log Z - sum(p * logit)
+            probs = torch.exp(logits - log_normalizer)
+            expected_logit = (probs * logits).sum(-1, keepdim=True)
+            entropy = (log_normalizer - expected_logit).squeeze(1)
+            rank = (logits > target_logits).sum(-1) + 1
+            top_k = logits.topk(min(self.stats_top_k, logits.shape[-1]), dim=-1).values
+            top_k_log_mass = (
+                torch.logsumexp(top_k, dim=-1, keepdim=True) - log_normalizer
+            ).squeeze(1)
+            scores[rows[start:end], cols[start:end]] = torch.stack(
+                [target_log_probs, entropy, rank.float(), top_k_log_mass], dim=-1
+            )
+
+        return scores
 
     def extract_logits_batch(
         self,
         samples: list[dict],
         use_system_prompt: bool = True,
         steering_manager=None,
+        share_prefix: bool = False,
+        return_trajectories: bool = False,
+        return_stats: bool = False,
+        pack_length: int | None = None,
     ) -> list[ResponseLogits]:
         """
         Calculate log-probabilities for a batch of samples.
@@ -77,6 +421,21 @@ class LogitExtractor:
                      - system_prompt (str, optional)
                      - task_prompt (str, optional)
             use_system_prompt: Whether to include the role-assigning system prompt.
+            steering_manager: Optional SteeringManager whose hooks are active.
+            share_prefix: If True, samples with the same system+user prompt are
+                          grouped, the prompt is run once per group and its KV
+                          cache is reused to score every response in the group.
+                          Not available with per-row steering vectors.
+            return_trajectories: If True, also fill response_token_ids and
+                                 response_log_probs with every response token.
+            return_stats: If True, also fill the entropy, target rank and top-k
+                          log mass of the first 100 response positions. They
+                          are reduced on the model device in the scoring pass.
+            pack_length: If set, samples are packed end to end into rows of at
+                         least this many tokens instead of being padded to the
+                         longest sample (see _score_packed). Needs eager or
+                         SDPA attention. Cannot be combined with share_prefix
+                         or per-row steering vectors.
 
         Returns:
             List of ResponseLogits objects.
@@ -85,6 +444,579 @@ class LogitExtractor:
             return []
 
         # 1. Prepare inputs
+        batch_prompts, batch_metadata = self._prepare_samples(
+            samples, use_system_prompt
+        )
+
+        # 2. Tokenize, locate scored positions and score them
+        input_ids, locations, scores = self._score_samples(
+            batch_prompts,
+            batch_metadata,
+            steering_manager,
+            share_prefix,
+            return_stats,
+            pack_length,
+        )
+        scores = scores.cpu()
+
+        # 3. Process each sample
+        return [
+            self._build_response_logits(
+                meta, location, input_ids[i], scores[i], return_trajectories
+            )
+            for i, (meta, location) in enumerate(
+                zip(batch_metadata, locations, strict=True)
+            )
+        ]
+
+    def extract_logits_replicated(
+        self,
+        samples: list[dict],
+        num_copies: int,
+        use_system_prompt: bool = True,
+        steering_manager=None,
+        return_trajectories: bool = False,
+        return_stats: bool = False,
+    ) -> list[list[ResponseLogits]]:
+        """
+        Score several copies of a batch of samples in one forward pass.
+
+        Samples are rendered, tokenized and located once, and the padded batch
+        is repeated num_copies times. Copy c of sample i is row
+        c * len(samples) + i, so a steering manager with per-row vectors (see
+        SteeringManager.stack_row_vectors) can steer each copy differently,
+        e.g. with one magnitude per copy.
+
+        Args:
+            samples: Sample dicts as accepted by extract_logits_batch.
+            num_copies: Number of copies of the batch to score.
+            use_system_prompt: Whether to include the role-assigning system prompt.
+            steering_manager: Optional SteeringManager whose hooks are active.
+            return_trajectories: See extract_logits_batch.
+            return_stats: See extract_logits_batch.
+
+        Returns:
+            One list of ResponseLogits (in sample order) per copy.
+        """
+        if num_copies < 1:
+            raise ValueError(f"num_copies must be positive, got {num_copies}")
+        if not samples:
+            return [[] for _ in range(num_copies)]
+
+        batch_prompts, batch_metadata = self._prepare_samples(
+            samples, use_system_prompt
+        )
+        input_ids, attention_mask, locations, scored = self._encode_samples(
+            batch_prompts, batch_metadata
+        )
+        scores = self._score_batch(
+            input_ids.repeat(num_copies, 1),
+            attention_mask.repeat(num_copies, 1),
+            scored.repeat(num_copies, 1),
+            steering_manager,
+            return_stats,
+        ).cpu()
+
+        num_samples = len(samples)
+        return [
+            [
+                self._build_response_logits(
+                    meta,
+                    location,
+                    input_ids[i],
+                    scores[copy * num_samples + i],
+                    return_trajectories,
+                )
+                for i, (meta, location) in enumerate(
+                    zip(batch_metadata, locations, strict=True)
+                )
+            ]
+            for copy in range(num_copies)
+        ]
+
+    def _decoder_stack(self) -> tuple[torch.nn.ModuleList, torch.nn.Module] | None:
+        """
+        Decoder layers and final norm of the model body, if the body can be
+        replayed from an intermediate layer.
+        """
+        body = self.model.base_model
+        layers = getattr(body, "layers", None)
+        norm = getattr(body, "norm", None)
+        if (
+            not self._split_head
+            or not isinstance(layers, torch.nn.ModuleList)
+            or not isinstance(norm, torch.nn.Module)
+        ):
+            return None
+        return layers, norm
+
+    def supports_lower_stack_reuse(self, split_layer: int) -> bool:
+        """
+        Whether encode_lower_stack can split the model at a layer.
+
+        The arguments captured at the split layer are reused for every layer
+        above it, so those layers must all use the same attention type (e.g.
+        no alternating sliding-window layers).
+
+        Args:
+            split_layer: Index of the first layer to replay.
+
+        Returns:
+            True if the model can be split at split_layer.
+        """
+        stack = self._decoder_stack()
+        if stack is None or not 0 <= split_layer < len(stack[0]):
+            return False
+        layer_types = getattr(self.model.base_model.config, "layer_types", None)
+        return layer_types is None or len(set(layer_types[split_layer:])) <= 1
+
+    def encode_lower_stack(
+        self,
+        samples: list[dict],
+        split_layer: int,
+        use_system_prompt: bool = True,
+        offload: bool = False,
+    ) -> LowerStackCache:
+        """
+        Run a batch of samples through the layers below split_layer.
+
+        The layers below split_layer must not be steered. Their output depends
+        only on the samples, so extract_logits_from_lower_stack can then score
+        the batch under any number of steering settings while replaying only
+        split_layer and above.
+
+        Args:
+            samples: Sample dicts as accepted by extract_logits_batch.
+            split_layer: Index of the first decoder layer to replay, usually the
+                         lowest steered layer.
+            use_system_prompt: Whether to include the role-assigning system prompt.
+            offload: If True, keep the cached hidden states on the host and copy
+                     them to the device for each replay.
+
+        Returns:
+            LowerStackCache of the batch.
+        """
+        if not self.supports_lower_stack_reuse(split_layer):
+            raise ValueError(
+                f"Cannot split {type(self.model).__name__} at layer {split_layer}"
+            )
+        layers, _ = self._decoder_stack()
+
+        batch_prompts, batch_metadata = self._prepare_samples(
+            samples, use_system_prompt
+        )
+        input_ids, attention_mask, locations, scored = self._encode_samples(
+            batch_prompts, batch_metadata
+        )
+
+        captured = {}
+
+        def capture(module, args, kwargs):
+            captured["args"] = args
+            captured["kwargs"] = kwargs
+            raise _LowerStackDone
+
+        handle = layers[split_layer].register_forward_pre_hook(
+            capture, with_kwargs=True
+        )
+        try:
+            with torch.no_grad():
+                self._forward(
+                    input_ids.to(self.model.device),
+                    attention_mask.to(self.model.device),
+                )
+        except _LowerStackDone:
+            pass
+        finally:
+            handle.remove()
+
+        args, kwargs = captured["args"], dict(captured["kwargs"])
+        if args:
+            hidden_states, args = args[0], args[1:]
+        else:
+            hidden_states = kwargs.pop("hidden_states")
+        if offload:
+            hidden_states = hidden_states.to("cpu")
+
+        return LowerStackCache(
+            batch_metadata=batch_metadata,
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            locations=locations,
+            scored=scored,
+            split_layer=split_layer,
+            hidden_states=hidden_states,
+            layer_args=args,
+            layer_kwargs=kwargs,
+        )
+
+    def extract_logits_from_lower_stack(
+        self,
+        cache: LowerStackCache,
+        steering_manager=None,
+        return_trajectories: bool = False,
+        return_stats: bool = False,
+    ) -> list[ResponseLogits]:
+        """
+        Finish the forward pass of a cached batch and score it.
+
+        Only the layers from cache.split_layer up are run, so steering hooks on
+        those layers apply as in a full forward pass.
+
+        Args:
+            cache: Batch encoded by encode_lower_stack.
+            steering_manager: Optional SteeringManager whose hooks are active.
+            return_trajectories: See extract_logits_batch.
+            return_stats: See extract_logits_batch.
+
+        Returns:
+            List of ResponseLogits objects, in sample order.
+        """
+        layers, norm = self._decoder_stack()
+        device = self.model.device
+
+        if steering_manager is not None:
+            steering_manager._current_attention_mask = cache.attention_mask.to(device)
+        try:
+            with torch.no_grad():
+                hidden_states = cache.hidden_states.to(device)
+                for layer in layers[cache.split_layer :]:
+                    output = layer(
+                        hidden_states, *cache.layer_args, **cache.layer_kwargs
+                    )
+                    hidden_states = output[0] if isinstance(output, tuple) else output
+                states = norm(hidden_states)
+
+                device_input_ids = cache.input_ids.to(device)
+                scores = self._score_positions(
+                    states, device_input_ids, cache.scored.to(device), return_stats
+                ).cpu()
+        finally:
+            if steering_manager is not None:
+                steering_manager._current_attention_mask = None
+
+        return [
+            self._build_response_logits(
+                meta, location, cache.input_ids[i], scores[i], return_trajectories
+            )
+            for i, (meta, location) in enumerate(
+                zip(cache.batch_metadata, cache.locations, strict=True)
+            )
+        ]
+
+    def extract_paired_logits_batch(
+        self,
+        samples: list[dict],
+        steering_manager=None,
+        share_prefix: bool = False,
+        return_trajectories: bool = False,
+        return_stats: bool = False,
+        pack_length: int | None = None,
+    ) -> list[PairedResponseLogits]:
+        """
+        Score each sample with and without the system prompt in a single pass.
+
+        Both conditions of every sample go into the same padded batch. The
+        response tokens are identical in both, so their log-probs are aligned
+        and the per-token deltas (with minus without) are computed with one
+        batched gather instead of joining two result tables afterwards.
+
+        Args:
+            samples: Sample dicts as accepted by extract_logits_batch.
+            steering_manager: Optional SteeringManager whose hooks are active.
+            share_prefix: Reuse the KV cache of prompts shared within the batch.
+            return_trajectories: If True, also fill the full response trajectories
+                                 of both conditions and response_log_prob_deltas.
+            return_stats: If True, also fill the distribution statistics of both
+                          conditions (see extract_logits_batch).
+            pack_length: Pack samples into rows instead of padding them (see
+                         extract_logits_batch).
+
+        Returns:
+            List of PairedResponseLogits objects, in sample order.
+        """
+        if not samples:
+            return []
+
+        num_samples = len(samples)
+        with_prompts, with_metadata = self._prepare_samples(samples, True)
+        without_prompts, without_metadata = self._prepare_samples(samples, False)
+        batch_metadata = with_metadata + without_metadata
+
+        input_ids, locations, scores = self._score_samples(
+            with_prompts + without_prompts,
+            batch_metadata,
+            steering_manager,
+            share_prefix,
+            return_stats,
+            pack_length,
+        )
+        # Subtract and average on the device; only the results are copied back
+        target_log_probs = scores[..., 0] if return_stats else scores
+        deltas, delta_mask = self._paired_deltas(
+            input_ids, locations, target_log_probs, num_samples
+        )
+        lengths = delta_mask.sum(dim=1)
+        average_deltas = deltas.sum(dim=1) / lengths.to(deltas.device).clamp(min=1)
+        deltas, average_deltas = deltas.cpu(), average_deltas.tolist()
+        scores = scores.cpu()
+        first_100 = deltas[:, :100]
+
+        results = [
+            self._build_response_logits(
+                meta, location, input_ids[i], scores[i], return_trajectories
+            )
+            for i, (meta, location) in enumerate(
+                zip(batch_metadata, locations, strict=True)
+            )
+        ]
+
+        paired = []
+        for i, meta in enumerate(with_metadata):
+            length = int(lengths[i])
+            response_log_prob_deltas = None
+            if return_trajectories:
+                response_log_prob_deltas = deltas[i, :length].to(torch.float16).numpy()
+            paired.append(
+                PairedResponseLogits(
+                    role_name=meta["role_name"],
+                    task_name=meta["task_name"],
+                    sample_idx=meta["sample_idx"],
+                    with_system=results[i],
+                    without_system=results[num_samples + i],
+                    average_log_prob_delta=average_deltas[i],
+                    first_100_log_prob_deltas=first_100[i, : min(length, 100)].tolist(),
+                    response_log_prob_deltas=response_log_prob_deltas,
+                )
+            )
+        return paired
+
+    def _score_samples(
+        self,
+        batch_prompts: list[list[dict]],
+        batch_metadata: list[dict],
+        steering_manager=None,
+        share_prefix: bool = False,
+        with_stats: bool = False,
+        pack_length: int | None = None,
+    ) -> tuple[torch.Tensor, list[dict], torch.Tensor]:
+        """
+        Tokenize prepared samples and score the positions they need.
+
+        Returns:
+            Tuple of (padded input_ids on CPU, scored locations per sample,
+            scores on the model device as returned by _score_positions, NaN
+            where not scored)
+        """
+        if share_prefix and pack_length is not None:
+            raise ValueError("share_prefix and pack_length cannot be combined")
+        # Packing and prefix sharing reorder or regroup rows, so per-row vectors
+        # would not line up with their samples
+        if (
+            (share_prefix or pack_length is not None)
+            and steering_manager is not None
+            and steering_manager.steers_per_row
+        ):
+            raise ValueError(
+                "Per-row steering vectors cannot be combined with share_prefix "
+                "or pack_length"
+            )
+
+        input_ids, attention_mask, locations, scored = self._encode_samples(
+            batch_prompts, batch_metadata
+        )
+
+        # Run model and calculate log-probs of each scored next token
+        if pack_length is not None:
+            scores = self._score_packed(
+                input_ids,
+                attention_mask,
+                scored,
+                pack_length,
+                steering_manager,
+                with_stats,
+            )
+        elif share_prefix:
+            scores = self._score_shared_prefix(
+                input_ids,
+                attention_mask,
+                scored,
+                locations,
+                steering_manager,
+                with_stats,
+            )
+        else:
+            scores = self._score_batch(
+                input_ids, attention_mask, scored, steering_manager, with_stats
+            )
+
+        return input_ids, locations, scores
+
+    def _encode_samples(
+        self, batch_prompts: list[list[dict]], batch_metadata: list[dict]
+    ) -> tuple[torch.Tensor, torch.Tensor, list[dict], torch.Tensor]:
+        """
+        Tokenize prepared samples and locate the positions that need a log-prob.
+
+        Only the located positions go through the output head.
+
+        Returns:
+            Tuple of (padded input_ids, attention_mask, scored locations per
+            sample, (batch, seq - 1) bool mask of scored positions), all on CPU
+        """
+        encodings = self._tokenize_prompts(batch_prompts)
+        input_ids = encodings["input_ids"]
+        attention_mask = encodings["attention_mask"]
+
+        locations = self._locate_scored_positions(
+            input_ids, attention_mask, batch_metadata
+        )
+        scored = torch.zeros(
+            (len(batch_metadata), max(input_ids.shape[1] - 1, 0)), dtype=torch.bool
+        )
+        for i, location in enumerate(locations):
+            for span in (location["response"], location["role"]):
+                if span is not None:
+                    scored[i, span] = True
+            if location["period"] is not None:
+                scored[i, location["period"]] = True
+
+        return input_ids, attention_mask, locations, scored
+
+    @staticmethod
+    def _paired_deltas(
+        input_ids: torch.Tensor,
+        locations: list[dict],
+        target_log_probs: torch.Tensor,
+        num_samples: int,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Align the response log-probs of paired rows and subtract them.
+
+        Rows [0, num_samples) hold the with-system-prompt condition and rows
+        [num_samples, 2 * num_samples) the same samples without it. Token IDs
+        are checked on the host; the log-probs are gathered and subtracted on
+        the device of target_log_probs.
+
+        Returns:
+            Tuple of (deltas, mask), both (num_samples, longest response). Deltas
+            are on the device of target_log_probs and zero where mask is False;
+            mask is on CPU.
+        """
+
+        def spans(rows):
+            starts, lengths = [], []
+            for location in rows:
+                span = location["response"]
+                starts.append(0 if span is None else span.start)
+                lengths.append(0 if span is None else span.stop - span.start)
+            return torch.tensor(starts), torch.tensor(lengths)
+
+        with_starts, with_lengths = spans(locations[:num_samples])
+        without_starts, without_lengths = spans(locations[num_samples:])
+        if not torch.equal(with_lengths, without_lengths):
+            raise ValueError(
+                "Responses tokenized differently with and without the system prompt"
+            )
+
+        max_len = int(with_lengths.max()) if num_samples else 0
+        offsets = torch.arange(max_len)
+        mask = offsets < with_lengths[:, None]
+        # Clamp padding positions into range; they are masked out below
+        last = target_log_probs.shape[1] - 1
+        with_index = (with_starts[:, None] + offsets).clamp(max=last)
+        without_index = (without_starts[:, None] + offsets).clamp(max=last)
+
+        # Target k is the token at input position k + 1
+        with_ids = input_ids[:num_samples].gather(1, with_index + 1)
+        without_ids = input_ids[num_samples:].gather(1, without_index + 1)
+        if not torch.equal(with_ids[mask], without_ids[mask]):
+            raise ValueError(
+                "Responses tokenized differently with and without the system prompt"
+            )
+
+        device = target_log_probs.device
+        with_log_probs = target_log_probs[:num_samples].gather(1, with_index.to(device))
+        without_log_probs = target_log_probs[num_samples:].gather(
+            1, without_index.to(device)
+        )
+        deltas = with_log_probs - without_log_probs
+        return deltas.masked_fill(~mask.to(device), 0.0), mask
+
+    def sample_lengths(
+        self, samples: list[dict], use_system_prompt: bool = True
+    ) -> list[int]:
+        """
+        Estimate the token length of each sample's full chat.
+
+        The prompt length comes from the cached prompt boundaries, so only the
+        responses are tokenized. Closing template tokens after the response are
+        counted as one token, which is close enough for batch planning.
+
+        Args:
+            samples: Sample dicts as accepted by extract_logits_batch.
+            use_system_prompt: Whether the role-assigning system prompt is included.
+
+        Returns:
+            Approximate number of tokens per sample.
+        """
+        if not samples:
+            return []
+        _, batch_metadata = self._prepare_samples(samples, use_system_prompt)
+        response_ids = self.tokenizer(
+            [sample["response"] for sample in samples], add_special_tokens=False
+        )["input_ids"]
+        return [
+            len(self._boundaries(meta).prompt_ids) + len(ids) + 1
+            for meta, ids in zip(batch_metadata, response_ids, strict=True)
+        ]
+
+    def iter_batches(
+        self,
+        samples: Iterable[dict],
+        use_system_prompt: bool = True,
+        batch_size: int = 8,
+        max_batch_tokens: int | None = None,
+        pool_size: int = 1024,
+    ) -> Iterator[list[dict]]:
+        """
+        Group a stream of samples into length-sorted batches.
+
+        Samples are read pool_size at a time, so the stream never has to fit in
+        memory. Each pool is sorted longest first and split into batches that
+        respect both the row limit and the padded token budget, which keeps
+        padding low and surfaces out-of-memory batches early.
+
+        Args:
+            samples: Sample dicts as accepted by extract_logits_batch.
+            use_system_prompt: Whether the role-assigning system prompt is included.
+            batch_size: Maximum number of samples per batch.
+            max_batch_tokens: Optional limit on rows x longest row per batch.
+            pool_size: Number of samples read and sorted at a time.
+
+        Yields:
+            Lists of samples to pass to extract_logits_batch.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be positive, got {pool_size}")
+
+        samples = iter(samples)
+        while pool := list(islice(samples, pool_size)):
+            lengths = self.sample_lengths(pool, use_system_prompt)
+            for batch in plan_batches(lengths, batch_size, max_batch_tokens):
+                yield [pool[i] for i in batch]
+
+    def _prepare_samples(
+        self, samples: list[dict], use_system_prompt: bool
+    ) -> tuple[list[list[dict]], list[dict]]:
+        """
+        Reconstruct the chat messages and prompt metadata of each sample.
+
+        Returns:
+            Tuple of (list of message lists, list of metadata dicts)
+        """
         batch_prompts = []
         batch_metadata = []
 
@@ -131,7 +1063,25 @@ class LogitExtractor:
                 }
             )
 
-        # 2. Tokenize batch
+        return batch_prompts, batch_metadata
+
+    def _boundaries(self, meta: dict) -> PromptBoundaries:
+        """Cached prompt boundaries of a sample's metadata."""
+        return _prompt_boundaries(
+            self.tokenizer,
+            meta["use_system_prompt"],
+            meta["system_prompt"],
+            meta["task_prompt"],
+            meta["role_name"] if meta["use_system_prompt"] else None,
+        )
+
+    def _tokenize_prompts(self, batch_prompts: list[list[dict]]):
+        """
+        Tokenize chat histories with right padding.
+
+        Returns:
+            BatchEncoding with input_ids and attention_mask on CPU
+        """
         # Use right padding for scoring to ensure position IDs align naturally
         # with serial execution. We enforce this regardless of tokenizer settings.
         if self.tokenizer.pad_token is None:
@@ -142,7 +1092,7 @@ class LogitExtractor:
         self.tokenizer.padding_side = "right"
 
         try:
-            encodings = self.tokenizer.apply_chat_template(
+            return self.tokenizer.apply_chat_template(
                 batch_prompts,
                 return_tensors="pt",
                 return_dict=True,
@@ -153,174 +1103,545 @@ class LogitExtractor:
             # Always restore original padding side
             self.tokenizer.padding_side = original_padding_side
 
-        input_ids = encodings["input_ids"].to(self.model.device)
-        attention_mask = encodings["attention_mask"].to(self.model.device)
+    def _forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        steering_manager=None,
+        steering_mask: torch.Tensor | None = None,
+        past_key_values=None,
+        use_cache: bool = False,
+        position_ids: torch.Tensor | None = None,
+    ):
+        """
+        Run the model body (or the full model if the head cannot be split off).
 
-        # 3. Run model
-        with torch.no_grad():
-            # If steering manager is provided, set the attention mask
-            if steering_manager is not None:
-                steering_manager._current_attention_mask = attention_mask
+        Args:
+            input_ids: Input token IDs on the model device
+            attention_mask: Attention mask covering any cached tokens as well
+            steering_manager: Optional SteeringManager whose hooks are active
+            steering_mask: Mask over input_ids positions that steering applies to.
+                           Defaults to attention_mask.
+            past_key_values: Optional KV cache of preceding tokens
+            use_cache: Whether to return the KV cache
+            position_ids: Optional position IDs (default: derived by the model)
 
-            outputs = self.model(input_ids, attention_mask=attention_mask)
-            logits = outputs.logits
+        Returns:
+            Tuple of (states, past_key_values) where states are final hidden
+            states or, without a split head, logits.
+        """
+        # If steering manager is provided, set the attention mask
+        if steering_manager is not None:
+            steering_manager._current_attention_mask = (
+                attention_mask if steering_mask is None else steering_mask
+            )
 
+        try:
+            if self._split_head:
+                # Run the body only; the head is applied to scored positions
+                outputs = self.model.base_model(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past_key_values,
+                    use_cache=use_cache,
+                )
+                states = outputs[0]
+            else:
+                outputs = self.model(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past_key_values,
+                    use_cache=use_cache,
+                )
+                states = outputs.logits
+        finally:
             # Clear the attention mask after use
             if steering_manager is not None:
                 steering_manager._current_attention_mask = None
 
-        # 4. Calculate log-probs
-        log_probs = torch.log_softmax(logits, dim=-1)
+        return states, outputs.past_key_values if use_cache else None
 
-        # Shift
-        shift_log_probs = log_probs[:, :-1, :]
-        shift_labels = input_ids[:, 1:]
+    def _score_batch(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        scored: torch.Tensor,
+        steering_manager=None,
+        with_stats: bool = False,
+    ) -> torch.Tensor:
+        """
+        Score a padded batch in one forward pass.
 
-        # Gather target log probs
-        target_log_probs = shift_log_probs.gather(2, shift_labels.unsqueeze(2)).squeeze(
-            2
-        )
+        Returns:
+            float32 scores on the model device as returned by _score_positions,
+            NaN where not scored
+        """
+        with torch.no_grad():
+            device_input_ids = input_ids.to(self.model.device)
+            states, _ = self._forward(
+                device_input_ids, attention_mask.to(self.model.device), steering_manager
+            )
+            return self._score_positions(
+                states, device_input_ids, scored.to(states.device), with_stats
+            )
+
+    def _score_shared_prefix(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        scored: torch.Tensor,
+        locations: list[dict],
+        steering_manager=None,
+        with_stats: bool = False,
+    ) -> torch.Tensor:
+        """
+        Score a batch, running each distinct prompt prefix only once.
 
-        # 5. Process each sample
-        results = []
-        for i, meta in enumerate(batch_metadata):
-            # With right padding, valid tokens start at 0 and end where mask becomes 0
-            valid_len = attention_mask[i].sum().item()
-
-            # Extract the valid sequence for this sample
-            sample_input_ids = input_ids[i, :valid_len]
-            sample_target_log_probs = target_log_probs[
-                i, : valid_len - 1
-            ]  # target_log_probs is 1 shorter
-
-            # Now we need to find the prompt boundaries within this valid sequence.
-            system_prompt = meta["system_prompt"]
-            task_prompt = meta["task_prompt"]
-            use_sys = meta["use_system_prompt"]
-            role_name = meta["role_name"]
-            task_name = meta["task_name"]
-
-            # 1. System Prompt Boundary
-            system_end_idx = -1
-            user_end_idx = -1
+        Samples whose tokens start with the same rendered system+user prompt are
+        grouped. The prompt runs once, its KV cache is repeated across the group,
+        and only the response tokens run per sample. Samples that do not start
+        with their rendered prompt are scored with a normal forward pass.
 
-            if use_sys:
-                ids_sys = self.tokenizer.apply_chat_template(
-                    [{"role": "system", "content": system_prompt}],
-                    add_generation_prompt=False,
+        Returns:
+            float32 scores on the model device as returned by _score_positions,
+            NaN where not scored
+        """
+        device = self.model.device
+        shape = (*scored.shape, NUM_SCORE_CHANNELS) if with_stats else scored.shape
+        scores = torch.full(shape, float("nan"), dtype=torch.float32, device=device)
+        lengths = attention_mask.sum(dim=1).tolist()
+
+        groups: dict[tuple[int, ...], list[int]] = {}
+        ungrouped = []
+        for i, location in enumerate(locations):
+            prompt_ids = location["prompt_ids"]
+            prefix_len = len(prompt_ids)
+            if lengths[i] > prefix_len and (
+                tuple(input_ids[i, :prefix_len].tolist()) == prompt_ids
+            ):
+                groups.setdefault(prompt_ids, []).append(i)
+            else:
+                ungrouped.append(i)
+
+        with torch.no_grad():
+            for prompt_ids, rows in groups.items():
+                prefix_len = len(prompt_ids)
+                group_len = max(lengths[i] for i in rows)
+
+                # Run the shared prompt once and keep its KV cache
+                prefix_ids = torch.tensor([prompt_ids], device=device)
+                prefix_mask = torch.ones_like(prefix_ids)
+                prefix_states, past_key_values = self._forward(
+                    prefix_ids, prefix_mask, steering_manager, use_cache=True
                 )
-                system_end_idx = len(ids_sys) - 1
-
-                ids_sys_user = self.tokenizer.apply_chat_template(
-                    [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": task_prompt},
-                    ],
-                    add_generation_prompt=True,
+                past_key_values.batch_repeat_interleave(len(rows))
+
+                # Score only the responses on top of the repeated cache
+                response_ids = input_ids[rows, prefix_len:group_len].to(device)
+                response_mask = attention_mask[rows, prefix_len:group_len].to(device)
+                response_states, _ = self._forward(
+                    response_ids,
+                    torch.cat(
+                        [prefix_mask.expand(len(rows), -1), response_mask], dim=1
+                    ),
+                    steering_manager,
+                    steering_mask=response_mask,
+                    past_key_values=past_key_values,
                 )
-                user_end_idx = len(ids_sys_user) - 1
-            else:
-                ids_user = self.tokenizer.apply_chat_template(
-                    [{"role": "user", "content": task_prompt}],
-                    add_generation_prompt=True,
+                del past_key_values
+
+                states = torch.cat(
+                    [prefix_states.expand(len(rows), -1, -1), response_states], dim=1
+                )
+                group_ids = input_ids[rows, :group_len].to(device)
+                group_scored = scored[rows, : group_len - 1].to(device)
+                scores[rows, : group_len - 1] = self._score_positions(
+                    states, group_ids, group_scored, with_stats
                 )
-                user_end_idx = len(ids_user) - 1
 
-            response_start_idx = user_end_idx + 1
+        if ungrouped:
+            scores[ungrouped] = self._score_batch(
+                input_ids[ungrouped],
+                attention_mask[ungrouped],
+                scored[ungrouped],
+                steering_manager,
+                with_stats,
+            )
 
-            # Check bounds
-            if response_start_idx >= len(sample_input_ids):
-                # Should not happen if response is not empty
-                avg_log_prob = 0.0
-                first_100 = []
-                first_100_text_len = 0
+        return scores
+
+    @staticmethod
+    def _plan_packs(lengths: list[int], capacity: int) -> list[list[int]]:
+        """
+        Assign samples to packed rows, first fit by decreasing length.
+
+        Args:
+            lengths: Token length of each sample
+            capacity: Maximum number of tokens per row (at least max(lengths))
+
+        Returns:
+            List of rows, each a list of sample indices in packing order
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        packs: list[list[int]] = []
+        loads: list[int] = []
+        for idx in order:
+            for pack, load in enumerate(loads):
+                if load + lengths[idx] <= capacity:
+                    packs[pack].append(idx)
+                    loads[pack] += lengths[idx]
+                    break
             else:
-                # Response log probs
-                # sample_target_log_probs[k] corresponds to sample_input_ids[k+1]
-                # So we want sample_target_log_probs[response_start_idx-1:]
-                response_log_probs = sample_target_log_probs[response_start_idx - 1 :]
-                avg_log_prob = response_log_probs.mean().item()
-
-                # First 100
-                first_100 = response_log_probs[:100].tolist()
-
-                first_100_token_ids = sample_input_ids[
-                    response_start_idx : response_start_idx + 100
-                ]
-                first_100_text = self.tokenizer.decode(
-                    first_100_token_ids, skip_special_tokens=True
+                packs.append([idx])
+                loads.append(lengths[idx])
+        return packs
+
+    def _score_packed(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        scored: torch.Tensor,
+        pack_length: int,
+        steering_manager=None,
+        with_stats: bool = False,
+    ) -> torch.Tensor:
+        """
+        Score a batch with samples packed end to end instead of padded.
+
+        Samples are placed into rows of max(pack_length, longest sample) tokens.
+        Each sample keeps its own position IDs, and a block-diagonal causal 4D
+        attention mask stops it from attending to the samples packed before it,
+        so its log-probs match a padded forward pass. The mask is additive (0
+        where attention is allowed, the dtype minimum elsewhere), which eager
+        and SDPA attention both apply as is; other attention backends are
+        rejected.
+
+        Returns:
+            float32 scores on the model device as returned by _score_positions,
+            in the padded (batch, seq - 1) layout, NaN where not scored
+        """
+        attn_implementation = getattr(self.model.config, "_attn_implementation", None)
+        if attn_implementation not in PACKED_ATTN_IMPLEMENTATIONS:
+            raise ValueError(
+                f"pack_length needs one of {PACKED_ATTN_IMPLEMENTATIONS} attention, "
+                f"got {attn_implementation!r}"
+            )
+
+        device = self.model.device
+        num_samples, seq_len = input_ids.shape
+        lengths = attention_mask.sum(dim=1).tolist()
+        packs = self._plan_packs(lengths, max(pack_length, max(lengths)))
+        packed_len = max(sum(lengths[i] for i in pack) for pack in packs)
+
+        pad_token_id = self.tokenizer.pad_token_id or 0
+        packed_ids = torch.full((len(packs), packed_len), pad_token_id)
+        position_ids = torch.zeros((len(packs), packed_len), dtype=torch.long)
+        # Each sample is its own segment; the padded tail of a row is one more
+        segments = torch.full((len(packs), packed_len), -1)
+        packed_scored = torch.zeros((len(packs), packed_len - 1), dtype=torch.bool)
+        # Where each sample's targets sit in the packed and the padded layout
+        src_rows, src_cols, dst_rows, dst_cols = [], [], [], []
+        for row, pack in enumerate(packs):
+            offset = 0
+            for idx in pack:
+                length = lengths[idx]
+                end = offset + length
+                packed_ids[row, offset:end] = input_ids[idx, :length]
+                position_ids[row, offset:end] = torch.arange(length)
+                segments[row, offset:end] = idx
+                packed_scored[row, offset : end - 1] = scored[idx, : length - 1]
+                src_rows.append(torch.full((length - 1,), row))
+                src_cols.append(torch.arange(offset, end - 1))
+                dst_rows.append(torch.full((length - 1,), idx))
+                dst_cols.append(torch.arange(length - 1))
+                offset = end
+
+        causal = torch.ones(packed_len, packed_len, dtype=torch.bool).tril()
+        block_mask = (segments[:, :, None] == segments[:, None, :]) & causal
+        dtype = self.model.dtype
+        additive_mask = torch.zeros(block_mask.shape, dtype=dtype).masked_fill(
+            ~block_mask, torch.finfo(dtype).min
+        )
+
+        with torch.no_grad():
+            device_ids = packed_ids.to(device)
+            states, _ = self._forward(
+                device_ids,
+                additive_mask[:, None].to(device),
+                steering_manager,
+                steering_mask=(segments >= 0).long().to(device),
+                position_ids=position_ids.to(device),
+            )
+            packed_scores = self._score_positions(
+                states, device_ids, packed_scored.to(device), with_stats
+            )
+
+            shape = (num_samples, max(seq_len - 1, 0))
+            if with_stats:
+                shape = (*shape, NUM_SCORE_CHANNELS)
+            scores = torch.full(shape, float("nan"), dtype=torch.float32, device=device)
+            scores[torch.cat(dst_rows), torch.cat(dst_cols)] = packed_scores[
+                torch.cat(src_rows), torch.cat(src_cols)
+            ]
+            return scores
+
+    def _build_response_logits(
+        self,
+        meta: dict,
+        location: dict,
+        sample_input_ids: torch.Tensor,
+        sample_scores: torch.Tensor,
+        return_trajectory: bool = False,
+    ) -> ResponseLogits:
+        """
+        Assemble the ResponseLogits of one sample from its scores.
+
+        sample_scores is (seq - 1) log-probs, or (seq - 1, NUM_SCORE_CHANNELS)
+        when distribution statistics were computed.
+        """
+        sample_stats = None
+        if sample_scores.dim() == 2:
+            sample_stats = sample_scores[:, 1:]
+            sample_target_log_probs = sample_scores[:, 0]
+        else:
+            sample_target_log_probs = sample_scores
+
+        trajectory_ids = None
+        trajectory_log_probs = None
+        entropies = ranks = top_k_log_mass = None
+        if location["response"] is None:
+            # Should not happen if response is not empty
+            avg_log_prob = 0.0
+            first_100 = []
+            first_100_text_len = 0
+            if return_trajectory:
+                trajectory_ids = np.zeros(0, dtype=np.int32)
+                trajectory_log_probs = np.zeros(0, dtype=np.float16)
+            if sample_stats is not None:
+                entropies, ranks, top_k_log_mass = [], [], []
+        else:
+            response_log_probs = sample_target_log_probs[location["response"]]
+            avg_log_prob = response_log_probs.mean().item()
+
+            if return_trajectory:
+                # Target k is the token at input position k + 1
+                span = location["response"]
+                trajectory_ids = (
+                    sample_input_ids[span.start + 1 : span.stop + 1]
+                    .to(torch.int32)
+                    .cpu()
+                    .numpy()
                 )
-                first_100_text_len = len(first_100_text)
-
-            # Role metrics
-            role_period_log_prob = None
-            role_log_probs_val = None
-
-            if use_sys and role_name:
-                # Find role in system prompt
-                sys_text_ids = self.tokenizer(system_prompt, add_special_tokens=False)[
-                    "input_ids"
-                ]
-                role_ids = self.tokenizer(role_name, add_special_tokens=False)[
-                    "input_ids"
-                ]
-
-                full_ids_list = sample_input_ids.tolist()
-
-                # Search within system prompt range
-                sys_search_end = min(system_end_idx + 1, len(full_ids_list))
-                sys_start_idx = self._find_subsequence(
-                    full_ids_list[:sys_search_end], sys_text_ids
+                trajectory_log_probs = (
+                    response_log_probs.to(torch.float16).cpu().numpy()
                 )
 
-                if sys_start_idx != -1:
-                    role_in_sys_idx = self._find_subsequence(sys_text_ids, role_ids)
-
-                    if role_in_sys_idx != -1:
-                        role_start_idx = sys_start_idx + role_in_sys_idx
-                        role_end_idx = role_start_idx + len(role_ids)
-
-                        # Log probs
-                        role_log_probs_tokens = sample_target_log_probs[
-                            role_start_idx - 1 : role_end_idx - 1
-                        ]
-                        role_log_probs_val = role_log_probs_tokens.sum().item()
-
-                        # Period
-                        search_start = role_end_idx
-                        for k in range(search_start, sys_start_idx + len(sys_text_ids)):
-                            if (
-                                k < len(sample_input_ids)
-                                and sample_input_ids[k].item() in self.period_token_ids
-                            ):
-                                role_period_log_prob = sample_target_log_probs[
-                                    k - 1
-                                ].item()
-                                break
+            # First 100
+            first_100 = response_log_probs[:100].tolist()
+            if sample_stats is not None:
+                first_100_stats = sample_stats[location["response"]][:100]
+                entropies = first_100_stats[:, 0].tolist()
+                ranks = first_100_stats[:, 1].long().tolist()
+                top_k_log_mass = first_100_stats[:, 2].tolist()
+
+            response_start_idx = location["response_start_idx"]
+            first_100_token_ids = sample_input_ids[
+                response_start_idx : response_start_idx + 100
+            ]
+            first_100_text = self.tokenizer.decode(
+                first_100_token_ids, skip_special_tokens=True
+            )
+            first_100_text_len = len(first_100_text)
+
+        # Role metrics
+        role_log_probs_val = None
+        role_period_log_prob = None
+        if location["role"] is not None:
+            role_log_probs_val = sample_target_log_probs[location["role"]].sum().item()
+        if location["period"] is not None:
+            role_period_log_prob = sample_target_log_probs[location["period"]].item()
+
+        return ResponseLogits(
+            role_name=meta["role_name"],
+            task_name=meta["task_name"],
+            sample_idx=meta["sample_idx"],
+            average_log_probs=avg_log_prob,
+            role_log_probs=role_log_probs_val,
+            role_period_log_prob=role_period_log_prob,
+            first_100_response_log_probs=first_100,
+            first_100_response_text_len=first_100_text_len,
+            first_100_response_entropies=entropies,
+            first_100_response_target_ranks=ranks,
+            first_100_response_top_k_log_mass=top_k_log_mass,
+            response_token_ids=trajectory_ids,
+            response_log_probs=trajectory_log_probs,
+        )
+
+    def _locate_scored_positions(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        batch_metadata: list[dict],
+    ) -> list[dict]:
+        """
+        Find which next-token log-probs each sample of a batch needs.
+
+        Prompt boundaries come from the shared boundary cache. Prefix checks,
+        subsequence searches and period lookups then run as tensor operations
+        over the whole batch, on the device of input_ids, with a single transfer
+        of the results to the host.
+
+        Positions index the shifted targets: entry k scores input_ids[:, k + 1].
+
+        Args:
+            input_ids: Right-padded token IDs (batch, seq)
+            attention_mask: Attention mask (batch, seq)
+            batch_metadata: Sample metadata built by _prepare_samples
+
+        Returns:
+            One dict per sample with prompt_ids, response_start_idx, response
+            (slice or None), role (slice or None) and period (int or None)
+        """
+        device = input_ids.device
+        num_rows, seq_len = input_ids.shape
+        lengths = attention_mask.sum(dim=1)
+        positions = torch.arange(seq_len, device=device)
+        no_index = torch.full((num_rows,), -1, dtype=torch.long, device=device)
+
+        boundaries = [self._boundaries(meta) for meta in batch_metadata]
+        has_role = [
+            bool(meta["use_system_prompt"] and meta["role_name"])
+            for meta in batch_metadata
+        ]
+
+        system_end = torch.tensor([b.system_end_idx for b in boundaries], device=device)
+        sys_search_end = torch.minimum(system_end + 1, lengths)
+        sys_len = torch.tensor([len(b.sys_text_ids) for b in boundaries], device=device)
+
+        # Rows that start with the rendered system prefix reuse the cached
+        # position of the system text; the rest search their own tokens
+        sys_start = no_index.clone()
+        role_rows = [i for i in range(num_rows) if has_role[i]]
+        if role_rows:
+            prefix_width = min(
+                max(len(boundaries[i].prefix_ids) for i in role_rows), seq_len
+            )
+            expected = torch.full((num_rows, prefix_width), -1, dtype=input_ids.dtype)
+            prefix_fits = torch.zeros(num_rows, dtype=torch.bool)
+            cached_start = torch.full((num_rows,), -1, dtype=torch.long)
+            for i in role_rows:
+                prefix = boundaries[i].prefix_ids
+                if len(prefix) <= prefix_width:
+                    expected[i, : len(prefix)] = torch.tensor(prefix)
+                    prefix_fits[i] = True
+                cached_start[i] = boundaries[i].sys_start_idx
+            expected = expected.to(device)
+            prefix_match = (
+                (input_ids[:, :prefix_width] == expected) | (expected < 0)
+            ).all(dim=1) & prefix_fits.to(device)
+            sys_start = torch.where(prefix_match, cached_start.to(device), sys_start)
+
+            # Search rows without the cached prefix, grouped by system text
+            unmatched = (~prefix_match).tolist()
+            searches: dict[tuple[int, ...], list[int]] = {}
+            for i in role_rows:
+                if not unmatched[i]:
+                    continue
+                if boundaries[i].sys_text_ids:
+                    searches.setdefault(boundaries[i].sys_text_ids, []).append(i)
                 else:
-                    # Fallback
-                    for k in range(system_end_idx, -1, -1):
-                        if (
-                            k < len(sample_input_ids)
-                            and sample_input_ids[k].item() in self.period_token_ids
-                        ):
-                            if role_period_log_prob is None:
-                                role_period_log_prob = sample_target_log_probs[
-                                    k - 1
-                                ].item()
-                            break
-
-            results.append(
-                ResponseLogits(
-                    role_name=role_name,
-                    task_name=task_name,
-                    sample_idx=meta["sample_idx"],
-                    average_log_probs=avg_log_prob,
-                    role_log_probs=role_log_probs_val,
-                    role_period_log_prob=role_period_log_prob,
-                    first_100_response_log_probs=first_100,
-                    first_100_response_text_len=first_100_text_len,
+                    # An empty system text matches at the start
+                    sys_start[i] = 0
+            for sys_text_ids, rows in searches.items():
+                rows_index = torch.tensor(rows, device=device)
+                sys_start[rows_index] = self._find_subsequence_batch(
+                    input_ids[rows_index],
+                    torch.tensor(sys_text_ids, dtype=input_ids.dtype),
+                    sys_search_end[rows_index],
                 )
+
+        role_offset = torch.tensor([b.role_offset for b in boundaries], device=device)
+        role_len = torch.tensor([b.role_len for b in boundaries], device=device)
+        role_found = (sys_start != -1) & (role_offset != -1)
+        role_start = sys_start + role_offset
+        role_end = role_start + role_len
+
+        # Period tokens of every position, looked up in the vocab mask at once
+        is_period = self.period_token_mask.to(device)[input_ids]
+
+        # First period after the role, within the system text
+        after_role = (positions >= role_end.unsqueeze(1)) & (
+            positions < (sys_start + sys_len).unsqueeze(1)
+        )
+        period_after = is_period & after_role & role_found.unsqueeze(1)
+        first_period = torch.where(
+            period_after.any(dim=1), period_after.int().argmax(dim=1), no_index
+        )
+
+        # Fallback when the system text is not found: last period up to the end
+        # of the system turn
+        up_to_system_end = positions <= torch.minimum(
+            system_end, lengths - 1
+        ).unsqueeze(1)
+        period_before = is_period & up_to_system_end & (sys_start == -1).unsqueeze(1)
+        last_period = torch.where(
+            period_before.any(dim=1),
+            seq_len - 1 - period_before.flip(dims=[1]).int().argmax(dim=1),
+            no_index,
+        )
+
+        # One transfer of everything the host needs
+        (
+            lengths,
+            sys_start,
+            role_found,
+            role_start,
+            role_end,
+            first_period,
+            last_period,
+        ) = (
+            t.tolist()
+            for t in (
+                lengths,
+                sys_start,
+                role_found,
+                role_start,
+                role_end,
+                first_period,
+                last_period,
             )
+        )
+
+        locations = []
+        for i, b in enumerate(boundaries):
+            targets = range(lengths[i] - 1)
+            response_start_idx = b.user_end_idx + 1
+            location = {
+                "prompt_ids": b.prompt_ids,
+                "response_start_idx": response_start_idx,
+                "response": None,
+                "role": None,
+                "period": None,
+            }
+
+            # Check bounds
+            if response_start_idx < lengths[i]:
+                # targets[k] corresponds to input_ids[k+1]
+                # So the response is scored by targets[response_start_idx-1:]
+                span = targets[response_start_idx - 1 :]
+                location["response"] = slice(span.start, span.stop)
+
+            if has_role[i]:
+                if role_found[i]:
+                    span = targets[role_start[i] - 1 : role_end[i] - 1]
+                    location["role"] = slice(span.start, span.stop)
+                    if first_period[i] != -1:
+                        location["period"] = targets[first_period[i] - 1]
+                elif sys_start[i] == -1 and last_period[i] != -1:
+                    location["period"] = targets[last_period[i] - 1]
+
+            locations.append(location)
 
-        return results
+        return locations
@@ -0,0 +1,204 @@
+"""
+Ragged per-token response trajectories.
+
+Trajectories are stored as Parquet list columns next to the scalar
+ResponseLogits fields: response_token_ids (list<int32>) and response_log_probs
+(list<float16>), plus response_log_prob_deltas (list<float16>) for paired rows.
+Parquet stores a list column as one flat value array plus offsets, so this is
+the ragged layout on disk, and load_trajectories hands it back as flat NumPy
+arrays and an offsets index.
+"""
+
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from animacy.storage import FragmentSink
+
+from .logits import PairedResponseLogits, ResponseLogits
+
+#: Columns that identify a response.
+KEY_COLUMNS = ("role_name", "task_name", "sample_idx", "condition")
+
+#: List columns holding the trajectory of each response. Paired rows also hold
+#: response_log_prob_deltas (with minus without system prompt).
+TRAJECTORY_COLUMNS = ("response_token_ids", "response_log_probs")
+PAIRED_TRAJECTORY_COLUMNS = (*TRAJECTORY_COLUMNS, "response_log_prob_deltas")
+
+
+def response_rows(
+    results: Iterable[ResponseLogits], condition: str, trajectories: bool = False
+) -> list[dict[str, Any]]:
+    """
+    Convert ResponseLogits into output table rows.
+
+    Args:
+        results: Results of LogitExtractor.extract_logits_batch
+        condition: Condition label stored with every row ("with_sys"/"no_sys")
+        trajectories: Whether to add the trajectory list columns. The results
+            must then have been extracted with return_trajectories=True.
+
+    Returns:
+        One dict per result
+    """
+    rows = []
+    for result in results:
+        row = {**result.model_dump(), "condition": condition}
+        if trajectories:
+            if result.response_log_probs is None:
+                raise ValueError(
+                    "Result has no trajectory; extract with return_trajectories=True"
+                )
+            row["response_token_ids"] = result.response_token_ids
+            row["response_log_probs"] = result.response_log_probs
+        rows.append(row)
+    return rows
+
+
+def paired_rows(
+    results: Iterable[PairedResponseLogits], trajectories: bool = False
+) -> list[dict[str, Any]]:
+    """
+    Convert PairedResponseLogits into one wide output row per sample.
+
+    Scalar ResponseLogits fields get a _with_sys or _no_sys suffix, and the
+    condition column is "paired".
+
+    Args:
+        results: Results of LogitExtractor.extract_paired_logits_batch
+        trajectories: Whether to add the trajectory list columns. Token IDs and
+            log-probs are those of the with-system-prompt condition.
+
+    Returns:
+        One dict per result
+    """
+    rows = []
+    for result in results:
+        row = {
+            "role_name": result.role_name,
+            "task_name": result.task_name,
+            "sample_idx": result.sample_idx,
+            "condition": "paired",
+        }
+        for suffix, logits in (
+            ("with_sys", result.with_system),
+            ("no_sys", result.without_system),
+        ):
+            fields = logits.model_dump(exclude={"role_name", "task_name", "sample_idx"})
+            row.update({f"{name}_{suffix}": value for name, value in fields.items()})
+        row["average_log_prob_delta"] = result.average_log_prob_delta
+        row["first_100_log_prob_deltas"] = result.first_100_log_prob_deltas
+        if trajectories:
+            if result.response_log_prob_deltas is None:
+                raise ValueError(
+                    "Result has no trajectory; extract with return_trajectories=True"
+                )
+            row["response_token_ids"] = result.with_system.response_token_ids
+            row["response_log_probs"] = result.with_system.response_log_probs
+            row["response_log_prob_deltas"] = result.response_log_prob_deltas
+        rows.append(row)
+    return rows
+
+
+class Trajectories(NamedTuple):
+    """
+    Response trajectories in ragged form.
+
+    The trajectory of response i is token_ids[offsets[i]:offsets[i + 1]] and
+    log_probs[offsets[i]:offsets[i + 1]].
+    """
+
+    keys: pd.DataFrame  # One row per response, KEY_COLUMNS
+    token_ids: np.ndarray  # int32, all responses concatenated
+    log_probs: np.ndarray  # float16, aligned with token_ids
+    offsets: np.ndarray  # int64, len(keys) + 1
+
+    def get(self, index: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Token IDs and log-probs of one response.
+
+        Args:
+            index: Row of keys
+
+        Returns:
+            Tuple of (token_ids, log_probs) views
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.token_ids[start:end], self.log_probs[start:end]
+
+
+def _flatten(column: pa.ChunkedArray, dtype: np.dtype) -> np.ndarray:
+    """Concatenate the values of a list column into one NumPy array."""
+    values = [chunk.flatten().to_numpy(zero_copy_only=False) for chunk in column.chunks]
+    if not values:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(values).astype(dtype, copy=False)
+
+
+def load_trajectories(
+    root: str | Path, log_prob_column: str = "response_log_probs", **filters: Any
+) -> Trajectories:
+    """
+    Load the trajectories written by extract_logits.py --trajectories.
+
+    Fragments written without trajectories are skipped.
+
+    Args:
+        root: Output directory of extract_logits.py
+        log_prob_column: List column to load as log_probs; use
+            "response_log_prob_deltas" for the deltas of paired rows
+        **filters: Optional equality filters on KEY_COLUMNS (e.g. condition="no_sys")
+
+    Returns:
+        Trajectories of the matching responses, in write order
+    """
+    unknown = set(filters) - set(KEY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown filter columns: {sorted(unknown)}")
+
+    columns = [*KEY_COLUMNS, "response_token_ids", log_prob_column]
+    tables = [
+        pq.read_table(path, columns=columns)
+        for path in FragmentSink(root).fragments()
+        if set(columns) <= set(pq.read_schema(path).names)
+    ]
+    if not tables:
+        return Trajectories(
+            keys=pd.DataFrame(columns=list(KEY_COLUMNS)),
+            token_ids=np.zeros(0, dtype=np.int32),
+            log_probs=np.zeros(0, dtype=np.float16),
+            offsets=np.zeros(1, dtype=np.int64),
+        )
+    table = pa.concat_tables(tables, promote_options="default")
+
+    mask = None
+    for column, value in filters.items():
+        if value is None:
+            match = pc.is_null(table[column])
+        else:
+            match = pc.equal(table[column], value)
+        mask = match if mask is None else pc.and_(mask, match)
+    if mask is not None:
+        table = table.filter(mask)
+
+    keys = table.select(list(KEY_COLUMNS)).to_pandas()
+    # The no-role condition is stored as a null role name
+    role_names = keys["role_name"].astype(object)
+    keys["role_name"] = role_names.where(role_names.notna(), None)
+
+    lengths = pc.list_value_length(table[log_prob_column]).to_numpy()
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return Trajectories(
+        keys=keys,
+        token_ids=_flatten(table["response_token_ids"], np.int32),
+        log_probs=_flatten(table[log_prob_column], np.float16),
+        offsets=offsets,
+    )
@@ -0,0 +1,43 @@
+"""
+Length-sorted micro-batch planning shared by the extractors.
+"""
+
+
+def plan_batches(
+    lengths: list[int], batch_size: int, max_batch_tokens: int | None = None
+) -> list[list[int]]:
+    """
+    Group item indices into length-sorted micro-batches.
+
+    Items are sorted longest first so that an out-of-memory batch surfaces
+    immediately, and a batch is closed once adding the next item would exceed
+    either the row limit or the padded token budget.
+
+    Args:
+        lengths: Token length of each item
+        batch_size: Maximum number of items per batch
+        max_batch_tokens: Optional limit on rows x longest row per batch
+
+    Returns:
+        List of batches, each a list of indices into lengths
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches: list[list[int]] = []
+    current: list[int] = []
+    for idx in order:
+        if current:
+            # Sorted descending, so the first item sets the batch width
+            padded_tokens = lengths[current[0]] * (len(current) + 1)
+            over_budget = (
+                max_batch_tokens is not None and padded_tokens > max_batch_tokens
+            )
+            if len(current) >= batch_size or over_budget:
+                batches.append(current)
+                current = []
+        current.append(idx)
+
+    if current:
+        batches.append(current)
+
+    return batches
@@ -28,6 +28,88 @@ class SteeringManager:
         self.tokenizer = tokenizer
         self._layers = self._find_layers()
         self._current_attention_mask: torch.Tensor | None = None
+        # Layers currently steered with one vector per row
+        self._row_steered_layers: set[int] = set()
+
+    @property
+    def steers_per_row(self) -> bool:
+        """Whether any active steering vector holds one vector per batch row."""
+        return bool(self._row_steered_layers)
+
+    @property
+    def _current_attention_mask(self) -> torch.Tensor | None:
+        """Attention mask of the batch being run, set by the caller."""
+        return self._attention_mask
+
+    @_current_attention_mask.setter
+    def _current_attention_mask(self, mask: torch.Tensor | None) -> None:
+        self._attention_mask = mask
+        # Casts of the mask to hidden-state dtypes, shared by all steered layers
+        self._cast_masks: dict[torch.dtype, torch.Tensor] = {}
+
+    def _steering_mask(
+        self, attention_mask: torch.Tensor | None, dtype: torch.dtype
+    ) -> torch.Tensor | None:
+        """
+        (batch, seq_len, 1) mask of the positions to steer, in the given dtype.
+
+        The current batch's mask is cast once per dtype rather than once per
+        steered layer.
+        """
+        if attention_mask is not None:
+            return attention_mask.unsqueeze(-1).to(dtype)
+        if self._attention_mask is None:
+            return None
+        cast = self._cast_masks.get(dtype)
+        if cast is None:
+            cast = self._attention_mask.unsqueeze(-1).to(dtype)
+            self._cast_masks[dtype] = cast
+        return cast
+
+    def steer_output(
+        self,
+        output: torch.Tensor | tuple,
+        vector: torch.Tensor,
+        layer_idx: int,
+        attention_mask: torch.Tensor | None = None,
+    ) -> torch.Tensor | tuple:
+        """
+        Add a steering vector to a layer's output.
+
+        Args:
+            output: Layer output, either hidden states or a tuple starting with them.
+            vector: Prepared (hidden,) vector, or (batch, hidden) for one per row.
+            layer_idx: Index of the layer, for error messages.
+            attention_mask: Optional mask of the positions to steer. Defaults to
+                            the current batch's mask, or all positions if unset.
+
+        Returns:
+            Output of the same structure with steered hidden states.
+        """
+        # output is usually a tuple (hidden_states, ...) or just hidden_states
+        hidden_states = output[0] if isinstance(output, tuple) else output
+
+        # Hidden states shape: (batch, seq_len, hidden_dim)
+        if vector.dim() == 2:
+            if hidden_states.shape[0] != vector.shape[0]:
+                raise ValueError(
+                    f"Per-row steering vectors for {vector.shape[0]} rows applied "
+                    f"to a batch of {hidden_states.shape[0]} at layer {layer_idx}"
+                )
+            # (batch, hidden) -> (batch, 1, hidden) to broadcast over positions
+            vector = vector.unsqueeze(1)
+
+        # Only apply steering to non-padded positions
+        mask = self._steering_mask(attention_mask, hidden_states.dtype)
+        if mask is not None:
+            steered_hidden_states = hidden_states + vector * mask
+        else:
+            steered_hidden_states = hidden_states + vector
+
+        if isinstance(output, tuple):
+            # Return new tuple with modified hidden states
+            return (steered_hidden_states,) + output[1:]
+        return steered_hidden_states
 
     def _find_layers(self) -> nn.ModuleList:
         """
@@ -134,6 +216,36 @@ class SteeringManager:
 
         return processed_vectors
 
+    def stack_row_vectors(
+        self, row_vectors: list[dict[int, torch.Tensor]], layers: Iterable[int]
+    ) -> dict[int, torch.Tensor]:
+        """
+        Stack prepared per-row vectors into one (batch, hidden) tensor per layer.
+
+        Each row is steered with its own vector, so a single batch can mix roles
+        and magnitudes. Rows without a vector for a layer get a zero vector there,
+        which leaves them unsteered at that layer.
+
+        Args:
+            row_vectors: One dict of prepared vectors (see prepare_vectors) per row.
+            layers: Layer indices to stack.
+
+        Returns:
+            Dictionary mapping layer indices to (batch, hidden) tensors, for use
+            with apply_steering(pre_processed=True).
+        """
+        stacked = {}
+        for layer_idx in layers:
+            vectors = [row.get(layer_idx) for row in row_vectors]
+            present = [vector for vector in vectors if vector is not None]
+            if not present:
+                continue
+            zeros = torch.zeros_like(present[0])
+            stacked[layer_idx] = torch.stack(
+                [zeros if vector is None else vector for vector in vectors]
+            )
+        return stacked
+
     @contextlib.contextmanager
     def apply_steering(
         self,
@@ -148,6 +260,9 @@ class SteeringManager:
 
         Args:
             steering_vectors: Dictionary mapping layer indices to steering vectors.
+                              A vector of shape (hidden,) is added to every row;
+                              one of shape (batch, hidden) gives each row its own
+                              vector (see stack_row_vectors).
             layers: Iterable of layer indices to apply steering to.
             magnitude: Multiplier for the steering vector strength.
             pre_processed: If True, assumes vectors are already normalized,
@@ -157,6 +272,7 @@ class SteeringManager:
                            If None, applies to all positions.
         """
         handles = []
+        row_steered: set[int] = set()
 
         if pre_processed:
             processed_vectors = steering_vectors
@@ -167,42 +283,7 @@ class SteeringManager:
 
         def create_hook(layer_idx, vector):
             def hook(module, input, output):
-                # output is usually a tuple (hidden_states, ...) or just hidden_states
-                if isinstance(output, tuple):
-                    hidden_states = output[0]
-                    # Add vector to hidden states
-                    # Vector shape: (hidden_dim,) or broadcastable
-                    # Hidden states shape: (batch, seq_len, hidden_dim)
-
-                    # Use the attention mask stored in the manager
-                    mask_to_use = (
-                        attention_mask
-                        if attention_mask is not None
-                        else self._current_attention_mask
-                    )
-
-                    if mask_to_use is not None:
-                        # Only apply steering to non-padded positions
-                        # Expand mask to match hidden_states shape: (batch, seq_len, 1)
-                        mask = mask_to_use.unsqueeze(-1).to(hidden_states.dtype)
-                        steered_hidden_states = hidden_states + vector * mask
-                    else:
-                        steered_hidden_states = hidden_states + vector
-
-                    # Return new tuple with modified hidden states
-                    return (steered_hidden_states,) + output[1:]
-                else:
-                    mask_to_use = (
-                        attention_mask
-                        if attention_mask is not None
-                        else self._current_attention_mask
-                    )
-
-                    if mask_to_use is not None:
-                        mask = mask_to_use.unsqueeze(-1).to(output.dtype)
-                        return output + vector * mask
-                    else:
-                        return output + vector
+                return self.steer_output(output, vector, layer_idx, attention_mask)
 
             return hook
 
@@ -215,9 +296,13 @@ class SteeringManager:
                         create_hook(layer_idx, vector)
                     )
                     handles.append(handle)
+                    if vector.dim() == 2:
+                        row_steered.add(layer_idx)
+            self._row_steered_layers |= row_steered
 
             yield
 
         finally:
             for handle in handles:
                 handle.remove()
+            self._row_steered_layers -= row_steered
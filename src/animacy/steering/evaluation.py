@@ -2,14 +2,47 @@
 Evaluation tools for steered models.
 """
 
+import contextlib
+from collections.abc import Generator
 from typing import Any
 
 import torch
 from transformers import PreTrainedModel, PreTrainedTokenizer
 
-from animacy.analysis.logits import LogitExtractor, ResponseLogits
+from animacy.analysis.logits import ResponseLogits
 
-from .core import SteeringManager
+from .session import SteeringSession
+
+
+@contextlib.contextmanager
+def _steering_session(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    layers: list[int],
+    session: SteeringSession | None,
+) -> Generator[SteeringSession, None, None]:
+    """
+    Yield the given session, or a temporary one hooking layers.
+
+    Steering of a given session is cleared on entry and exit, but its hooks stay
+    installed.
+    """
+    if session is None:
+        with SteeringSession(model, tokenizer, layers) as session:
+            yield session
+        return
+
+    if not session.installed:
+        raise ValueError("SteeringSession must be entered before use")
+    missing = sorted(set(layers) - set(session.layers))
+    if missing:
+        raise ValueError(f"Layers {missing} are not hooked by the session")
+    # Vectors left from a previous sweep point must not steer this call
+    session.clear()
+    try:
+        yield session
+    finally:
+        session.clear()
 
 
 def evaluate_steered_logits(
@@ -21,6 +54,9 @@ def evaluate_steered_logits(
     samples: list[dict[str, Any]],
     use_system_prompt: bool = True,
     batch_size: int = 1,
+    share_prefix: bool = False,
+    pack_length: int | None = None,
+    session: SteeringSession | None = None,
 ) -> list[ResponseLogits]:
     """
     Evaluate logits for a set of samples while applying steering vectors.
@@ -40,33 +76,218 @@ def evaluate_steered_logits(
                  - task_prompt (str, optional): Custom task/user prompt
         use_system_prompt: Whether to use the system prompt in logit extraction.
         batch_size: Batch size for processing.
+        share_prefix: Run each distinct prompt once per batch and reuse its KV
+                      cache for all responses to it.
+        pack_length: Pack each batch into rows of at least this many tokens
+                     instead of padding it.
+        session: Optional entered SteeringSession hooking all of layers, reused
+                 instead of setting up steering for this call.
 
     Returns:
         List of ResponseLogits objects.
     """
-    steering_manager = SteeringManager(model, tokenizer)
-    logit_extractor = LogitExtractor(model, tokenizer)
-
     results = []
 
-    # Pre-process vectors once
-    prepared_vectors = steering_manager.prepare_vectors(
-        steering_vectors, layers, magnitude
-    )
+    with _steering_session(model, tokenizer, layers, session) as session:
+        # Pre-process vectors once
+        session.set_vectors(
+            session.manager.prepare_vectors(steering_vectors, layers, magnitude),
+            pre_processed=True,
+        )
 
-    # Apply steering context
-    with steering_manager.apply_steering(
-        prepared_vectors, layers, magnitude, pre_processed=True
-    ):
         # Process in batches
         for i in range(0, len(samples), batch_size):
             batch_samples = samples[i : i + batch_size]
 
-            batch_results = logit_extractor.extract_logits_batch(
+            batch_results = session.logit_extractor.extract_logits_batch(
                 batch_samples,
                 use_system_prompt=use_system_prompt,
-                steering_manager=steering_manager,
+                steering_manager=session.manager,
+                share_prefix=share_prefix,
+                pack_length=pack_length,
             )
             results.extend(batch_results)
 
     return results
+
+
+def evaluate_steered_logits_sweep(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    steering_vectors: dict[int, torch.Tensor],
+    layers: list[int],
+    magnitudes: list[float],
+    samples: list[dict[str, Any]],
+    use_system_prompt: bool = True,
+    batch_size: int = 1,
+    reuse_lower_layers: bool = True,
+    offload_lower_layers: bool = False,
+    session: SteeringSession | None = None,
+) -> dict[float, list[ResponseLogits]]:
+    """
+    Evaluate logits for a set of samples at several steering magnitudes.
+
+    Each sample is rendered and tokenized once. The layers below the lowest
+    steered layer do not depend on the magnitude, so by default they run once
+    per batch and only the layers above are replayed for each magnitude. If
+    the model cannot be split that way, each sample is instead replicated
+    across the magnitudes inside a batch, with every copy steered by its own
+    row of the steering vectors. Either way, results equal those of calling
+    evaluate_steered_logits once per magnitude.
+
+    Args:
+        model: The model to evaluate.
+        tokenizer: The tokenizer.
+        steering_vectors: Dictionary mapping layer indices to steering vectors.
+        layers: List of layers to steer.
+        magnitudes: Steering magnitudes to evaluate.
+        samples: List of sample dictionaries as for evaluate_steered_logits.
+        use_system_prompt: Whether to use the system prompt in logit extraction.
+        batch_size: Number of rows per forward pass. When samples are
+                    replicated, each batch holds batch_size // len(magnitudes)
+                    samples (at least one).
+        reuse_lower_layers: Run the unsteered lower layers once per batch and
+                            replay only the steered upper layers per magnitude,
+                            if the model supports it.
+        offload_lower_layers: Keep the cached lower-layer activations on the
+                              host between replays to save device memory.
+        session: Optional entered SteeringSession hooking all of layers, reused
+                 instead of setting up steering for this call.
+
+    Returns:
+        Dictionary mapping each magnitude to its ResponseLogits, in sample order.
+    """
+    magnitudes = list(dict.fromkeys(magnitudes))
+    results: dict[float, list[ResponseLogits]] = {m: [] for m in magnitudes}
+    if not magnitudes:
+        return results
+
+    with _steering_session(model, tokenizer, layers, session) as session:
+        logit_extractor = session.logit_extractor
+
+        # Pre-process vectors once per magnitude
+        prepared_vectors = [
+            session.manager.prepare_vectors(steering_vectors, layers, magnitude)
+            for magnitude in magnitudes
+        ]
+
+        # Layers below the lowest steered layer are identical for every magnitude
+        split_layer = min(prepared_vectors[0], default=None)
+        if (
+            reuse_lower_layers
+            and split_layer is not None
+            and logit_extractor.supports_lower_stack_reuse(split_layer)
+        ):
+            for i in range(0, len(samples), batch_size):
+                lower_stack = logit_extractor.encode_lower_stack(
+                    samples[i : i + batch_size],
+                    split_layer,
+                    use_system_prompt=use_system_prompt,
+                    offload=offload_lower_layers,
+                )
+                for magnitude, vectors in zip(
+                    magnitudes, prepared_vectors, strict=True
+                ):
+                    session.set_vectors(vectors, pre_processed=True)
+                    results[magnitude].extend(
+                        logit_extractor.extract_logits_from_lower_stack(
+                            lower_stack, steering_manager=session.manager
+                        )
+                    )
+            return results
+
+        samples_per_batch = max(1, batch_size // len(magnitudes))
+        for i in range(0, len(samples), samples_per_batch):
+            batch_samples = samples[i : i + samples_per_batch]
+
+            # Copy c of every sample is steered with magnitude c
+            session.set_vectors(
+                session.manager.stack_row_vectors(
+                    [vectors for vectors in prepared_vectors for _ in batch_samples],
+                    layers,
+                ),
+                pre_processed=True,
+            )
+            batch_results = logit_extractor.extract_logits_replicated(
+                batch_samples,
+                len(magnitudes),
+                use_system_prompt=use_system_prompt,
+                steering_manager=session.manager,
+            )
+
+            for magnitude, copy_results in zip(magnitudes, batch_results, strict=True):
+                results[magnitude].extend(copy_results)
+
+    return results
+
+
+def evaluate_row_steered_logits(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    steering_vectors: dict[str, dict[int, torch.Tensor]],
+    layers: list[int],
+    samples: list[dict[str, Any]],
+    use_system_prompt: bool = True,
+    batch_size: int = 1,
+    session: SteeringSession | None = None,
+) -> list[ResponseLogits]:
+    """
+    Evaluate logits with each sample steered by its own vector and magnitude.
+
+    Batches are filled regardless of which vector or magnitude a sample uses,
+    so a sweep over roles and magnitudes runs in full batches. Each distinct
+    (vector, magnitude) pair is prepared once, exactly as evaluate_steered_logits
+    prepares it, and rows are steered with the attention mask as usual.
+
+    Args:
+        model: The model to evaluate.
+        tokenizer: The tokenizer.
+        steering_vectors: Dictionary mapping a vector name (e.g. a role) to a
+                          dictionary of layer indices to steering vectors.
+        layers: List of layers to steer. A sample whose vector has no entry for
+                a layer is not steered at that layer.
+        samples: List of sample dictionaries as for evaluate_steered_logits, each
+                 also with:
+                 - steering_vector (str): Key into steering_vectors
+                 - steering_magnitude (float): Steering magnitude
+        use_system_prompt: Whether to use the system prompt in logit extraction.
+        batch_size: Batch size for processing.
+        session: Optional entered SteeringSession hooking all of layers, reused
+                 instead of setting up steering for this call.
+
+    Returns:
+        List of ResponseLogits objects, in sample order.
+    """
+    results = []
+
+    with _steering_session(model, tokenizer, layers, session) as session:
+        # Pre-process each (vector, magnitude) pair once
+        prepared: dict[tuple[str, float], dict[int, torch.Tensor]] = {}
+        for sample in samples:
+            key = (sample["steering_vector"], sample["steering_magnitude"])
+            if key not in prepared:
+                prepared[key] = session.manager.prepare_vectors(
+                    steering_vectors[key[0]], layers, key[1]
+                )
+
+        for i in range(0, len(samples), batch_size):
+            batch_samples = samples[i : i + batch_size]
+            session.set_vectors(
+                session.manager.stack_row_vectors(
+                    [
+                        prepared[(s["steering_vector"], s["steering_magnitude"])]
+                        for s in batch_samples
+                    ],
+                    layers,
+                ),
+                pre_processed=True,
+            )
+            results.extend(
+                session.logit_extractor.extract_logits_batch(
+                    batch_samples,
+                    use_system_prompt=use_system_prompt,
+                    steering_manager=session.manager,
+                )
+            )
+
+    return results
@@ -0,0 +1,148 @@
+"""
+SteeringSession - Steering hooks that stay installed across a sweep.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+import torch
+from transformers import PreTrainedModel, PreTrainedTokenizer
+
+from animacy.analysis.logits import LogitExtractor
+
+from .core import SteeringManager
+
+
+class SteeringSession:
+    """
+    Long-lived steering setup for evaluating many steering settings in a row.
+
+    Layers are resolved, and a LogitExtractor built, once per session. Hooks are
+    installed once on entering the session. Each hooked layer reads its vector
+    from a device buffer that set_vectors overwrites in place, so moving to the
+    next sweep point copies one vector per layer instead of registering new
+    hooks.
+
+    Example:
+        with SteeringSession(model, tokenizer, layers=[26, 30]) as session:
+            for magnitude in magnitudes:
+                session.set_vectors(vectors, magnitude)
+                results = session.logit_extractor.extract_logits_batch(
+                    samples, steering_manager=session.manager
+                )
+    """
+
+    def __init__(
+        self,
+        model: PreTrainedModel,
+        tokenizer: PreTrainedTokenizer,
+        layers: Iterable[int],
+    ):
+        """
+        Args:
+            model: The HuggingFace model to steer.
+            tokenizer: The tokenizer associated with the model.
+            layers: Layer indices that can be steered during the session.
+        """
+        self.manager = SteeringManager(model, tokenizer)
+        self.logit_extractor = LogitExtractor(model, tokenizer)
+        self.layers = sorted(set(layers))
+        num_layers = len(self.manager._layers)
+        invalid = [layer for layer in self.layers if not 0 <= layer < num_layers]
+        if invalid:
+            raise ValueError(f"Layers {invalid} out of range for {num_layers} layers")
+
+        self._buffers: dict[int, torch.Tensor] = {}
+        self._active: set[int] = set()
+        self._handles: list[torch.utils.hooks.RemovableHandle] = []
+
+    @property
+    def installed(self) -> bool:
+        """Whether the session's hooks are installed."""
+        return bool(self._handles)
+
+    def __enter__(self) -> "SteeringSession":
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.remove()
+
+    def install(self) -> None:
+        """Install one forward hook per session layer (no-op if installed)."""
+        if self.installed:
+            return
+        for layer_idx in self.layers:
+            self._handles.append(
+                self.manager._layers[layer_idx].register_forward_hook(
+                    self._create_hook(layer_idx)
+                )
+            )
+
+    def remove(self) -> None:
+        """Remove the session's hooks and stop steering."""
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self.clear()
+
+    def _create_hook(self, layer_idx: int):
+        def hook(module, input, output):
+            if layer_idx not in self._active:
+                return None
+            return self.manager.steer_output(
+                output, self._buffers[layer_idx], layer_idx
+            )
+
+        return hook
+
+    def set_vectors(
+        self,
+        steering_vectors: dict[int, torch.Tensor | Any],
+        magnitude: float = 1.0,
+        pre_processed: bool = False,
+    ) -> None:
+        """
+        Steer with new vectors from the next forward pass on.
+
+        Vectors are copied into the layer buffers in place; a buffer is only
+        reallocated when the vector shape, dtype or device changes (e.g. a
+        smaller last batch of per-row vectors). Session layers without a vector
+        are not steered.
+
+        Args:
+            steering_vectors: Dictionary mapping layer indices to steering
+                              vectors, (hidden,) or (batch, hidden) per row.
+            magnitude: Multiplier for the steering vector strength.
+            pre_processed: If True, assumes vectors are already normalized,
+                           scaled, and on device (see
+                           SteeringManager.prepare_vectors).
+        """
+        unknown = sorted(set(steering_vectors) - set(self.layers))
+        if unknown:
+            raise ValueError(f"Layers {unknown} are not hooked by this session")
+        if not pre_processed:
+            steering_vectors = self.manager.prepare_vectors(
+                steering_vectors, self.layers, magnitude
+            )
+
+        self.clear()
+        for layer_idx, vector in steering_vectors.items():
+            buffer = self._buffers.get(layer_idx)
+            if (
+                buffer is None
+                or buffer.shape != vector.shape
+                or buffer.dtype != vector.dtype
+                or buffer.device != vector.device
+            ):
+                buffer = torch.empty_like(vector)
+                self._buffers[layer_idx] = buffer
+            buffer.copy_(vector)
+            self._active.add(layer_idx)
+            if vector.dim() == 2:
+                self.manager._row_steered_layers.add(layer_idx)
+
+    def clear(self) -> None:
+        """Stop steering without removing the hooks."""
+        self._active.clear()
+        self.manager._row_steered_layers.clear()
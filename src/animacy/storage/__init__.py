@@ -0,0 +1,8 @@
+"""
+Storage utilities shared by the experiment runners.
+"""
+
+from .fragments import FragmentSink
+from .manifest import CompletionManifest
+
+__all__ = ["CompletionManifest", "FragmentSink"]
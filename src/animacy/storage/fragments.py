@@ -0,0 +1,100 @@
+"""
+FragmentSink - Append-only table stored as a directory of Parquet fragments.
+
+    part-00000.parquet, part-00001.parquet, ...
+
+Each append writes one fragment to a temporary file and renames it into place,
+so a fragment is either fully present or absent after a crash. The fragments
+already on disk tell a restarted run which rows it can skip.
+"""
+
+import os
+from collections.abc import Sequence
+from pathlib import Path
+
+import pandas as pd
+
+
+class FragmentSink:
+    """
+    Directory of Parquet fragments that together form one table.
+    """
+
+    def __init__(self, root: str | Path):
+        """
+        Open (or create) a fragment directory.
+
+        Args:
+            root: Directory holding the fragments.
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._next_id = len(self.fragments())
+
+    def fragments(self) -> list[Path]:
+        """Committed fragments in write order."""
+        return sorted(self.root.glob("part-*.parquet"))
+
+    def append(self, rows: pd.DataFrame | list[dict]) -> Path | None:
+        """
+        Atomically write a batch of rows as a new fragment.
+
+        Args:
+            rows: Rows to write, as a DataFrame or list of records.
+
+        Returns:
+            Path of the new fragment, or None if there was nothing to write.
+        """
+        if not isinstance(rows, pd.DataFrame):
+            rows = pd.DataFrame(rows)
+        if rows.empty:
+            return None
+
+        # Another writer (or a crashed run's leftovers) may have taken the id
+        while (self.root / f"part-{self._next_id:05d}.parquet").exists():
+            self._next_id += 1
+
+        path = self.root / f"part-{self._next_id:05d}.parquet"
+        tmp_path = self.root / f".part-{self._next_id:05d}.parquet.tmp"
+        rows.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        self._next_id += 1
+        return path
+
+    def read(self, columns: Sequence[str] | None = None) -> pd.DataFrame:
+        """
+        Read all committed fragments as one DataFrame.
+
+        Args:
+            columns: Optional subset of columns to read.
+
+        Returns:
+            Concatenated rows in write order (empty if nothing was written).
+        """
+        fragments = [
+            pd.read_parquet(path, columns=list(columns) if columns else None)
+            for path in self.fragments()
+        ]
+        if not fragments:
+            return pd.DataFrame(columns=list(columns) if columns else None)
+        table = pd.concat(fragments, ignore_index=True)
+        # Missing strings (e.g. the no-role condition's role name) come back as
+        # NaN; keep them as None so keys compare equal to the original records
+        for column in table.columns:
+            if not pd.api.types.is_numeric_dtype(table[column]):
+                values = table[column].astype(object)
+                table[column] = values.where(values.notna(), None)
+        return table
+
+    def keys(self, columns: Sequence[str]) -> set[tuple]:
+        """
+        Key tuples of all committed rows.
+
+        Args:
+            columns: Columns that identify a row.
+
+        Returns:
+            Set of tuples of the given columns.
+        """
+        table = self.read(columns)
+        return set(zip(*(table[column].tolist() for column in columns), strict=True))
@@ -0,0 +1,115 @@
+"""
+CompletionManifest - Append-only record of completed work units.
+
+Each commit appends one line holding a JSON list of keys, written with a single
+write and fsync. A line that was cut short by a crash is ignored when loading
+and overwritten by the next commit, so a batch is either fully recorded or not
+at all.
+"""
+
+import json
+import os
+from collections.abc import Callable, Hashable, Iterable
+from pathlib import Path
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+def _to_key(value: Any) -> Hashable:
+    """Convert a JSON-decoded key back to a hashable tuple."""
+    if isinstance(value, list):
+        return tuple(_to_key(v) for v in value)
+    return value
+
+
+class CompletionManifest:
+    """
+    Set of completed keys persisted as an append-only JSONL file.
+
+    Keys are tuples of JSON scalars (e.g. (role_name, task_name, sample_idx,
+    condition, layer)). Membership checks are O(1).
+    """
+
+    def __init__(self, path: str | Path):
+        """
+        Open (or create) a manifest.
+
+        Args:
+            path: Path of the JSONL manifest file.
+        """
+        self.path = Path(path)
+        self._completed: set[Hashable] = set()
+        self._valid_bytes = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+
+        data = self.path.read_bytes()
+        # Anything after the last newline is a commit that never finished
+        self._valid_bytes = data.rfind(b"\n") + 1
+        for line in data[: self._valid_bytes].splitlines():
+            if line.strip():
+                self._completed.update(_to_key(key) for key in json.loads(line))
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._completed
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def __iter__(self):
+        return iter(self._completed)
+
+    def commit(self, keys: Iterable[tuple]) -> None:
+        """
+        Atomically record a batch of completed keys.
+
+        Args:
+            keys: Keys completed by the batch.
+        """
+        keys = [tuple(key) for key in keys]
+        if not keys:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = (json.dumps(keys) + "\n").encode("utf-8")
+        with open(self.path, "r+b" if self.path.exists() else "wb") as f:
+            f.truncate(self._valid_bytes)
+            f.seek(self._valid_bytes)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._valid_bytes += len(line)
+        self._completed.update(keys)
+
+    def remaining(
+        self,
+        items: Iterable[T],
+        layers: Iterable[int],
+        key_fn: Callable[[T, int], tuple],
+    ) -> dict[tuple[int, ...], list[T]]:
+        """
+        Plan the work left for a set of items.
+
+        Args:
+            items: Work items (e.g. response records).
+            layers: Layers each item should be processed for.
+            key_fn: Builds the manifest key for an (item, layer) pair.
+
+        Returns:
+            Items that still need work, grouped by the tuple of layers they are
+            missing, so each group can be handed to the extractor in one call.
+        """
+        layers = list(layers)
+        pending: dict[tuple[int, ...], list[T]] = {}
+        for item in items:
+            needed = tuple(
+                layer for layer in layers if key_fn(item, layer) not in self._completed
+            )
+            if needed:
+                pending.setdefault(needed, []).append(item)
+        return pending
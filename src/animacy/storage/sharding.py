@@ -0,0 +1,118 @@
+"""
+Hash sharding of work items and deterministic merging of shard outputs.
+
+Each shard writes its own FragmentSink under
+
+    root/shard-000-of-004/part-00000.parquet, ...
+
+so a shard checkpoints and resumes independently of the others. A single
+worker writes its fragments to root itself. Shard assignment hashes the item
+key with a fixed digest, so it does not depend on PYTHONHASHSEED, file order or
+which worker happens to run.
+
+Resuming and merging read root and every shard directory, whatever number of
+shards wrote them, so a run can resume with a different number of workers.
+"""
+
+import hashlib
+import json
+from collections.abc import Sequence
+from pathlib import Path
+
+import pandas as pd
+
+from .fragments import FragmentSink
+
+
+def shard_of(key: Sequence, num_shards: int) -> int:
+    """
+    Stable shard index of a key.
+
+    Args:
+        key: JSON-serializable key, e.g. (role_name, task_name, sample_idx)
+        num_shards: Total number of shards
+
+    Returns:
+        Shard index in [0, num_shards)
+    """
+    if num_shards < 1:
+        raise ValueError(f"num_shards must be positive, got {num_shards}")
+    digest = hashlib.blake2b(json.dumps(list(key)).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little") % num_shards
+
+
+def shard_root(root: str | Path, shard: int, num_shards: int) -> Path:
+    """
+    Directory of one shard's fragments.
+
+    Args:
+        root: Output directory shared by all shards
+        shard: Shard index
+        num_shards: Total number of shards
+
+    Returns:
+        Path of the shard's FragmentSink
+    """
+    return Path(root) / f"shard-{shard:03d}-of-{num_shards:03d}"
+
+
+def output_sinks(root: str | Path) -> list[FragmentSink]:
+    """
+    Fragment directories under root: root itself and every shard directory.
+
+    Args:
+        root: Output directory shared by all shards
+
+    Returns:
+        One FragmentSink per directory, root first, then shards in name order
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    shards = sorted(path for path in root.glob("shard-*-of-*") if path.is_dir())
+    return [FragmentSink(root), *(FragmentSink(path) for path in shards)]
+
+
+def completed_keys(root: str | Path, key_columns: Sequence[str]) -> set[tuple]:
+    """
+    Keys written under root by any number of workers.
+
+    Args:
+        root: Output directory shared by all shards
+        key_columns: Columns that identify a row
+
+    Returns:
+        Set of key tuples found in root or any shard directory
+    """
+    keys: set[tuple] = set()
+    for sink in output_sinks(root):
+        keys |= sink.keys(key_columns)
+    return keys
+
+
+def merge_shards(root: str | Path, key_columns: Sequence[str]) -> pd.DataFrame:
+    """
+    Merge the fragments under root (see output_sinks) into one table.
+
+    The result does not depend on how work was split or scheduled: rows are
+    de-duplicated by key (the last write wins, reading root before the shard
+    directories) and sorted by key, with null values first.
+
+    Args:
+        root: Output directory shared by all shards
+        key_columns: Columns that identify a row
+
+    Returns:
+        Merged table
+    """
+    key_columns = list(key_columns)
+    tables = [sink.read() for sink in output_sinks(root)]
+    tables = [table for table in tables if not table.empty]
+    if not tables:
+        return pd.DataFrame(columns=key_columns)
+
+    merged = pd.concat(tables, ignore_index=True)
+    merged = merged.drop_duplicates(subset=key_columns, keep="last")
+    return merged.sort_values(
+        key_columns, na_position="first", kind="stable", ignore_index=True
+    )
@@ -0,0 +1,159 @@
+import pandas as pd
+import torch
+from transformers import AutoTokenizer
+
+from animacy.activations import (
+    ActivationArchive,
+    ActivationResult,
+    extract_activation_summaries,
+)
+
+
+def make_result(tokenizer, texts, layers, hidden=8, seed=0, message_ranges=None):
+    tokenizer.padding_side = "left"
+    encodings = tokenizer(
+        texts,
+        return_tensors="pt",
+        padding=True,
+        return_offsets_mapping=True,
+        add_special_tokens=False,
+    )
+    generator = torch.Generator().manual_seed(seed)
+    batch, seq = encodings["input_ids"].shape
+    activations = {
+        layer: torch.randn(batch, seq, hidden, generator=generator) for layer in layers
+    }
+    return ActivationResult(
+        activations=activations,
+        input_ids=encodings["input_ids"],
+        offset_mapping=encodings["offset_mapping"],
+        tokenizer=tokenizer,
+        texts=texts,
+        message_ranges=message_ranges,
+        attention_mask=encodings["attention_mask"],
+    )
+
+
+def load_tokenizer():
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"Could not load tokenizer for {model_name}: {e}")
+        return None
+
+
+def test_archive_roundtrip_across_shards(tmp_path):
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        return
+
+    texts = [
+        "Hello there, how are you?",
+        "Hi",
+        "A somewhat longer sentence to archive.",
+    ]
+    result = make_result(tokenizer, texts, layers=[1, 3])
+    keys = [
+        {"role_name": "marine_biologist", "task_name": "poem", "sample_idx": i}
+        for i in range(len(texts))
+    ]
+
+    # Shards of 8 tokens force the texts into separate shards
+    archive = ActivationArchive(
+        tmp_path / "archive", layers=[1], dtype="float16", shard_bytes=8 * 8 * 2
+    )
+    archive.append(result, keys, condition="with_sys")
+
+    archive = ActivationArchive(tmp_path / "archive")
+    assert len(archive) == 3
+    assert archive.index["shard"].nunique() > 1
+
+    for text_index, key in enumerate(keys):
+        mask = result.attention_mask[text_index].bool()
+        expected = result.activations[1][text_index][mask].to(torch.float16)
+        stored = archive.read(
+            1, key["role_name"], "poem", key["sample_idx"], "with_sys"
+        )
+        assert stored.dtype == torch.float16
+        assert torch.equal(stored, expected)
+
+        span = archive.read(
+            1, key["role_name"], "poem", key["sample_idx"], "with_sys", 1, 3
+        )
+        assert torch.equal(span, expected[1:3])
+
+
+def test_rebuilt_result_matches_summaries(tmp_path):
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        return
+
+    messages = [
+        {"role": "system", "content": "You are a biologist."},
+        {"role": "user", "content": "What is life?"},
+        {"role": "assistant", "content": "Life is complex."},
+    ]
+    text = tokenizer.apply_chat_template(messages, tokenize=False)
+    ranges = []
+    for message in messages:
+        start = text.find(message["content"])
+        end = start + len(message["content"])
+        ranges.append({"role": message["role"], "start": start, "end": end})
+    result = make_result(
+        tokenizer, [text, "Short text."], layers=[2], message_ranges=[ranges, []]
+    )
+    result.activations[2] = result.activations[2].to(torch.bfloat16).float()
+
+    archive = ActivationArchive(tmp_path / "archive", layers=[2])
+    keys = [
+        {"role_name": "biologist", "task_name": "poem", "sample_idx": 0},
+        {"role_name": None, "task_name": "poem", "sample_idx": 1},
+    ]
+    archive.append(result, keys, condition="no_sys")
+
+    rebuilt = archive.to_activation_result(keys[:1], "no_sys", tokenizer)
+    rebuilt.activations[2] = rebuilt.activations[2].float()
+    expected = extract_activation_summaries(result, layer=2, role_name="biologist")
+    actual = extract_activation_summaries(rebuilt, layer=2, role_name="biologist")
+    assert expected.avg_response is not None
+    for name, value in expected.model_dump().items():
+        if value is None:
+            assert getattr(actual, name) is None
+        else:
+            assert torch.allclose(
+                torch.as_tensor(value), torch.as_tensor(getattr(actual, name))
+            )
+
+
+def test_appends_keep_write_position(tmp_path, monkeypatch):
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        return
+
+    texts = ["Hello there, how are you?", "Hi", "A somewhat longer sentence."]
+    result = make_result(tokenizer, texts, layers=[1])
+    archive = ActivationArchive(
+        tmp_path / "archive", layers=[1], dtype="float16", shard_bytes=8 * 8 * 2
+    )
+    key = {"role_name": "a", "task_name": "poem", "sample_idx": 0}
+    archive.append(result, [key], "x", [0])
+
+    # Reopen: the index is scanned once, then appends keep the position
+    archive = ActivationArchive(tmp_path / "archive")
+    reads = []
+    original = pd.read_parquet
+    monkeypatch.setattr(
+        pd, "read_parquet", lambda *a, **k: reads.append(a) or original(*a, **k)
+    )
+    for i in (1, 2):
+        key = {"role_name": "a", "task_name": "poem", "sample_idx": i}
+        archive.append(result, [key], "x", [i])
+    assert len(reads) == 1
+    monkeypatch.undo()
+
+    archive = ActivationArchive(tmp_path / "archive")
+    for i in range(3):
+        mask = result.attention_mask[i].bool()
+        expected = result.activations[1][i][mask].to(torch.float16)
+        assert torch.equal(archive.read(1, "a", "poem", i, "x"), expected)
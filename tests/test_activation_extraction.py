@@ -1,7 +1,13 @@
+import numpy as np
 import torch
 from transformers import AutoTokenizer
 
-from animacy.activations import ActivationResult, extract_activation_summaries
+from animacy.activations import (
+    SUMMARY_LOCATIONS,
+    ActivationResult,
+    extract_activation_summaries,
+    extract_activation_summaries_batch,
+)
 
 
 def test_extraction():
@@ -370,3 +376,139 @@ def test_extraction_role_not_found():
     assert summary.avg_response is not None
 
     print("Role Not Found Test Successful!")
+
+
+def test_char_range_lookup_matches_scan():
+    """Binary-search char range lookup should match a brute-force offset scan."""
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"Could not load tokenizer: {e}")
+        return
+
+    texts = [
+        "The quick brown fox jumps over the lazy dog. Ünïcödé 🌿 too.",
+        "<|im_start|>user\nShort<|im_end|>\n",
+    ]
+    encodings = tokenizer(
+        texts,
+        return_tensors="pt",
+        padding=True,
+        return_offsets_mapping=True,
+        add_special_tokens=False,
+    )
+    result = ActivationResult(
+        activations={},
+        input_ids=encodings["input_ids"],
+        offset_mapping=encodings["offset_mapping"],
+        tokenizer=tokenizer,
+        texts=texts,
+    )
+
+    def brute_force(text_index, start_char, end_char):
+        indices = []
+        for i, (tok_start, tok_end) in enumerate(result.offset_mapping[text_index]):
+            if tok_start == tok_end:
+                continue
+            if tok_start < end_char and tok_end > start_char:
+                indices.append(i)
+        return indices
+
+    for text_index, text in enumerate(texts):
+        for start_char in range(-1, len(text) + 2):
+            for end_char in range(start_char, len(text) + 3, 3):
+                assert result.get_token_indices_for_char_range(
+                    text_index, start_char, end_char
+                ) == brute_force(text_index, start_char, end_char)
+
+    # Special tokens are cached per text and excluded from content lookups
+    special_positions = result.get_special_token_positions(1)
+    assert 0 in special_positions
+    content = result.get_content_token_indices_for_char_range(1, 0, len(texts[1]))
+    assert content
+    assert not special_positions.intersection(content)
+
+
+def test_batched_summaries_match_single():
+    """Batched summary extraction should match per-(text, layer) extraction."""
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"Could not load tokenizer: {e}")
+        return
+
+    conversations = [
+        [
+            {"role": "system", "content": "You are a biologist."},
+            {"role": "user", "content": "What is life?"},
+            {"role": "assistant", "content": "Life is complex and full of wonder."},
+        ],
+        [
+            {"role": "user", "content": "Write a poem."},
+            {"role": "assistant", "content": "Roses are red."},
+        ],
+    ]
+    role_names = ["biologist", None]
+
+    texts = []
+    message_ranges = []
+    for messages in conversations:
+        full_text = tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=False
+        )
+        texts.append(full_text)
+        ranges = []
+        current_idx = 0
+        for msg in messages:
+            start = full_text.find(msg["content"], current_idx)
+            end = start + len(msg["content"])
+            ranges.append(
+                {
+                    "role": msg["role"],
+                    "start": start,
+                    "end": end,
+                    "content": msg["content"],
+                }
+            )
+            current_idx = end
+        message_ranges.append(ranges)
+
+    encodings = tokenizer(
+        texts,
+        return_tensors="pt",
+        padding=True,
+        return_offsets_mapping=True,
+        add_special_tokens=False,
+    )
+    seq_len = encodings["input_ids"].shape[1]
+    layers = [3, 7]
+    activations = {layer: torch.randn(2, seq_len, 16) for layer in layers}
+
+    result = ActivationResult(
+        activations=activations,
+        input_ids=encodings["input_ids"],
+        offset_mapping=encodings["offset_mapping"],
+        tokenizer=tokenizer,
+        texts=texts,
+        message_ranges=message_ranges,
+    )
+
+    batch = extract_activation_summaries_batch(result, role_names)
+
+    assert batch.summaries.shape == (2, 2, len(SUMMARY_LOCATIONS), 16)
+    assert batch.mask.shape == (2, len(SUMMARY_LOCATIONS))
+
+    for text_index, role_name in enumerate(role_names):
+        for layer in layers:
+            expected = extract_activation_summaries(
+                result, role_name=role_name, layer=layer, text_index=text_index
+            )
+            for location in SUMMARY_LOCATIONS:
+                expected_value = getattr(expected, location)
+                actual_value = batch.get(text_index, layer, location)
+                if expected_value is None:
+                    assert actual_value is None
+                else:
+                    assert np.allclose(expected_value, actual_value, atol=1e-5)
@@ -2,10 +2,16 @@
 Tests for the activations module.
 """
 
+import numpy as np
 import pytest
 import torch
 
-from animacy.activations import ActivationExtractor
+from animacy.activations import (
+    SUMMARY_LOCATIONS,
+    ActivationExtractor,
+    extract_activation_summaries,
+)
+from animacy.models.batching import plan_batches
 
 # Use a small model for testing
 TEST_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
@@ -232,3 +238,149 @@ def test_aggregation_methods(extractor):
     # If the span has multiple tokens, first and last should differ
     if mean_long is not None:
         assert not torch.equal(first_long, last_long)
+
+
+def test_micro_batching_matches_single_pass(extractor):
+    """Test that length-bucketed micro-batches reproduce a single padded pass."""
+    texts = [
+        "Short text",
+        "A considerably longer sentence that forces padding on the others",
+        "Medium length input here",
+        "x",
+    ]
+
+    single = extractor.extract(texts, layers=[2], batch_size=len(texts))
+    batched = extractor.extract(texts, layers=[2], batch_size=2, max_batch_tokens=16)
+
+    # Results come back in the original order with the same token layout
+    assert torch.equal(single.input_ids, batched.input_ids)
+    assert batched.activations[2].shape == single.activations[2].shape
+
+    valid = single.input_ids != extractor.tokenizer.pad_token_id
+    assert torch.allclose(
+        single.activations[2][valid], batched.activations[2][valid], atol=1e-4
+    )
+
+
+def test_plan_batches_respects_limits():
+    """Test that batch planning honours both row and token limits."""
+    lengths = [5, 1, 9, 3, 20]
+
+    batches = plan_batches(lengths, batch_size=2)
+    assert sorted(i for batch in batches for i in batch) == list(range(5))
+    assert all(len(batch) <= 2 for batch in batches)
+    # Longest first
+    assert batches[0][0] == 4
+
+    budgeted = plan_batches(lengths, batch_size=8, max_batch_tokens=10)
+    # The 20-token text exceeds the budget alone but still gets its own batch
+    assert [4] in budgeted
+    for batch in budgeted:
+        if len(batch) > 1:
+            assert max(lengths[i] for i in batch) * len(batch) <= 10
+
+
+def test_extract_summaries_matches_full_extraction(extractor):
+    """Test that on-device span pooling matches summaries of full activations."""
+    chat_histories = [
+        [
+            {"role": "system", "content": "You are a biologist."},
+            {"role": "user", "content": "What is life?"},
+            {"role": "assistant", "content": "Life is complex and full of wonder."},
+        ],
+        [
+            {"role": "user", "content": "Write a poem."},
+            {"role": "assistant", "content": "Roses are red."},
+        ],
+    ]
+    role_names = ["biologist", None]
+    layers = [1, 4]
+
+    full = extractor.extract(chat_histories, layers=layers)
+    pooled = extractor.extract_summaries(
+        chat_histories, role_names, layers=layers, batch_size=1
+    )
+
+    assert pooled.summaries.shape == (2, 2, len(SUMMARY_LOCATIONS), 896)
+    assert pooled.mask.shape == (2, len(SUMMARY_LOCATIONS))
+
+    for text_index, role_name in enumerate(role_names):
+        for layer in layers:
+            expected = extract_activation_summaries(
+                full, role_name=role_name, layer=layer, text_index=text_index
+            )
+            actual = pooled.to_summaries(text_index, layer)
+            for location in SUMMARY_LOCATIONS:
+                expected_value = getattr(expected, location)
+                actual_value = getattr(actual, location)
+                if expected_value is None:
+                    assert actual_value is None
+                else:
+                    assert np.allclose(expected_value, actual_value, atol=1e-4)
+
+    # No system prompt, so no role locations for the second text
+    assert pooled.get(1, 1, "at_role") is None
+    assert pooled.get(0, 1, "at_role") is not None
+
+
+def test_extract_summaries_in_half_precision():
+    """Test that pooling runs in the model dtype and returns float32 summaries."""
+    half_extractor = ActivationExtractor(
+        TEST_MODEL, device="cpu", torch_dtype=torch.bfloat16
+    )
+    chat_histories = [
+        [
+            {"role": "system", "content": "You are a biologist."},
+            {"role": "user", "content": "What is life?"},
+            {"role": "assistant", "content": "Life is complex and full of wonder."},
+        ]
+    ]
+    layer = 4
+
+    full = half_extractor.extract(chat_histories, layers=[layer])
+    pooled = half_extractor.extract_summaries(
+        chat_histories, ["biologist"], layers=[layer]
+    )
+
+    assert pooled.summaries.dtype == np.float32
+    expected = extract_activation_summaries(
+        full, role_name="biologist", layer=layer, text_index=0
+    )
+    actual = pooled.to_summaries(0, layer)
+    for location in SUMMARY_LOCATIONS:
+        expected_value = np.asarray(getattr(expected, location))
+        actual_value = np.asarray(getattr(actual, location))
+        error = np.linalg.norm(actual_value - expected_value)
+        assert error <= 1e-2 * np.linalg.norm(expected_value)
+
+
+def test_early_exit_skips_later_layers(extractor):
+    """Test that early exit stops after the deepest requested layer."""
+    text = "Stop the forward pass early."
+    calls = {"later_layer": 0, "head": 0}
+
+    def count(name):
+        def hook(module, input, output):
+            calls[name] += 1
+
+        return hook
+
+    handles = [
+        extractor._layers[4].register_forward_hook(count("later_layer")),
+        extractor.model.get_output_embeddings().register_forward_hook(count("head")),
+    ]
+    try:
+        early = extractor.extract(text, layers=[1, 3], early_exit=True)
+        assert calls == {"later_layer": 0, "head": 0}
+
+        full = extractor.extract(text, layers=[1, 3], early_exit=False)
+        assert calls == {"later_layer": 1, "head": 1}
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    for layer in (1, 3):
+        assert torch.allclose(early.activations[layer], full.activations[layer])
+
+    # Hooks are released after an early exit
+    assert not extractor._layers[3]._forward_hooks
@@ -0,0 +1,43 @@
+from animacy.storage import CompletionManifest
+
+
+def test_commit_and_reload(tmp_path):
+    path = tmp_path / "completed.jsonl"
+    manifest = CompletionManifest(path)
+    manifest.commit([("marine_biologist", "poem", 0, "with_sys", 3)])
+    manifest.commit([(None, "poem", 1, "with_sys", 3), ("a_b", "c", 2, "no_sys", 0)])
+
+    manifest = CompletionManifest(path)
+    assert len(manifest) == 3
+    assert ("marine_biologist", "poem", 0, "with_sys", 3) in manifest
+    assert (None, "poem", 1, "with_sys", 3) in manifest
+    assert ("marine_biologist", "poem", 0, "with_sys", 4) not in manifest
+
+
+def test_torn_commit_is_ignored(tmp_path):
+    path = tmp_path / "completed.jsonl"
+    manifest = CompletionManifest(path)
+    manifest.commit([("a", "poem", 0, "with_sys", 1)])
+
+    # Simulate a crash halfway through writing the next batch
+    with open(path, "ab") as f:
+        f.write(b'[["a", "poem", 1, "with_')
+
+    manifest = CompletionManifest(path)
+    assert len(manifest) == 1
+    manifest.commit([("a", "poem", 2, "with_sys", 1)])
+
+    manifest = CompletionManifest(path)
+    assert len(manifest) == 2
+    assert ("a", "poem", 2, "with_sys", 1) in manifest
+
+
+def test_remaining_groups_by_missing_layers(tmp_path):
+    manifest = CompletionManifest(tmp_path / "completed.jsonl")
+    manifest.commit([(0, 1), (0, 2), (1, 1)])
+
+    items = [0, 1, 2]
+    pending = manifest.remaining(
+        items, [1, 2], key_fn=lambda item, layer: (item, layer)
+    )
+    assert pending == {(2,): [1], (1, 2): [2]}
@@ -0,0 +1,30 @@
+from animacy.storage import FragmentSink
+
+
+def test_append_read_and_keys(tmp_path):
+    sink = FragmentSink(tmp_path / "out")
+    sink.append([{"role_name": None, "sample_idx": 0, "score": 1.5}])
+    sink.append([{"role_name": "robot", "sample_idx": 1, "score": 2.5}])
+    assert sink.append([]) is None
+
+    # A fragment that was never renamed into place is not part of the table
+    (sink.root / ".part-00002.parquet.tmp").write_bytes(b"partial")
+
+    sink = FragmentSink(tmp_path / "out")
+    table = sink.read()
+    assert table["role_name"].tolist() == [None, "robot"]
+    assert table["score"].tolist() == [1.5, 2.5]
+    assert sink.keys(["role_name", "sample_idx"]) == {(None, 0), ("robot", 1)}
+
+    sink.append([{"role_name": "angel", "sample_idx": 2, "score": 0.5}])
+    assert [path.name for path in sink.fragments()] == [
+        "part-00000.parquet",
+        "part-00001.parquet",
+        "part-00002.parquet",
+    ]
+
+
+def test_empty_sink(tmp_path):
+    sink = FragmentSink(tmp_path / "out")
+    assert sink.read(["role_name"]).empty
+    assert sink.keys(["role_name", "sample_idx"]) == set()
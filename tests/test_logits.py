@@ -0,0 +1,463 @@
+"""
+Tests for LogitExtractor scoring.
+"""
+
+import numpy as np
+import pytest
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from animacy.analysis import LogitExtractor
+from animacy.analysis import logits as logits_module
+from animacy.steering.evaluation import (
+    evaluate_steered_logits,
+    evaluate_steered_logits_sweep,
+)
+
+
+@pytest.fixture(scope="module")
+def model_and_tokenizer():
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.float32
+        )
+        return model, tokenizer
+    except Exception as e:
+        pytest.skip(f"Skipping due to model load error: {e}")
+
+
+SAMPLES = [
+    {
+        "role_name": "marine biologist",
+        "task_name": "meaning_of_life",
+        "sample_idx": 0,
+        "task_prompt": "What is the meaning of life?",
+        "response": "As a marine biologist, I think life is about the ocean.",
+    },
+    {
+        "role_name": "robot",
+        "task_name": "meaning_of_life",
+        "sample_idx": 1,
+        "task_prompt": "What is the meaning of life?",
+        "response": "Beep.",
+    },
+    {
+        "role_name": None,
+        "task_name": "meaning_of_life",
+        "sample_idx": 2,
+        "task_prompt": "What is the meaning of life?",
+        "response": "Just a plain response.",
+    },
+]
+
+
+def assert_logits_close(actual, expected, atol=1e-4):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected, strict=True):
+        assert a.role_name == e.role_name
+        assert a.first_100_response_text_len == e.first_100_response_text_len
+        assert a.average_log_probs == pytest.approx(e.average_log_probs, abs=atol)
+        for name in ("role_log_probs", "role_period_log_prob"):
+            if getattr(e, name) is None:
+                assert getattr(a, name) is None
+            else:
+                assert getattr(a, name) == pytest.approx(getattr(e, name), abs=atol)
+        assert a.first_100_response_log_probs == pytest.approx(
+            e.first_100_response_log_probs, abs=atol
+        )
+
+
+def test_scored_log_probs_match_log_softmax(model_and_tokenizer, monkeypatch):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer, score_chunk_size=3)
+    monkeypatch.setattr(LogitExtractor, "_split_head", property(lambda self: False))
+
+    logits = torch.randn(2, 11, 50)
+    input_ids = torch.randint(0, 50, (2, 11))
+    scored = torch.rand(2, 10) > 0.3
+    expected = (
+        torch.log_softmax(logits, dim=-1)[:, :-1]
+        .gather(2, input_ids[:, 1:].unsqueeze(2))
+        .squeeze(2)
+    )
+    actual = extractor._score_positions(logits, input_ids, scored)
+    assert torch.allclose(actual[scored], expected[scored], atol=1e-5)
+    assert torch.isnan(actual[~scored]).all()
+
+
+def test_distribution_stats_match_log_softmax(model_and_tokenizer, monkeypatch):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer, score_chunk_size=3, stats_top_k=5)
+    monkeypatch.setattr(LogitExtractor, "_split_head", property(lambda self: False))
+
+    logits = torch.randn(2, 11, 50)
+    input_ids = torch.randint(0, 50, (2, 11))
+    scored = torch.rand(2, 10) > 0.3
+    log_probs = torch.log_softmax(logits, dim=-1)[:, :-1]
+    targets = input_ids[:, 1:].unsqueeze(2)
+    target_log_probs = log_probs.gather(2, targets).squeeze(2)
+    entropy = -(log_probs.exp() * log_probs).sum(-1)
+    rank = (log_probs > log_probs.gather(2, targets)).sum(-1) + 1
+    top_k_log_mass = torch.logsumexp(log_probs.topk(5, dim=-1).values, dim=-1)
+
+    actual = extractor._score_positions(logits, input_ids, scored, with_stats=True)
+    for channel, expected in enumerate(
+        [target_log_probs, entropy, rank.float(), top_k_log_mass]
+    ):
+        assert torch.allclose(actual[..., channel][scored], expected[scored], atol=1e-5)
+    assert torch.isnan(actual[~scored]).all()
+
+    # The statistics do not change the log-probs
+    plain = extractor._score_positions(logits, input_ids, scored)
+    assert torch.equal(actual[..., 0][scored], plain[scored])
+
+
+def test_head_on_scored_positions_matches_full_logits(model_and_tokenizer, monkeypatch):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    assert extractor._split_head
+
+    actual = extractor.extract_logits_batch(SAMPLES)
+    monkeypatch.setattr(LogitExtractor, "_split_head", property(lambda self: False))
+    expected = extractor.extract_logits_batch(SAMPLES)
+    assert_logits_close(actual, expected)
+
+
+def test_score_chunk_size_does_not_change_results(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    reference = LogitExtractor(model, tokenizer, score_chunk_size=4096)
+    chunked = LogitExtractor(model, tokenizer, score_chunk_size=5)
+
+    expected = reference.extract_logits_batch(SAMPLES)
+    actual = chunked.extract_logits_batch(SAMPLES)
+    assert_logits_close(actual, expected)
+
+
+def test_prompt_boundaries_are_cached(model_and_tokenizer, monkeypatch):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    sample = {
+        "role_name": "robot",
+        "task_name": "meaning_of_life",
+        "sample_idx": 0,
+        # Role at the start of the prompt so it tokenizes the same in context
+        "system_prompt": "robot. You are one.",
+        "task_prompt": "What is the meaning of life?",
+        "response": "Beep boop.",
+    }
+
+    first = extractor.extract_logits_batch([sample])
+    renders = []
+    render = logits_module._render_prompt_boundaries
+    monkeypatch.setattr(
+        logits_module,
+        "_render_prompt_boundaries",
+        lambda *args: renders.append(args) or render(*args),
+    )
+    second = extractor.extract_logits_batch([{**sample, "sample_idx": 1}] * 3)
+    assert renders == []
+
+    assert first[0].role_log_probs is not None
+    assert first[0].role_period_log_prob is not None
+    assert second[0].role_log_probs == pytest.approx(first[0].role_log_probs, abs=1e-4)
+
+
+def test_shared_prefix_matches_full_batch(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    samples = [
+        {**SAMPLES[0], "sample_idx": i, "response": response}
+        for i, response in enumerate(
+            ["Life is the sea.", "The ocean, mostly, and the fish in it.", "Whales."]
+        )
+    ] + SAMPLES[1:]
+
+    expected = extractor.extract_logits_batch(samples)
+    actual = extractor.extract_logits_batch(samples, share_prefix=True)
+    assert_logits_close(actual, expected)
+
+
+def test_shared_prefix_matches_full_batch_with_steering(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    vectors = {1: torch.randn(model.config.hidden_size)}
+    samples = [{**SAMPLES[1], "sample_idx": i} for i in range(3)] + SAMPLES[2:]
+
+    expected = evaluate_steered_logits(
+        model, tokenizer, vectors, [1], 4.0, samples, batch_size=4
+    )
+    actual = evaluate_steered_logits(
+        model, tokenizer, vectors, [1], 4.0, samples, batch_size=4, share_prefix=True
+    )
+    assert_logits_close(actual, expected)
+
+
+def test_packed_matches_padded_batch(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    samples = SAMPLES + [
+        {**SAMPLES[0], "sample_idx": 3, "response": "The ocean. " * 30},
+        {**SAMPLES[1], "sample_idx": 4, "response": "Yes."},
+    ]
+
+    expected = extractor.extract_logits_batch(samples, return_stats=True)
+    for pack_length in (1, 120, 4096):
+        actual = extractor.extract_logits_batch(
+            samples, return_stats=True, pack_length=pack_length
+        )
+        assert_logits_close(actual, expected)
+        for a, e in zip(actual, expected, strict=True):
+            assert a.first_100_response_entropies == pytest.approx(
+                e.first_100_response_entropies, abs=1e-4
+            )
+
+    paired = extractor.extract_paired_logits_batch(samples, pack_length=4096)
+    assert_logits_close([r.with_system for r in paired], expected)
+
+    with pytest.raises(ValueError):
+        extractor.extract_logits_batch(samples, share_prefix=True, pack_length=64)
+
+
+def test_packed_matches_padded_batch_with_eager_attention():
+    try:
+        tokenizer = AutoTokenizer.from_pretrained("Qwen/Qwen2.5-0.5B-Instruct")
+        model = AutoModelForCausalLM.from_pretrained(
+            "Qwen/Qwen2.5-0.5B-Instruct",
+            torch_dtype=torch.float32,
+            attn_implementation="eager",
+        )
+    except Exception as e:
+        pytest.skip(f"Skipping due to model load error: {e}")
+    extractor = LogitExtractor(model, tokenizer)
+    samples = SAMPLES + [{**SAMPLES[0], "sample_idx": 3, "response": "Yes."}]
+
+    expected = extractor.extract_logits_batch(samples)
+    actual = extractor.extract_logits_batch(samples, pack_length=4096)
+    assert_logits_close(actual, expected)
+
+    model.config._attn_implementation = "flash_attention_2"
+    with pytest.raises(ValueError, match="attention"):
+        extractor.extract_logits_batch(samples, pack_length=4096)
+
+
+def test_packed_matches_padded_batch_with_steering(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    vectors = {1: torch.randn(model.config.hidden_size)}
+
+    expected = evaluate_steered_logits(
+        model, tokenizer, vectors, [1], 4.0, SAMPLES, batch_size=4
+    )
+    actual = evaluate_steered_logits(
+        model, tokenizer, vectors, [1], 4.0, SAMPLES, batch_size=4, pack_length=4096
+    )
+    assert_logits_close(actual, expected)
+
+
+def test_lower_stack_replay_matches_full_forward(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+
+    expected = extractor.extract_logits_batch(SAMPLES, return_stats=True)
+    for split_layer, offload in ((0, False), (5, True)):
+        assert extractor.supports_lower_stack_reuse(split_layer)
+        cache = extractor.encode_lower_stack(SAMPLES, split_layer, offload=offload)
+        if offload:
+            assert cache.hidden_states.device.type == "cpu"
+        actual = extractor.extract_logits_from_lower_stack(cache, return_stats=True)
+        assert_logits_close(actual, expected)
+        for a, e in zip(actual, expected, strict=True):
+            assert a.first_100_response_entropies == pytest.approx(
+                e.first_100_response_entropies, abs=1e-4
+            )
+
+    assert not extractor.supports_lower_stack_reuse(model.config.num_hidden_layers)
+
+
+def test_sweep_with_lower_stack_reuse_matches_full_forward(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    vectors = {4: torch.randn(model.config.hidden_size)}
+    magnitudes = [0.0, 4.0, 16.0]
+
+    reused = evaluate_steered_logits_sweep(
+        model, tokenizer, vectors, [4], magnitudes, SAMPLES, batch_size=3
+    )
+    replicated = evaluate_steered_logits_sweep(
+        model,
+        tokenizer,
+        vectors,
+        [4],
+        magnitudes,
+        SAMPLES,
+        batch_size=9,
+        reuse_lower_layers=False,
+    )
+    for magnitude in magnitudes:
+        expected = evaluate_steered_logits(
+            model, tokenizer, vectors, [4], magnitude, SAMPLES, batch_size=3
+        )
+        assert_logits_close(reused[magnitude], expected)
+        assert_logits_close(replicated[magnitude], expected)
+
+
+def test_plan_packs():
+    lengths = [5, 90, 40, 55, 10]
+    packs = LogitExtractor._plan_packs(lengths, 100)
+    assert sorted(i for pack in packs for i in pack) == [0, 1, 2, 3, 4]
+    assert all(sum(lengths[i] for i in pack) <= 100 for pack in packs)
+    assert len(packs) == 2
+
+
+def test_paired_deltas_stay_on_score_device():
+    input_ids = torch.tensor([[1, 2, 7, 8, 9], [3, 7, 8, 9, 0]])
+    locations = [{"response": slice(1, 4)}, {"response": slice(0, 3)}]
+    target_log_probs = torch.tensor([[0.0, -1.0, -2.0, -3.0], [-0.5, -1.5, -2.5, 0]])
+
+    deltas, mask = LogitExtractor._paired_deltas(
+        input_ids, locations, target_log_probs, 1
+    )
+    assert deltas.tolist() == [[-0.5, -0.5, -0.5]]
+    assert mask.tolist() == [[True, True, True]]
+
+    meta_deltas, meta_mask = LogitExtractor._paired_deltas(
+        input_ids, locations, target_log_probs.to("meta"), 1
+    )
+    assert meta_deltas.device.type == "meta"
+    assert meta_mask.device.type == "cpu"
+
+
+def test_find_subsequence_batch_matches_scan():
+    generator = torch.Generator().manual_seed(0)
+    sequences = torch.randint(0, 4, (64, 30), generator=generator)
+    limits = torch.randint(0, 31, (64,), generator=generator)
+
+    for length in (1, 2, 3):
+        subsequence = torch.randint(0, 4, (length,), generator=generator)
+        found = LogitExtractor._find_subsequence_batch(sequences, subsequence, limits)
+        for row in range(sequences.shape[0]):
+            expected = -1
+            sequence = sequences[row, : limits[row]].tolist()
+            for i in range(len(sequence) - length + 1):
+                if sequence[i : i + length] == subsequence.tolist():
+                    expected = i
+                    break
+            assert found[row].item() == expected
+
+
+def test_iter_batches_sorts_and_respects_budget(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    samples = [
+        {
+            **SAMPLES[i % len(SAMPLES)],
+            "sample_idx": i,
+            "response": "word " * (3 * i + 1),
+        }
+        for i in range(10)
+    ]
+    lengths = dict(
+        zip(
+            (s["sample_idx"] for s in samples),
+            extractor.sample_lengths(samples),
+            strict=True,
+        )
+    )
+
+    batches = list(
+        extractor.iter_batches(samples, batch_size=3, max_batch_tokens=200, pool_size=4)
+    )
+    assert sorted(s["sample_idx"] for batch in batches for s in batch) == list(
+        range(10)
+    )
+    for batch in batches:
+        batch_lengths = [lengths[s["sample_idx"]] for s in batch]
+        assert batch_lengths == sorted(batch_lengths, reverse=True)
+        assert len(batch) <= 3
+        assert len(batch) == 1 or batch_lengths[0] * len(batch) <= 200
+
+    # Estimated lengths track the real tokenized length
+    encodings = extractor._tokenize_prompts(
+        extractor._prepare_samples(samples, True)[0]
+    )
+    actual = encodings["attention_mask"].sum(dim=1).tolist()
+    assert all(abs(a - e) <= 2 for a, e in zip(actual, lengths.values(), strict=True))
+
+
+def test_return_trajectories(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    results = extractor.extract_logits_batch(SAMPLES, return_trajectories=True)
+
+    for sample, result in zip(SAMPLES, results, strict=True):
+        response_ids = tokenizer(sample["response"], add_special_tokens=False)[
+            "input_ids"
+        ]
+        assert result.response_token_ids.dtype == np.int32
+        assert result.response_token_ids.tolist()[: len(response_ids)] == response_ids
+        assert len(result.response_log_probs) == len(result.response_token_ids)
+        np.testing.assert_allclose(
+            result.response_log_probs[:100].astype(np.float32),
+            result.first_100_response_log_probs,
+            rtol=1e-3,
+            atol=1e-3,
+        )
+        assert "response_log_probs" not in result.model_dump()
+
+    plain = extractor.extract_logits_batch(SAMPLES)
+    assert all(r.response_log_probs is None for r in plain)
+
+
+def test_paired_matches_separate_conditions(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    paired = extractor.extract_paired_logits_batch(SAMPLES, return_trajectories=True)
+    with_sys = extractor.extract_logits_batch(SAMPLES, use_system_prompt=True)
+    no_sys = extractor.extract_logits_batch(SAMPLES, use_system_prompt=False)
+
+    assert_logits_close([r.with_system for r in paired], with_sys)
+    assert_logits_close([r.without_system for r in paired], no_sys)
+    for result, expected_with, expected_without in zip(
+        paired, with_sys, no_sys, strict=True
+    ):
+        expected_deltas = np.subtract(
+            expected_with.first_100_response_log_probs,
+            expected_without.first_100_response_log_probs,
+        )
+        np.testing.assert_allclose(
+            result.first_100_log_prob_deltas, expected_deltas, atol=1e-4
+        )
+        assert result.average_log_prob_delta == pytest.approx(
+            expected_with.average_log_probs - expected_without.average_log_probs,
+            abs=1e-4,
+        )
+        assert len(result.response_log_prob_deltas) == len(
+            result.with_system.response_token_ids
+        )
+
+    # Without a role both conditions are the same prompt
+    assert paired[-1].role_name is None
+    assert paired[-1].average_log_prob_delta == 0.0
+
+
+def test_return_stats(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    extractor = LogitExtractor(model, tokenizer)
+    plain = extractor.extract_logits_batch(SAMPLES)
+    with_stats = extractor.extract_logits_batch(SAMPLES, return_stats=True)
+    shared = extractor.extract_logits_batch(
+        SAMPLES, return_stats=True, share_prefix=True
+    )
+
+    assert_logits_close(with_stats, plain)
+    for result, shared_result in zip(with_stats, shared, strict=True):
+        length = len(result.first_100_response_log_probs)
+        assert len(result.first_100_response_entropies) == length
+        assert all(rank >= 1 for rank in result.first_100_response_target_ranks)
+        assert all(mass <= 1e-6 for mass in result.first_100_response_top_k_log_mass)
+        assert shared_result.first_100_response_target_ranks == (
+            result.first_100_response_target_ranks
+        )
+        assert shared_result.first_100_response_entropies == pytest.approx(
+            result.first_100_response_entropies, abs=1e-4
+        )
+    assert plain[0].first_100_response_entropies is None
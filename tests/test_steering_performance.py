@@ -3,14 +3,17 @@ Tests for steering performance and batching correctness.
 """
 
 import numpy as np
-import pandas as pd
 import pytest
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from animacy.analysis.logits import LogitExtractor
 from animacy.steering.core import SteeringManager
-from animacy.steering.evaluation import evaluate_steered_logits
+from animacy.steering.evaluation import (
+    evaluate_row_steered_logits,
+    evaluate_steered_logits,
+    evaluate_steered_logits_sweep,
+)
 
 
 def get_device():
@@ -31,6 +34,19 @@ def model_and_tokenizer():
         pytest.skip(f"Skipping due to model load error: {e}")
 
 
+@pytest.fixture(scope="module")
+def float32_model_and_tokenizer():
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.float32, trust_remote_code=True
+        ).to(get_device())
+        return model, tokenizer
+    except Exception as e:
+        pytest.skip(f"Skipping due to model load error: {e}")
+
+
 def test_batching_correctness(model_and_tokenizer):
     """
     Test that batch processing yields the same results as serial processing.
@@ -93,7 +109,7 @@ def test_batching_correctness(model_and_tokenizer):
     # Compare results
     assert len(results_serial) == len(results_batch) == 3
 
-    for r_serial, r_batch in zip(results_serial, results_batch):
+    for r_serial, r_batch in zip(results_serial, results_batch, strict=True):
         assert r_serial.sample_idx == r_batch.sample_idx
 
         # Check average log probs are close
@@ -111,10 +127,14 @@ def test_batching_correctness(model_and_tokenizer):
             assert r_batch.role_log_probs is None
 
         # Check first 100 tokens match
-        # This should be exact as it is text/ids
-        assert (
-            r_serial.first_100_response_log_probs
-            == r_batch.first_100_response_log_probs
+        # Padding changes kernel shapes, so values agree to float tolerance
+        assert len(r_serial.first_100_response_log_probs) == len(
+            r_batch.first_100_response_log_probs
+        )
+        assert np.allclose(
+            r_serial.first_100_response_log_probs,
+            r_batch.first_100_response_log_probs,
+            atol=1e-5,
         )
 
 
@@ -235,3 +255,190 @@ def test_batching_with_extreme_length_differences(model_and_tokenizer):
             f"batch={r_batch.average_log_probs}, "
             f"diff={abs(r_serial.average_log_probs - r_batch.average_log_probs)}"
         )
+
+
+def _row_steering_samples():
+    return [
+        {
+            "role_name": "assistant",
+            "task_name": "meaning_of_life",
+            "sample_idx": 0,
+            "response": "The meaning of life is 42.",
+        },
+        {
+            "role_name": "robot",
+            "task_name": "meaning_of_life",
+            "sample_idx": 1,
+            "response": "I am a robot. Beep boop.",
+        },
+        {
+            "role_name": None,
+            "task_name": "meaning_of_life",
+            "sample_idx": 2,
+            "response": "Life has no inherent meaning.",
+        },
+    ]
+
+
+def test_row_steering_matches_shared_vector(model_and_tokenizer):
+    """
+    Stacking the same vector for every row reproduces shared-vector steering.
+    """
+    model, tokenizer = model_and_tokenizer
+    hidden_size = model.config.hidden_size
+
+    torch.manual_seed(0)
+    vectors = {
+        6: torch.randn(hidden_size, device=model.device, dtype=model.dtype),
+        8: torch.randn(hidden_size, device=model.device, dtype=model.dtype),
+    }
+    samples = _row_steering_samples()
+
+    shared = evaluate_steered_logits(
+        model, tokenizer, vectors, [6, 8], 4.0, samples, batch_size=3
+    )
+    per_row = evaluate_row_steered_logits(
+        model,
+        tokenizer,
+        {"role": vectors},
+        [6, 8],
+        [{**s, "steering_vector": "role", "steering_magnitude": 4.0} for s in samples],
+        batch_size=3,
+    )
+
+    for r_shared, r_row in zip(shared, per_row, strict=True):
+        assert r_shared.average_log_probs == r_row.average_log_probs
+        assert (
+            r_shared.first_100_response_log_probs == r_row.first_100_response_log_probs
+        )
+
+
+def test_row_steering_mixed_batch_matches_per_role_loop(float32_model_and_tokenizer):
+    """
+    A batch mixing vectors, magnitudes and layer sets matches running each
+    (vector, magnitude) separately.
+    """
+    model, tokenizer = float32_model_and_tokenizer
+    hidden_size = model.config.hidden_size
+
+    torch.manual_seed(1)
+    steering_vectors = {
+        "a": {6: torch.randn(hidden_size, device=model.device, dtype=model.dtype)},
+        "b": {
+            6: torch.randn(hidden_size, device=model.device, dtype=model.dtype),
+            8: torch.randn(hidden_size, device=model.device, dtype=model.dtype),
+        },
+    }
+    runs = [("a", 2.0), ("b", 8.0), ("b", 0.0)]
+    samples = [
+        {**s, "steering_vector": name, "steering_magnitude": magnitude}
+        for s, (name, magnitude) in zip(_row_steering_samples(), runs, strict=True)
+    ]
+
+    mixed = evaluate_row_steered_logits(
+        model, tokenizer, steering_vectors, [6, 8], samples, batch_size=3
+    )
+
+    for sample, r_mixed in zip(samples, mixed, strict=True):
+        vectors = steering_vectors[sample["steering_vector"]]
+        [r_loop] = evaluate_steered_logits(
+            model,
+            tokenizer,
+            vectors,
+            sorted(vectors),
+            sample["steering_magnitude"],
+            [sample],
+        )
+        assert r_mixed.sample_idx == r_loop.sample_idx
+        # Only the padding shape differs from the loop
+        assert r_mixed.average_log_probs == pytest.approx(
+            r_loop.average_log_probs, abs=1e-5
+        )
+        np.testing.assert_allclose(
+            r_mixed.first_100_response_log_probs,
+            r_loop.first_100_response_log_probs,
+            rtol=0,
+            atol=1e-5,
+        )
+
+
+def test_row_steering_rejects_row_count_mismatch(model_and_tokenizer):
+    """
+    Per-row vectors must have one row per batch row.
+    """
+    model, tokenizer = model_and_tokenizer
+    hidden_size = model.config.hidden_size
+    manager = SteeringManager(model, tokenizer)
+    extractor = LogitExtractor(model, tokenizer)
+
+    row_vectors = {
+        6: torch.zeros(2, hidden_size, device=model.device, dtype=model.dtype)
+    }
+    with manager.apply_steering(row_vectors, [6], pre_processed=True):
+        with pytest.raises(ValueError, match="Per-row steering vectors"):
+            extractor.extract_logits_batch(
+                _row_steering_samples(), steering_manager=manager
+            )
+
+
+def test_row_steering_rejects_packing_and_shared_prefix(model_and_tokenizer):
+    """
+    Packing and prefix sharing regroup rows, so per-row vectors are refused.
+    """
+    model, tokenizer = model_and_tokenizer
+    hidden_size = model.config.hidden_size
+    manager = SteeringManager(model, tokenizer)
+    extractor = LogitExtractor(model, tokenizer)
+    samples = _row_steering_samples()
+
+    row_vectors = {
+        6: torch.zeros(
+            len(samples), hidden_size, device=model.device, dtype=model.dtype
+        )
+    }
+    with manager.apply_steering(row_vectors, [6], pre_processed=True):
+        for options in ({"pack_length": 4096}, {"share_prefix": True}):
+            with pytest.raises(ValueError, match="share_prefix or pack_length"):
+                extractor.extract_logits_batch(
+                    samples, steering_manager=manager, **options
+                )
+    assert not manager.steers_per_row
+
+    # A shared vector can still be packed
+    shared_vectors = {6: torch.zeros(hidden_size, device=model.device)}
+    with manager.apply_steering(shared_vectors, [6], pre_processed=True):
+        extractor.extract_logits_batch(
+            samples, steering_manager=manager, pack_length=4096
+        )
+
+
+def test_magnitude_sweep_matches_per_magnitude_calls(model_and_tokenizer):
+    """
+    A sweep tokenizes once and matches one evaluate_steered_logits call per
+    magnitude.
+    """
+    model, tokenizer = model_and_tokenizer
+    hidden_size = model.config.hidden_size
+
+    torch.manual_seed(2)
+    vectors = {6: torch.randn(hidden_size, device=model.device, dtype=model.dtype)}
+    samples = _row_steering_samples()
+    magnitudes = [0.0, 1.3, 8.0]
+
+    sweep = evaluate_steered_logits_sweep(
+        model, tokenizer, vectors, [6], magnitudes, samples, batch_size=9
+    )
+
+    assert list(sweep) == magnitudes
+    for magnitude in magnitudes:
+        expected = evaluate_steered_logits(
+            model, tokenizer, vectors, [6], magnitude, samples, batch_size=3
+        )
+        for r_sweep, r_single in zip(sweep[magnitude], expected, strict=True):
+            assert r_sweep.sample_idx == r_single.sample_idx
+            assert np.isclose(
+                r_sweep.average_log_probs, r_single.average_log_probs, atol=1e-2
+            )
+            assert r_sweep.role_log_probs == pytest.approx(
+                r_single.role_log_probs, abs=1e-2
+            )
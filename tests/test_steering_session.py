@@ -0,0 +1,150 @@
+"""
+Tests for SteeringSession.
+"""
+
+import pytest
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from animacy.steering.evaluation import (
+    evaluate_steered_logits,
+    evaluate_steered_logits_sweep,
+)
+from animacy.steering.session import SteeringSession
+
+
+@pytest.fixture(scope="module")
+def model_and_tokenizer():
+    model_name = "Qwen/Qwen2.5-0.5B-Instruct"
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.float32
+        )
+        return model, tokenizer
+    except Exception as e:
+        pytest.skip(f"Skipping due to model load error: {e}")
+
+
+SAMPLES = [
+    {
+        "role_name": "robot",
+        "task_name": "meaning_of_life",
+        "sample_idx": 0,
+        "task_prompt": "What is the meaning of life?",
+        "response": "Beep. Life is a sequence of instructions.",
+    },
+    {
+        "role_name": None,
+        "task_name": "meaning_of_life",
+        "sample_idx": 1,
+        "task_prompt": "What is the meaning of life?",
+        "response": "Just a plain response.",
+    },
+]
+
+
+def test_session_matches_fresh_steering(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    hidden_size = model.config.hidden_size
+    vectors = {3: torch.randn(hidden_size), 5: torch.randn(hidden_size)}
+
+    with SteeringSession(model, tokenizer, [3, 5]) as session:
+        layer = session.manager._layers[3]
+        num_hooks = len(layer._forward_hooks)
+        for magnitude in (2.0, 8.0):
+            expected = evaluate_steered_logits(
+                model, tokenizer, vectors, [3, 5], magnitude, SAMPLES, batch_size=2
+            )
+            actual = evaluate_steered_logits(
+                model,
+                tokenizer,
+                vectors,
+                [3, 5],
+                magnitude,
+                SAMPLES,
+                batch_size=2,
+                session=session,
+            )
+            for a, e in zip(actual, expected, strict=True):
+                assert a.average_log_probs == e.average_log_probs
+                assert a.first_100_response_log_probs == e.first_100_response_log_probs
+
+        # Hooks stay installed and buffers are reused across sweep points
+        assert len(layer._forward_hooks) == num_hooks
+        buffer = session._buffers[3]
+        session.set_vectors(vectors, magnitude=4.0)
+        assert session._buffers[3] is buffer
+        assert torch.norm(buffer).item() == pytest.approx(4.0, rel=1e-4)
+
+        sweep = evaluate_steered_logits_sweep(
+            model, tokenizer, vectors, [5], [2.0], SAMPLES, session=session
+        )
+        expected = evaluate_steered_logits(model, tokenizer, vectors, [5], 2.0, SAMPLES)
+        assert [r.average_log_probs for r in sweep[2.0]] == [
+            r.average_log_probs for r in expected
+        ]
+
+    assert len(layer._forward_hooks) == num_hooks - 1
+
+
+def test_cleared_session_does_not_steer(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    vectors = {3: torch.randn(model.config.hidden_size)}
+    inputs = tokenizer("Hello, world!", return_tensors="pt")
+
+    with torch.no_grad():
+        unsteered = model(**inputs).logits
+    with SteeringSession(model, tokenizer, [3]) as session:
+        session.set_vectors(vectors, magnitude=8.0)
+        with torch.no_grad():
+            steered = model(**inputs).logits
+        session.clear()
+        with torch.no_grad():
+            cleared = model(**inputs).logits
+
+        session.set_vectors(
+            {3: torch.zeros(1, vectors[3].shape[0])}, pre_processed=True
+        )
+        assert session.manager.steers_per_row
+        session.clear()
+        assert not session.manager.steers_per_row
+
+    assert not torch.equal(steered, unsteered)
+    assert torch.equal(cleared, unsteered)
+
+
+def test_session_validation(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    vectors = {3: torch.randn(model.config.hidden_size)}
+
+    with pytest.raises(ValueError, match="out of range"):
+        SteeringSession(model, tokenizer, [model.config.num_hidden_layers])
+
+    session = SteeringSession(model, tokenizer, [3])
+    with pytest.raises(ValueError, match="entered"):
+        evaluate_steered_logits(
+            model, tokenizer, vectors, [3], 1.0, SAMPLES, session=session
+        )
+    with session:
+        with pytest.raises(ValueError, match="not hooked"):
+            session.set_vectors({4: vectors[3]})
+        with pytest.raises(ValueError, match="not hooked"):
+            evaluate_steered_logits(
+                model, tokenizer, vectors, [3, 4], 1.0, SAMPLES, session=session
+            )
+
+
+def test_attention_mask_is_cast_once_per_batch(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    with SteeringSession(model, tokenizer, [3]) as session:
+        manager = session.manager
+        manager._current_attention_mask = torch.ones(2, 5, dtype=torch.long)
+        mask = manager._steering_mask(None, torch.float32)
+        assert mask.shape == (2, 5, 1) and mask.dtype == torch.float32
+        assert manager._steering_mask(None, torch.float32) is mask
+
+        manager._current_attention_mask = torch.ones(2, 5, dtype=torch.long)
+        assert manager._steering_mask(None, torch.float32) is not mask
+        manager._current_attention_mask = None
+        assert manager._steering_mask(None, torch.float32) is None
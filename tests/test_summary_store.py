@@ -0,0 +1,176 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from animacy.activations import (
+    SUMMARY_LOCATIONS,
+    ActivationSummaryBatch,
+    SummaryStore,
+    convert_json_summaries,
+)
+from animacy.activations.store import parse_summary_stem
+
+
+def make_batch(num_texts, layers, hidden=4, seed=0):
+    rng = np.random.default_rng(seed)
+    summaries = rng.normal(
+        size=(num_texts, len(layers), len(SUMMARY_LOCATIONS), hidden)
+    ).astype(np.float32)
+    mask = np.ones((num_texts, len(SUMMARY_LOCATIONS)), dtype=bool)
+    mask[0, SUMMARY_LOCATIONS.index("at_role")] = False
+    summaries[0, :, SUMMARY_LOCATIONS.index("at_role")] = 0.0
+    return ActivationSummaryBatch(summaries=summaries, mask=mask, layers=layers)
+
+
+def make_keys(num_texts, role_name="biologist", offset=0):
+    return [
+        {"role_name": role_name, "task_name": "poem", "sample_idx": offset + i}
+        for i in range(num_texts)
+    ]
+
+
+def test_append_and_read_roundtrip(tmp_path):
+    store = SummaryStore(tmp_path / "store")
+    first = make_batch(3, [2, 5], seed=0)
+    second = make_batch(2, [5], seed=1)
+    store.append(first, make_keys(3), condition="with_sys")
+    store.append(second, make_keys(2, offset=3), condition="with_sys")
+
+    # Reopening reads everything back from disk
+    store = SummaryStore(tmp_path / "store")
+    assert store.layers == [2, 5]
+    assert len(store) == 8
+    assert ("biologist", "poem", 4, "with_sys", 5) in store.completed()
+    assert ("biologist", "poem", 4, "with_sys", 2) not in store.completed()
+
+    vector = store.get(5, "avg_response", "biologist", "poem", 4, "with_sys")
+    np.testing.assert_array_equal(
+        vector, second.summaries[1, 0, SUMMARY_LOCATIONS.index("avg_response")]
+    )
+    assert store.get(2, "at_role", "biologist", "poem", 0, "with_sys") is None
+
+    keys, vectors = store.load(5, "avg_response", condition="with_sys")
+    assert list(keys["sample_idx"]) == [0, 1, 2, 3, 4]
+    assert isinstance(vectors, np.memmap)
+    expected = np.concatenate(
+        [first.summaries[:, 1, 2], second.summaries[:, 0, 2]], axis=0
+    )
+    np.testing.assert_array_equal(vectors, expected)
+
+    # Locations that were not found are dropped
+    keys, vectors = store.load(2, "at_role")
+    assert list(keys["sample_idx"]) == [1, 2]
+
+
+def test_uncommitted_rows_are_overwritten(tmp_path):
+    store = SummaryStore(tmp_path / "store")
+    store.append(make_batch(2, [0], seed=0), make_keys(2), condition="no_sys")
+
+    # Simulate an append that wrote vectors but crashed before the index commit
+    with open(store._vector_path(0, "avg_response"), "ab") as f:
+        f.write(np.ones((5, 4), dtype=np.float32).tobytes())
+
+    batch = make_batch(1, [0], seed=3)
+    store.append(batch, make_keys(1, offset=2), condition="no_sys")
+    assert store.vectors(0, "avg_response").shape == (3, 4)
+    np.testing.assert_array_equal(
+        store.get(0, "avg_response", "biologist", "poem", 2, "no_sys"),
+        batch.summaries[0, 0, 2],
+    )
+
+
+def test_append_does_not_rescan_index(tmp_path, monkeypatch):
+    store = SummaryStore(tmp_path / "store")
+    store.append(make_batch(2, [0, 1], seed=0), make_keys(2), condition="no_sys")
+
+    # Reopen: the index is scanned once, then appends keep the position
+    store = SummaryStore(tmp_path / "store")
+    reads = []
+    original = pd.read_parquet
+    monkeypatch.setattr(
+        pd, "read_parquet", lambda *a, **k: reads.append(a) or original(*a, **k)
+    )
+    for i in range(3):
+        batch = make_batch(1, [1], seed=i + 1)
+        store.append(batch, make_keys(1, offset=2 + i), condition="no_sys")
+    assert len(reads) == 1
+    monkeypatch.undo()
+
+    assert store.vectors(1, "avg_response").shape == (5, 4)
+    assert store.vectors(0, "avg_response").shape == (2, 4)
+    np.testing.assert_array_equal(
+        store.get(1, "avg_response", "biologist", "poem", 4, "no_sys"),
+        batch.summaries[0, 0, 2],
+    )
+    assert len(SummaryStore(tmp_path / "store")) == 7
+
+
+def test_convert_json_summaries(tmp_path):
+    summaries_dir = tmp_path / "summaries"
+    summaries_dir.mkdir()
+    batch = make_batch(2, [3], seed=0)
+    names = ["marine_biologist_life_story", "None_life_story"]
+    for text_index, prefix in enumerate(names):
+        summary = batch.to_summaries(text_index, 3)
+        path = summaries_dir / f"{prefix}_7_layer3.json"
+        path.write_text(summary.model_dump_json())
+
+    store = SummaryStore(tmp_path / "store")
+    converted = convert_json_summaries(
+        summaries_dir, store, condition="with_sys", task_names=["story", "life_story"]
+    )
+    assert converted == 2
+    assert store.completed() == {
+        ("marine_biologist", "life_story", 7, "with_sys", 3),
+        (None, "life_story", 7, "with_sys", 3),
+    }
+    np.testing.assert_allclose(
+        store.get(3, "avg_response", None, "life_story", 7, "with_sys"),
+        batch.summaries[1, 0, 2],
+    )
+    assert (
+        store.get(3, "at_role", "marine_biologist", "life_story", 7, "with_sys") is None
+    )
+
+    # Converting again skips what is already stored
+    assert (
+        convert_json_summaries(
+            summaries_dir, store, condition="with_sys", task_names=["life_story"]
+        )
+        == 0
+    )
+
+
+def test_convert_json_summaries_with_all_none_record(tmp_path):
+    summaries_dir = tmp_path / "summaries"
+    summaries_dir.mkdir()
+    empty = json.dumps({location: None for location in SUMMARY_LOCATIONS})
+    (summaries_dir / "None_story_0_layer3.json").write_text(empty)
+
+    # Nothing sizes the store yet, so the record waits for a later run
+    store = SummaryStore(tmp_path / "store")
+    assert convert_json_summaries(summaries_dir, store, "with_sys", ["story"]) == 0
+    assert store.completed() == set()
+
+    batch = make_batch(1, [3], seed=0)
+    summary = batch.to_summaries(0, 3)
+    (summaries_dir / "robot_story_1_layer3.json").write_text(summary.model_dump_json())
+    converted = convert_json_summaries(
+        summaries_dir, store, "with_sys", ["story"], chunk_size=1
+    )
+    assert converted == 2
+    assert store.get(3, "avg_response", None, "story", 0, "with_sys") is None
+    np.testing.assert_allclose(
+        store.get(3, "avg_response", "robot", "story", 1, "with_sys"),
+        batch.summaries[0, 0, SUMMARY_LOCATIONS.index("avg_response")],
+    )
+
+
+def test_parse_summary_stem():
+    assert parse_summary_stem("a_b_task_x_12_layer4", ["x", "task_x"]) == (
+        "a_b",
+        "task_x",
+        12,
+        4,
+    )
@@ -0,0 +1,55 @@
+"""
+Tests for the shared tokenizer artifact cache.
+"""
+
+import gc
+
+import pytest
+import torch
+from transformers import AutoTokenizer
+
+from animacy.models import tokenizer_cache
+from animacy.models.tokenizer_cache import get_tokenizer_artifacts
+
+
+def load_tokenizer():
+    try:
+        return AutoTokenizer.from_pretrained("Qwen/Qwen2.5-0.5B-Instruct")
+    except Exception as e:
+        pytest.skip(f"Skipping due to tokenizer load error: {e}")
+
+
+def test_artifacts_are_shared_and_match_tokenizer():
+    tokenizer = load_tokenizer()
+    artifacts = get_tokenizer_artifacts(tokenizer)
+    assert get_tokenizer_artifacts(tokenizer) is artifacts
+    assert artifacts.period_token_mask is artifacts.period_token_mask
+
+    vocab = tokenizer.get_vocab()
+    period_ids = sorted(i for token, i in vocab.items() if "." in token)
+    assert torch.nonzero(artifacts.period_token_mask).squeeze(1).tolist() == period_ids
+    assert artifacts.special_token_ids.tolist() == sorted(tokenizer.all_special_ids)
+    assert artifacts.assistant_role_name == "assistant"
+
+
+def test_entry_is_dropped_with_tokenizer():
+    tokenizer = load_tokenizer()
+    assert get_tokenizer_artifacts(tokenizer).period_token_mask.any()
+    assert tokenizer in tokenizer_cache._ARTIFACTS
+    count = len(tokenizer_cache._ARTIFACTS)
+
+    del tokenizer
+    gc.collect()
+    assert len(tokenizer_cache._ARTIFACTS) == count - 1
+
+
+def test_prompt_boundaries_are_bounded(monkeypatch):
+    tokenizer = load_tokenizer()
+    artifacts = get_tokenizer_artifacts(tokenizer)
+    monkeypatch.setattr(tokenizer_cache, "MAX_PROMPT_BOUNDARIES", 2)
+
+    assert artifacts.prompt_boundaries("a", lambda: 1) == 1
+    assert artifacts.prompt_boundaries("b", lambda: 2) == 2
+    assert artifacts.prompt_boundaries("a", lambda: -1) == 1
+    assert artifacts.prompt_boundaries("c", lambda: 3) == 3
+    assert list(artifacts._prompt_boundaries) == ["a", "c"]
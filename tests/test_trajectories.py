@@ -0,0 +1,49 @@
+import numpy as np
+
+from animacy.analysis import ResponseLogits, load_trajectories
+from animacy.analysis.trajectories import response_rows
+from animacy.storage import FragmentSink
+
+
+def make_result(role_name, sample_idx, length):
+    log_probs = -np.arange(length, dtype=np.float16) / 4
+    return ResponseLogits(
+        role_name=role_name,
+        task_name="poem",
+        sample_idx=sample_idx,
+        average_log_probs=float(log_probs.mean()) if length else 0.0,
+        first_100_response_log_probs=log_probs[:100].tolist(),
+        first_100_response_text_len=length,
+        response_token_ids=np.arange(length, dtype=np.int32) + sample_idx,
+        response_log_probs=log_probs,
+    )
+
+
+def test_trajectories_roundtrip(tmp_path):
+    sink = FragmentSink(tmp_path / "out")
+    first = [make_result("robot", 0, 150), make_result(None, 1, 0)]
+    second = [make_result("robot", 2, 3)]
+    sink.append(response_rows(first, "with_sys", trajectories=True))
+    sink.append(response_rows(second, "no_sys", trajectories=True))
+    # Fragments without trajectories are ignored
+    sink.append(response_rows([make_result("angel", 3, 5)], "with_sys"))
+
+    # Trajectories stay out of the scalar fields
+    assert "response_log_probs" not in first[0].model_dump()
+
+    trajectories = load_trajectories(tmp_path / "out")
+    assert trajectories.keys["role_name"].tolist() == ["robot", None, "robot"]
+    np.testing.assert_array_equal(trajectories.offsets, [0, 150, 150, 153])
+    assert trajectories.log_probs.dtype == np.float16
+    assert trajectories.token_ids.dtype == np.int32
+    for index, result in enumerate(first + second):
+        token_ids, log_probs = trajectories.get(index)
+        np.testing.assert_array_equal(token_ids, result.response_token_ids)
+        np.testing.assert_array_equal(log_probs, result.response_log_probs)
+
+    no_sys = load_trajectories(tmp_path / "out", condition="no_sys")
+    assert no_sys.keys["sample_idx"].tolist() == [2]
+    np.testing.assert_array_equal(no_sys.get(0)[0], second[0].response_token_ids)
+
+    no_role = load_trajectories(tmp_path / "out", role_name=None)
+    assert no_role.keys["sample_idx"].tolist() == [1]